@@ -0,0 +1 @@
+"""Бенчмарки производительности (детектор, парсеры и т.п.). Запускаются вручную."""
@@ -0,0 +1,285 @@
+"""
+Бенчмарк детектора на записанных кадрах стола.
+
+Зачем:
+- понять, ускорила или замедлила детекцию смена модели, imgsz, batch или числа потоков;
+- ловить регрессии до выкатки на киоск.
+
+Что делает:
+- прогоняет каталог кадров (jpg/png) или видеофайл через core.detector.Detector
+  для каждой комбинации backend × imgsz × batch;
+- каждая комбинация идёт в отдельном процессе, чтобы пиковый RSS был честным;
+- пишет p50/p95 латентности, FPS и пиковый RSS в JSON;
+- возвращает код 1, если превышен бюджет (абсолютные лимиты или регрессия к baseline).
+
+Работает на машине без GPU (--device cpu).
+
+Пример:
+    python -m bench.detector_bench --frames recordings/table_01 \\
+        --backend torch=yolov8n.pt --backend onnx=yolov8n.onnx \\
+        --imgsz 320,480,640 --batch 1,4 --device cpu --threads 4 \\
+        --out bench_results.json --budget bench_budget.json --baseline bench_prev.json
+
+Формат бюджета (все ключи необязательны):
+    {
+      "max_p95_ms": 250,          # абсолютный потолок p95 для всех конфигураций
+      "min_fps": 4,
+      "max_peak_rss_mb": 2500,
+      "max_regression": 0.10,     # допустимое ухудшение p95/FPS к baseline (10 %)
+      "configs": {"torch/640/1": {"max_p95_ms": 180}}   # переопределения по конфигурации
+    }
+"""
+
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import json
+import multiprocessing as mp
+import platform
+import resource
+import sys
+import time
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+def config_key(backend: str, imgsz: int, batch: int) -> str:
+    return f"{backend}/{imgsz}/{batch}"
+
+
+def load_frames(source: str | Path, limit: int = 0) -> list[np.ndarray]:
+    """
+    Загружает кадры из каталога изображений или из видеофайла.
+
+    Кадры держим в памяти заранее, чтобы чтение с диска не попадало в замер.
+    """
+    import cv2
+
+    source = Path(source)
+    frames: list[np.ndarray] = []
+    if source.is_dir():
+        for path in sorted(p for p in source.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES):
+            frame = cv2.imread(str(path), cv2.IMREAD_COLOR)
+            if frame is not None:
+                frames.append(frame)
+            if limit and len(frames) >= limit:
+                break
+    else:
+        cap = cv2.VideoCapture(str(source))
+        while True:
+            ok, frame = cap.read()
+            if not ok or frame is None:
+                break
+            frames.append(frame)
+            if limit and len(frames) >= limit:
+                break
+        cap.release()
+    if not frames:
+        raise ValueError(f"Не удалось загрузить кадры из {source}")
+    return frames
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss: Linux — КБ, macOS — байты.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def summarize(batch_latencies_sec: Iterable[float], frames_done: int, wall_sec: float) -> dict:
+    """
+    Сводка по замеру.
+
+    Латентность считаем на пакет (то, что ждёт вызывающий код),
+    FPS — по числу обработанных кадров за всё время прогона.
+    """
+    lat_ms = np.asarray(list(batch_latencies_sec), dtype=np.float64) * 1000.0
+    if lat_ms.size == 0:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "mean_ms": 0.0, "fps": 0.0, "frames": 0}
+    return {
+        "p50_ms": round(float(np.percentile(lat_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(lat_ms, 95)), 3),
+        "mean_ms": round(float(lat_ms.mean()), 3),
+        "fps": round(frames_done / wall_sec, 3) if wall_sec > 0 else 0.0,
+        "frames": int(frames_done),
+    }
+
+
+def run_batches(detector, frames: list[np.ndarray], batch_size: int, warmup: int = 3) -> dict:
+    """
+    Прогоняет кадры пакетами через detector.detect_batch и возвращает сводку.
+
+    warmup-пакеты не учитываем: первый вызов включает компиляцию/аллокации.
+    """
+    batch_size = max(1, int(batch_size))
+    batches = [frames[i:i + batch_size] for i in range(0, len(frames), batch_size)]
+    for batch in batches[:warmup]:
+        detector.detect_batch(batch)
+
+    latencies: list[float] = []
+    frames_done = 0
+    wall_start = time.perf_counter()
+    for batch in batches:
+        started = time.perf_counter()
+        detector.detect_batch(batch)
+        latencies.append(time.perf_counter() - started)
+        frames_done += len(batch)
+    wall_sec = time.perf_counter() - wall_start
+    return summarize(latencies, frames_done, wall_sec)
+
+
+def _run_config_in_child(
+    frames_source: str,
+    limit: int,
+    model_path: str,
+    imgsz: int,
+    batch_size: int,
+    device: str,
+    threads: int,
+    warmup: int,
+) -> dict:
+    """Одна конфигурация в чистом процессе: загрузка модели, кадров и замер."""
+    import torch
+
+    from core.detector import Detector
+
+    if threads > 0:
+        torch.set_num_threads(threads)
+    frames = load_frames(frames_source, limit=limit)
+    detector = Detector(model_path=model_path, device=device, imgsz=imgsz)
+    summary = run_batches(detector, frames, batch_size, warmup=warmup)
+    summary["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return summary
+
+
+def check_budget(results: dict, budget: dict, baseline: dict | None = None) -> list[str]:
+    """
+    Сверяет результаты с бюджетом. Возвращает список нарушений (пустой — всё в порядке).
+
+    results/baseline: {"configs": {key: {"p95_ms", "fps", "peak_rss_mb", ...}}}
+    """
+    violations: list[str] = []
+    overrides = budget.get("configs", {})
+    base_configs = (baseline or {}).get("configs", {})
+    for key, res in results.get("configs", {}).items():
+        limits = {**budget, **overrides.get(key, {})}
+        if "max_p95_ms" in limits and res["p95_ms"] > limits["max_p95_ms"]:
+            violations.append(f"{key}: p95 {res['p95_ms']} мс > {limits['max_p95_ms']} мс")
+        if "min_fps" in limits and res["fps"] < limits["min_fps"]:
+            violations.append(f"{key}: FPS {res['fps']} < {limits['min_fps']}")
+        if (
+            "max_peak_rss_mb" in limits
+            and res.get("peak_rss_mb") is not None
+            and res["peak_rss_mb"] > limits["max_peak_rss_mb"]
+        ):
+            violations.append(
+                f"{key}: peak RSS {res['peak_rss_mb']} МБ > {limits['max_peak_rss_mb']} МБ"
+            )
+
+        base = base_configs.get(key)
+        max_regression = limits.get("max_regression")
+        if base and max_regression is not None:
+            if base["p95_ms"] > 0 and res["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+                violations.append(
+                    f"{key}: p95 вырос {base['p95_ms']} -> {res['p95_ms']} мс "
+                    f"(допуск {max_regression:.0%})"
+                )
+            if base["fps"] > 0 and res["fps"] < base["fps"] * (1 - max_regression):
+                violations.append(
+                    f"{key}: FPS упал {base['fps']} -> {res['fps']} (допуск {max_regression:.0%})"
+                )
+    return violations
+
+
+def _parse_int_list(text: str) -> list[int]:
+    return [int(part) for part in text.split(",") if part.strip()]
+
+
+def _parse_backends(values: list[str]) -> dict[str, str]:
+    backends: dict[str, str] = {}
+    for value in values:
+        name, _, path = value.partition("=")
+        if not path:
+            name, path = Path(value).suffix.lstrip(".") or "torch", value
+        backends[name] = path
+    return backends
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк детектора на записанных кадрах.")
+    parser.add_argument("--frames", required=True, help="Каталог кадров или видеофайл.")
+    parser.add_argument("--limit", type=int, default=200, help="Максимум кадров (0 — все).")
+    parser.add_argument(
+        "--backend",
+        action="append",
+        default=[],
+        help="name=path к модели (torch=yolov8n.pt, onnx=yolov8n.onnx). Можно несколько.",
+    )
+    parser.add_argument("--imgsz", default="640", help="Размеры входа через запятую.")
+    parser.add_argument("--batch", default="1", help="Размеры пакета через запятую.")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--threads", type=int, default=0, help="torch.set_num_threads (0 — по умолчанию).")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--budget", help="JSON с бюджетом производительности.")
+    parser.add_argument("--baseline", help="JSON прошлых результатов для контроля регрессий.")
+    args = parser.parse_args(argv)
+
+    backends = _parse_backends(args.backend or ["torch=yolov8n.pt"])
+    results: dict = {
+        "meta": {
+            "created_at": time.time(),
+            "frames": str(args.frames),
+            "device": args.device,
+            "threads": args.threads,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "configs": {},
+    }
+
+    ctx = mp.get_context("spawn")
+    for backend, model_path in backends.items():
+        for imgsz in _parse_int_list(args.imgsz):
+            for batch_size in _parse_int_list(args.batch):
+                key = config_key(backend, imgsz, batch_size)
+                with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                    summary = pool.submit(
+                        _run_config_in_child,
+                        str(args.frames),
+                        args.limit,
+                        model_path,
+                        imgsz,
+                        batch_size,
+                        args.device,
+                        args.threads,
+                        args.warmup,
+                    ).result()
+                summary.update({"backend": backend, "model": model_path, "imgsz": imgsz, "batch": batch_size})
+                results["configs"][key] = summary
+                print(
+                    f"[bench] {key}: p50={summary['p50_ms']} мс p95={summary['p95_ms']} мс "
+                    f"fps={summary['fps']} rss={summary['peak_rss_mb']} МБ"
+                )
+
+    Path(args.out).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"[bench] Результаты: {args.out}")
+
+    if not args.budget:
+        return 0
+    budget = json.loads(Path(args.budget).read_text(encoding="utf-8"))
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8")) if args.baseline else None
+    violations = check_budget(results, budget, baseline)
+    for violation in violations:
+        print(f"[bench] БЮДЖЕТ ПРЕВЫШЕН: {violation}")
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Бенчмарк replay pack_events -> pack_sessions на синтетическом годе работы.
+
+Создаёт временную БД: --days дней × --sessions-per-day сессий, у каждой
+START, шаги LAYOUT, PHASE_CHANGED, шаги PACKING, BOX_CLOSED, PRINT_LABEL,
+TABLE_EMPTY. Затем меряет полный replay и incremental replay от чекпоинта.
+
+Пример:
+    python -m bench.pack_replay_bench --days 365 --sessions-per-day 300
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from core import storage
+from services import pack_replay, packaging
+
+
+def fill_db(days: int, sessions_per_day: int, steps: int = 3) -> int:
+    """Пишет синтетические сессии и события. Возвращает число событий."""
+    sessions, events = [], []
+    ts = time.time() - days * 86400
+    session_id = 0
+    for _ in range(days * sessions_per_day):
+        session_id += 1
+        start = ts
+        kinds = (
+            [packaging.EVENT_START]
+            + [packaging.EVENT_STEP_COMPLETED] * steps
+            + [packaging.EVENT_PHASE_CHANGED]
+            + [packaging.EVENT_STEP_COMPLETED] * steps
+            + [packaging.EVENT_CLOSE_BOX, packaging.EVENT_PRINT_LABEL, packaging.EVENT_TABLE_EMPTY]
+        )
+        for kind in kinds:
+            events.append((ts, kind, "", session_id, "SKU-1", "default"))
+            ts += 5.0
+        sessions.append(
+            (session_id, "SKU-1", start, ts - 5.0, packaging.STATE_TABLE_EMPTY,
+             packaging.PHASE_PACKING, steps, steps, "default")
+        )
+    with storage.transaction() as conn:
+        conn.executemany(
+            """INSERT INTO pack_sessions(
+                   id, sku, start_time, end_time, state, phase,
+                   current_step_index, total_steps, station_id
+               )
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            sessions,
+        )
+        conn.executemany(
+            """INSERT INTO pack_events(ts, type, payload_json, session_id, sku, station_id)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            events,
+        )
+    return len(events)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--sessions-per-day", type=int, default=300)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DB = Path(tmp) / "replay_bench.db"
+        storage.init_db()
+        total_events = fill_db(args.days, args.sessions_per_day)
+        full = pack_replay.rebuild(full=True)
+        incremental = pack_replay.rebuild()
+    result = {
+        "events": total_events,
+        "full_sec": full["elapsed_sec"],
+        "events_per_sec": round(total_events / max(full["elapsed_sec"], 1e-9)),
+        "incremental_sec": incremental["elapsed_sec"],
+        "mismatches": full["mismatches"],
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 1 if full["mismatches"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,75 @@
+"""
+Бенчмарк разбора кодов кроватей (core.beds_catalog) в поисках в секунду.
+
+Меряет три случая:
+- cold — каждый код новый (кэш разбора сброшен): чистая скорость грамматики;
+- warm — повторные сканы одних и тех же кодов фабрики (попадания в кэш разбора);
+- get_bed_info — полный путь движка киоска для кодов вне файла фабрики.
+
+Пример:
+    python -m bench.sku_parse_bench --codes 100000 --repeat 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+from core import beds_catalog
+
+MODELS = ("001", "002", "003", "004", "005")
+WIDTHS = ("09", "12", "14", "16", "18", "20")
+FABRICS = ("VelutaLux", "Nova", "Monolith")
+
+
+def make_codes(total: int) -> list[str]:
+    """total разных кодов вида MM.Кровать.<серия>-<ширина>-<ткань>.<цвет>."""
+    codes = []
+    for index in range(total):
+        model = MODELS[index % len(MODELS)]
+        width = WIDTHS[index // len(MODELS) % len(WIDTHS)]
+        fabric = FABRICS[index % len(FABRICS)]
+        codes.append(f"MM.Кровать.{model}-{width}-{fabric}.{index:05d}")
+    return codes
+
+
+def lookups_per_sec(fn, codes: list[str], repeat: int, clear_cache: bool = False) -> float:
+    """Лучший из repeat прогонов fn по всем codes (поисков в секунду)."""
+    best = float("inf")
+    for _ in range(repeat):
+        if clear_cache:
+            beds_catalog.parse_sku.cache_clear()
+        started = time.perf_counter()
+        for code in codes:
+            fn(code)
+        best = min(best, time.perf_counter() - started)
+    return round(len(codes) / max(best, 1e-9))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--codes", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    codes = make_codes(args.codes)
+    factory_codes = list(beds_catalog.BEDS) or codes[: beds_catalog.PARSE_CACHE_SIZE]
+    # Повторные сканы: коды фабрики по кругу, столько же поисков, сколько в cold.
+    scans = [factory_codes[i % len(factory_codes)] for i in range(args.codes)]
+
+    result = {
+        "codes": args.codes,
+        "cold_parse_per_sec": lookups_per_sec(beds_catalog.parse_sku, codes, args.repeat, clear_cache=True),
+        "warm_parse_per_sec": lookups_per_sec(beds_catalog.parse_sku, scans, args.repeat),
+        "get_bed_info_per_sec": lookups_per_sec(
+            beds_catalog.get_bed_info, codes, args.repeat, clear_cache=True
+        ),
+        "unparsed": sum(beds_catalog.parse_sku(code) is None for code in codes),
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 1 if result["unparsed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
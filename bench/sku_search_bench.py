@@ -0,0 +1,100 @@
+"""
+Бенчмарк поиска по каталогу SKU (FTS5) на синтетическом каталоге.
+
+Создаёт временную БД с --skus позициями вида MM.Кровать.<модель>-<ширина>-VelutaLux.<цвет>,
+затем меряет задержку list_sku_catalog для типичных запросов оператора
+(префиксы кода, модели, названия) с размером страницы как у UI.
+
+Пример:
+    python -m bench.sku_search_bench --skus 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from core import storage
+
+QUERIES = ("кров", "кровать 160", "003-16", "velutalux 04", "mm", "серый")
+MODELS = ("001-12", "002-14", "003-16", "004-18", "005-20")
+WIDTHS = (90, 120, 140, 160, 180, 200)
+COLORS = ("серый", "бежевый", "графит", "синий", "зелёный")
+
+
+def fill_db(total: int) -> None:
+    """Пишет total позиций каталога одной транзакцией (индекс заполняют триггеры)."""
+    ts = int(time.time())
+    rows = []
+    for index in range(total):
+        model = MODELS[index % len(MODELS)]
+        width = WIDTHS[index // len(MODELS) % len(WIDTHS)]
+        color = index % 40
+        rows.append(
+            (
+                f"MM.Кровать.{model}-{width}-VelutaLux.{color:02d}.{index}",
+                f"Кровать {model} {width} {COLORS[color % len(COLORS)]}",
+                model,
+                width,
+                "VL",
+                f"{color:02d}",
+                1,
+                ts,
+                ts,
+            )
+        )
+    with storage.transaction() as conn:
+        conn.executemany(
+            """INSERT INTO sku_catalog(
+                   sku_code, name, model_code, width_cm, fabric_code, color_code,
+                   is_active, created_at, updated_at
+               )
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            rows,
+        )
+
+
+def measure(query: str, repeat: int, limit: int) -> dict:
+    timings = []
+    found = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        found = len(storage.list_sku_catalog(search=query, include_inactive=True, limit=limit))
+        timings.append(time.perf_counter() - started)
+    return {
+        "query": query,
+        "rows": found,
+        "median_ms": round(statistics.median(timings) * 1000, 2),
+        "max_ms": round(max(timings) * 1000, 2),
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--skus", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=200, help="размер страницы (как в UI)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DB = Path(tmp) / "sku_search_bench.db"
+        storage.init_db()
+        started = time.perf_counter()
+        fill_db(args.skus)
+        fill_sec = time.perf_counter() - started
+        results = [measure(query, args.repeat, args.limit) for query in QUERIES]
+    result = {
+        "skus": args.skus,
+        "fill_sec": round(fill_sec, 3),
+        "queries": results,
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
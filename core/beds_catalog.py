@@ -1,4 +1,22 @@
+"""
+Описание кроватей по коду из 1С.
+
+Код разбирается грамматикой, а не ищется в списке, заполненном руками:
+    <бренд>.<изделие>.<серия>-<ширина>-<ткань>.<цвет>
+    MM.Кровать.001-12-VelutaLux.07 -> модель 001-12, ширина 120 см, цвет 07
+
+- parse_sku() — разбор одного кода; результат запоминается (LRU), повторный
+  скан того же кода не гоняет регулярное выражение;
+- список кодов фабрики — текстовый файл (beds_codes.txt или KZ_BEDS_CODES),
+  load_bed_codes() строит по нему BEDS без правки Python;
+- get_bed_info() понимает и коды, которых нет в файле, если они подходят под грамматику.
+"""
+
+import functools
+import os
+import re
 from dataclasses import dataclass
+from pathlib import Path
 from typing import Dict, Optional
 
 
@@ -9,75 +27,98 @@ class BedInfo:
     details: str   # строка под заголовком (bed_details)
 
 
-BEDS: Dict[str, BedInfo] = {}
-
-
-def _add(sku: str, model_code: str, width_code: str, color_code: str) -> None:
+@dataclass(frozen=True)
+class ParsedSku:
+    sku: str
+    kind: str        # 'Кровать'
+    model_code: str  # '001-12' (серия и ширина, как в 1С)
+    width_cm: int    # 120
+    fabric: str      # 'VelutaLux'
+    color_code: str  # '07'
+
+
+SKU_GRAMMAR = re.compile(
+    r"""
+    ^(?P<brand>[^.\s]+)\.
+    (?P<kind>[^.\s]+)\.
+    (?P<series>\d+)-(?P<width>\d{2,3})-
+    (?P<fabric>[^.\s]+)\.
+    (?P<color>[^.\s]+)$
+    """,
+    re.VERBOSE,
+)
+PARSE_CACHE_SIZE = 4096
+DEFAULT_CODES_PATH = Path(__file__).with_name("beds_codes.txt")
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_sku(sku: str) -> Optional[ParsedSku]:
+    """Разбирает код по грамматике; None — код не кровать (или формат другой)."""
+    match = SKU_GRAMMAR.match(sku)
+    if not match:
+        return None
+    width_code = match["width"]
+    # Две цифры — десятки сантиметров (12 -> 120), три — уже сантиметры.
+    width_cm = int(width_code) * 10 if len(width_code) == 2 else int(width_code)
+    return ParsedSku(
+        sku=sku,
+        kind=match["kind"],
+        model_code=f"{match['series']}-{width_code}",
+        width_cm=width_cm,
+        fabric=match["fabric"],
+        color_code=match["color"],
+    )
+
+
+def bed_info_from_code(sku: str) -> Optional[BedInfo]:
+    parsed = parse_sku(sku)
+    if parsed is None:
+        return None
+    return BedInfo(
+        sku=sku,
+        title=f"{parsed.kind} {parsed.fabric} {parsed.model_code}",
+        details=f"Модель {parsed.model_code} | Ширина {parsed.width_cm} см | Цвет {parsed.color_code}",
+    )
+
+
+def load_bed_codes(path: str | Path) -> tuple[Dict[str, BedInfo], list[str]]:
     """
-    sku        – полный код из 1С, например 'MM.Кровать.001-12-VelutaLux.07'
-    model_code – '001-12', '003-16' и т.п.
-    width_code – '12', '14', '16' (десятки сантиметров)
-    color_code – '07', '20', '23', '26', '32'
+    Читает файл кодов фабрики (по одному в строке, # — комментарий).
+
+    Возвращает (sku -> BedInfo, коды, которые не подошли под грамматику).
     """
-    # ширину считаем в сантиметрах: 12 -> 120, 14 -> 140, 16 -> 160
+    beds: Dict[str, BedInfo] = {}
+    unparsed: list[str] = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        code = line.split("#", 1)[0].strip()
+        if not code:
+            continue
+        info = bed_info_from_code(code)
+        if info is None:
+            unparsed.append(code)
+        else:
+            beds[code] = info
+    return beds, unparsed
+
+
+def _load_default_beds() -> Dict[str, BedInfo]:
+    path = os.getenv("KZ_BEDS_CODES", str(DEFAULT_CODES_PATH))
     try:
-        width_cm = int(width_code) * 10
-    except ValueError:
-        width_cm = 0
-
-    title = f"Кровать VelutaLux {model_code}"
-    if width_cm > 0:
-        details = f"Модель {model_code} | Ширина {width_cm} см | Цвет {color_code}"
-    else:
-        details = f"Модель {model_code} | Цвет {color_code}"
-
-    BEDS[sku] = BedInfo(sku=sku, title=title, details=details)
-
-
-# ── 001-12 ────────────────────────────────────────────────────────────────
-_add("MM.Кровать.001-12-VelutaLux.07", "001-12", "12", "07")
-_add("MM.Кровать.001-12-VelutaLux.20", "001-12", "12", "20")
-_add("MM.Кровать.001-12-VelutaLux.23", "001-12", "12", "23")
-_add("MM.Кровать.001-12-VelutaLux.26", "001-12", "12", "26")
-_add("MM.Кровать.001-12-VelutaLux.32", "001-12", "12", "32")
-
-# ── 001-14 ────────────────────────────────────────────────────────────────
-_add("MM.Кровать.001-14-VelutaLux.07", "001-14", "14", "07")
-_add("MM.Кровать.001-14-VelutaLux.20", "001-14", "14", "20")
-_add("MM.Кровать.001-14-VelutaLux.23", "001-14", "14", "23")
-_add("MM.Кровать.001-14-VelutaLux.26", "001-14", "14", "26")
-_add("MM.Кровать.001-14-VelutaLux.32", "001-14", "14", "32")
-
-# ── 001-16 ────────────────────────────────────────────────────────────────
-_add("MM.Кровать.001-16-VelutaLux.07", "001-16", "16", "07")
-_add("MM.Кровать.001-16-VelutaLux.20", "001-16", "16", "20")
-_add("MM.Кровать.001-16-VelutaLux.23", "001-16", "16", "23")
-_add("MM.Кровать.001-16-VelutaLux.26", "001-16", "16", "26")
-_add("MM.Кровать.001-16-VelutaLux.32", "001-16", "16", "32")
-
-# ── 003-12 ────────────────────────────────────────────────────────────────
-_add("MM.Кровать.003-12-VelutaLux.07", "003-12", "12", "07")
-_add("MM.Кровать.003-12-VelutaLux.32", "003-12", "12", "32")
-# если у 003-12 есть ещё цвета (.20/.23/.26) — допиши их по образцу
-
-# ── 003-14 ────────────────────────────────────────────────────────────────
-_add("MM.Кровать.003-14-VelutaLux.07", "003-14", "14", "07")
-_add("MM.Кровать.003-14-VelutaLux.20", "003-14", "14", "20")
-_add("MM.Кровать.003-14-VelutaLux.23", "003-14", "14", "23")
-_add("MM.Кровать.003-14-VelutaLux.26", "003-14", "14", "26")
-_add("MM.Кровать.003-14-VelutaLux.32", "003-14", "14", "32")
-
-# ── 003-16 ────────────────────────────────────────────────────────────────
-_add("MM.Кровать.003-16-VelutaLux.07", "003-16", "16", "07")
-_add("MM.Кровать.003-16-VelutaLux.20", "003-16", "16", "20")
-_add("MM.Кровать.003-16-VelutaLux.23", "003-16", "16", "23")
-_add("MM.Кровать.003-16-VelutaLux.26", "003-16", "16", "26")
-_add("MM.Кровать.003-16-VelutaLux.32", "003-16", "16", "32")
+        beds, unparsed = load_bed_codes(path)
+    except OSError:
+        print(f"[BEDS] Файл кодов не найден: {path}")
+        return {}
+    if unparsed:
+        print(f"[BEDS] Коды не разобраны ({len(unparsed)}): {', '.join(unparsed[:5])}")
+    return beds
+
+
+BEDS: Dict[str, BedInfo] = _load_default_beds()
 
 
 def get_bed_info(sku: str) -> Optional[BedInfo]:
     """
     Вернуть информацию по кровати по её полному коду из 1С.
-    Если такой записи нет в каталоге — вернуть None.
+    Код из файла фабрики или любой код, подходящий под грамматику; иначе None.
     """
-    return BEDS.get(sku)
+    return BEDS.get(sku) or bed_info_from_code(sku)
@@ -0,0 +1,72 @@
+"""
+Источник кадров камеры.
+
+Держит фоновый поток, который читает поток (RTSP / MJPEG / файл) через OpenCV
+и хранит только последний кадр. Потребители (детектор, проверки стола)
+всегда берут самый свежий кадр и не копят очередь.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+class FrameSource:
+    """
+    Последний кадр камеры с номером и временем получения.
+
+    Почему отдельный поток:
+    - cv2.VideoCapture.read() блокирующий;
+    - если читать кадры "по требованию", буфер потока растёт и мы видим прошлое.
+    """
+
+    def __init__(self, url: str, reconnect_delay_sec: float = 2.0) -> None:
+        self.url = url
+        self.reconnect_delay_sec = reconnect_delay_sec
+        self._lock = threading.Lock()
+        self._frame: Optional[np.ndarray] = None
+        self._frame_id = 0
+        self._frame_ts = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="frame-source", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+
+    def latest(self) -> tuple[int, float, Optional[np.ndarray]]:
+        """Возвращает (frame_id, ts, frame). Кадр не копируем: его никто не меняет."""
+        with self._lock:
+            return self._frame_id, self._frame_ts, self._frame
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            cap = cv2.VideoCapture(self.url)
+            if not cap.isOpened():
+                cap.release()
+                self._stop.wait(self.reconnect_delay_sec)
+                continue
+            while not self._stop.is_set():
+                ok, frame = cap.read()
+                if not ok or frame is None:
+                    break
+                with self._lock:
+                    self._frame = frame
+                    self._frame_id += 1
+                    self._frame_ts = time.time()
+            cap.release()
+            # Поток оборвался — переподключаемся с паузой, чтобы не крутить CPU.
+            self._stop.wait(self.reconnect_delay_sec)
@@ -0,0 +1,151 @@
+"""
+Единый индекс каталога SKU в памяти процесса: sku_catalog + справочник BEDS.
+
+Раньше описание кровати бралось только из захардкоженного BEDS, каталог мастера
+жил отдельно в SQLite, а get_active_sku_codes() перечитывал все активные SKU
+на каждый импорт плана. Теперь:
+- sku_catalog читается один раз при первом обращении;
+- поиск по sku_code, по model_code и по префиксу кода — из памяти;
+- описание кровати: запись каталога, иначе правила BEDS (core.beds_catalog);
+- изменения точечные: sku_create/sku_update перечитывают одну запись (refresh),
+  массовый импорт сбрасывает индекс целиком (invalidate).
+
+Писатель каталога — только процесс API (как у kiosk_settings).
+"""
+
+from __future__ import annotations
+
+import bisect
+import threading
+from typing import Optional
+
+from core import storage
+from core.beds_catalog import BedInfo, get_bed_info as get_static_bed_info
+
+
+def _bed_info_from_row(row: dict) -> BedInfo:
+    # Формат строки деталей — как у справочника BEDS.
+    details = [f"Модель {row['model_code']}"]
+    if row["width_cm"]:
+        details.append(f"Ширина {row['width_cm']} см")
+    details.append(f"Цвет {row['color_code']}")
+    return BedInfo(sku=row["sku_code"], title=row["name"], details=" | ".join(details))
+
+
+class CatalogIndex:
+    """Записи каталога по sku_code, model_code и префиксу; чтения без SQLite."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._db_key: Optional[str] = None
+        self._by_code: dict[str, dict] = {}
+        self._code_by_id: dict[int, str] = {}
+        self._by_model: dict[str, set[str]] = {}
+        self._sorted_codes: list[str] = []
+        self._active: frozenset[str] = frozenset()
+
+    def _ensure_loaded_locked(self) -> None:
+        # Смена БД (тесты) — перечитываем.
+        if self._db_key == str(storage.DB):
+            return
+        self._by_code = {}
+        self._code_by_id = {}
+        self._by_model = {}
+        for row in storage.list_sku_catalog(include_inactive=True):
+            self._put_locked(row)
+        self._sorted_codes = sorted(self._by_code)
+        self._active = frozenset(code for code, row in self._by_code.items() if row["is_active"])
+        self._db_key = str(storage.DB)
+
+    def _put_locked(self, row: dict) -> None:
+        code = row["sku_code"]
+        self._by_code[code] = row
+        self._code_by_id[int(row["id"])] = code
+        self._by_model.setdefault(row["model_code"], set()).add(code)
+
+    def _drop_locked(self, code: str) -> None:
+        row = self._by_code.pop(code, None)
+        if row is None:
+            return
+        self._code_by_id.pop(int(row["id"]), None)
+        codes = self._by_model.get(row["model_code"])
+        if codes is not None:
+            codes.discard(code)
+            if not codes:
+                del self._by_model[row["model_code"]]
+
+    def invalidate(self) -> None:
+        """Следующее чтение перезагрузит каталог из SQLite (после массового импорта)."""
+        with self._lock:
+            self._db_key = None
+
+    def refresh(self, sku_id: int) -> Optional[str]:
+        """
+        Перечитывает одну запись после создания/редактирования.
+
+        Возвращает её sku_code (None — записи больше нет).
+        """
+        row = storage.get_sku_catalog_item(sku_id)
+        with self._lock:
+            if self._db_key != str(storage.DB):
+                # Индекс ещё не загружен — первая загрузка и так увидит запись.
+                return row["sku_code"] if row else None
+            old_code = self._code_by_id.get(int(sku_id))
+            if old_code is not None:
+                self._drop_locked(old_code)
+            if row is not None:
+                self._put_locked(row)
+            self._sorted_codes = sorted(self._by_code)
+            self._active = frozenset(code for code, item in self._by_code.items() if item["is_active"])
+        return row["sku_code"] if row else old_code
+
+    def get(self, sku_code: str) -> Optional[dict]:
+        """Запись каталога (в том числе неактивная) или None."""
+        with self._lock:
+            self._ensure_loaded_locked()
+            row = self._by_code.get(sku_code)
+        return dict(row) if row else None
+
+    def active_codes(self) -> frozenset[str]:
+        """Коды активных SKU (для проверки импортов и прогрева планов)."""
+        with self._lock:
+            self._ensure_loaded_locked()
+            return self._active
+
+    def by_model(self, model_code: str, include_inactive: bool = False) -> list[dict]:
+        """Записи модели, отсортированные по sku_code."""
+        with self._lock:
+            self._ensure_loaded_locked()
+            rows = [self._by_code[code] for code in sorted(self._by_model.get(model_code, ()))]
+        return [dict(row) for row in rows if include_inactive or row["is_active"]]
+
+    def by_prefix(self, prefix: str, limit: int = 50, include_inactive: bool = False) -> list[str]:
+        """Коды, начинающиеся с prefix, по алфавиту (бинарный поиск по отсортированным кодам)."""
+        with self._lock:
+            self._ensure_loaded_locked()
+            codes = self._sorted_codes
+            active = self._active
+        result: list[str] = []
+        for index in range(bisect.bisect_left(codes, prefix), len(codes)):
+            code = codes[index]
+            if not code.startswith(prefix) or len(result) >= limit:
+                break
+            if include_inactive or code in active:
+                result.append(code)
+        return result
+
+    def bed_info(self, sku_code: str) -> Optional[BedInfo]:
+        """Описание кровати: запись каталога мастера, иначе справочник BEDS."""
+        row = self.get(sku_code)
+        if row is not None:
+            return _bed_info_from_row(row)
+        return get_static_bed_info(sku_code)
+
+
+# Глобальный индекс каталога (используется API, FSM упаковки и движком киоска)
+catalog_index = CatalogIndex()
+
+
+def get_bed_info(sku: str) -> Optional[BedInfo]:
+    """Как core.beds_catalog.get_bed_info, но с учётом каталога мастера."""
+    return catalog_index.bed_info(sku)
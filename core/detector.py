@@ -3,10 +3,12 @@ import torch
 
 
 class Detector:
-    def __init__(self, model_path="yolov8n.pt", device=0):
+    def __init__(self, model_path="yolov8n.pt", device=0, imgsz=640):
         self.device = device if torch.cuda.is_available() else "cpu"
         print(f"[Detector] Используется устройство: {self.device}")
 
+        # imgsz — размер входа сети; меньше = быстрее, но хуже мелкие детали.
+        self.imgsz = imgsz
         self.model = YOLO(model_path)
         print("[Detector] Модель загружена")
 
@@ -15,19 +17,29 @@ class Detector:
         frame — numpy.ndarray (BGR, OpenCV)
         Возвращает список боксов + классы + вероятности
         """
-        results = self.model(frame, device=self.device, verbose=False)[0]
-
-        detections = []
-        for box in results.boxes:
-            cls_id = int(box.cls)
-            conf = float(box.conf)
-            xyxy = box.xyxy[0].tolist()
-
-            detections.append({
-                "class_id": cls_id,
-                "class_name": self.model.names[cls_id],
-                "conf": conf,
-                "bbox": xyxy
-            })
-
-        return detections
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(self, frames):
+        """
+        Пакетный инференс: список кадров -> список списков детекций.
+        На GPU пакет заметно повышает FPS, на CPU выигрыш зависит от числа потоков.
+        """
+        results = self.model(list(frames), device=self.device, imgsz=self.imgsz, verbose=False)
+
+        batch = []
+        for result in results:
+            detections = []
+            for box in result.boxes:
+                cls_id = int(box.cls)
+                conf = float(box.conf)
+                xyxy = box.xyxy[0].tolist()
+
+                detections.append({
+                    "class_id": cls_id,
+                    "class_name": self.model.names[cls_id],
+                    "conf": conf,
+                    "bbox": xyxy
+                })
+            batch.append(detections)
+
+        return batch
@@ -0,0 +1,121 @@
+"""
+Настройки киоска и мастер-сессия в памяти процесса (write-through).
+
+Раньше каждый опрос /api/kiosk/state читал мастер-сессию и таймаут из SQLite
+(ensure_master_session_alive), а затем мастер-сессию ещё раз.
+Теперь:
+- настройки и мастер-сессия загружаются одним чтением при первом обращении;
+- запись идёт сначала в SQLite, затем в память (под одной блокировкой);
+- истечение мастер-сессии проверяется по памяти — /state не ходит в БД.
+
+Писатель обеих таблиц — только этот процесс API. Ручную правку БД
+подхватит invalidate() (или перезапуск сервиса).
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Optional
+
+from core import storage
+
+MASTER_TIMEOUT_KEY = "master_session_timeout_min"
+DEFAULT_MASTER_TIMEOUT_MIN = 15
+
+_EMPTY_MASTER = {"enabled": 0, "master_id": None, "last_active_ts": None}
+
+
+class KioskSettingsCache:
+    """Настройки (key -> int) и мастер-сессия: чтения из памяти, записи сквозь в SQLite."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._db_key: Optional[str] = None
+        self._settings: dict[str, int] = {}
+        self._master: dict = dict(_EMPTY_MASTER)
+
+    def _ensure_loaded_locked(self) -> None:
+        # Смена БД (тесты) — перечитываем.
+        if self._db_key != str(storage.DB):
+            self._settings = storage.list_kiosk_settings()
+            self._master = storage.get_master_session()
+            self._db_key = str(storage.DB)
+
+    def invalidate(self) -> None:
+        """Следующее чтение перезагрузит настройки из SQLite."""
+        with self._lock:
+            self._db_key = None
+
+    def get(self, key: str, default: int = 0) -> int:
+        with self._lock:
+            self._ensure_loaded_locked()
+            return self._settings.get(key, int(default))
+
+    def get_many(self, keys: list[str]) -> dict[str, int]:
+        """Как storage.get_kiosk_settings: только сохранённые ключи."""
+        with self._lock:
+            self._ensure_loaded_locked()
+            return {key: self._settings[key] for key in keys if key in self._settings}
+
+    def set_many(self, values: dict[str, int]) -> None:
+        """Сохраняет несколько настроек одной транзакцией."""
+        if not values:
+            return
+        with self._lock:
+            self._ensure_loaded_locked()
+            storage.set_kiosk_settings(values)
+            self._settings.update({key: int(value) for key, value in values.items()})
+
+    def master_session(self) -> dict:
+        """Копия мастер-сессии: enabled (0/1), master_id, last_active_ts."""
+        with self._lock:
+            self._ensure_loaded_locked()
+            return dict(self._master)
+
+    def set_master(self, master_id: str, last_active_ts: int) -> None:
+        with self._lock:
+            self._ensure_loaded_locked()
+            storage.set_master_session(master_id=master_id, last_active_ts=last_active_ts)
+            self._master = {"enabled": 1, "master_id": master_id, "last_active_ts": int(last_active_ts)}
+
+    def clear_master(self) -> None:
+        with self._lock:
+            self._ensure_loaded_locked()
+            storage.clear_master_session()
+            self._master = dict(_EMPTY_MASTER)
+
+    def touch_master(self, last_active_ts: int) -> None:
+        """Время последнего действия мастера (как storage.update_master_last_active)."""
+        with self._lock:
+            self._ensure_loaded_locked()
+            if not self._master["enabled"]:
+                return
+            storage.update_master_last_active(last_active_ts)
+            self._master["last_active_ts"] = int(last_active_ts)
+
+    def master_timeout_min(self) -> int:
+        with self._lock:
+            self._ensure_loaded_locked()
+            timeout = self._settings.get(MASTER_TIMEOUT_KEY, DEFAULT_MASTER_TIMEOUT_MIN)
+        return max(1, min(int(timeout or DEFAULT_MASTER_TIMEOUT_MIN), 240))
+
+    def expire_master(self, now: float) -> Optional[dict]:
+        """
+        Выключает мастер-режим, если мастер бездействовал дольше таймаута.
+
+        Возвращает снятую сессию (для записи события) или None. Проверка —
+        по памяти; в SQLite пишем только сам выход по таймауту.
+        """
+        timeout_sec = self.master_timeout_min() * 60
+        with self._lock:
+            self._ensure_loaded_locked()
+            master = self._master
+            if not master["enabled"] or now - (master["last_active_ts"] or 0) <= timeout_sec:
+                return None
+            storage.clear_master_session()
+            self._master = dict(_EMPTY_MASTER)
+            return master
+
+
+# Глобальный кэш настроек (используется API)
+kiosk_settings = KioskSettingsCache()
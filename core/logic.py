@@ -1,22 +1,36 @@
+import json
 import time
 from datetime import datetime
 import threading
 from dataclasses import dataclass, field
 from typing import List, Literal, Optional
 
+from core.pack_counter import pack_counter
+from core.pack_stats import pack_time_stats
 from core.session import PackSession
+from core.stations import DEFAULT_STATION, check_station, configured_stations, get_current_station
 from core.storage import (
+    add_event,
     init_db,
     save_session,
     start_worker_shift,
     end_worker_shift,
     get_active_shifts,
     get_latest_active_shift_id,
-    count_sessions_since,
+    list_pack_events,
 )
+from services.packaging import (
+    EVENT_STEP_COMPLETED,
+    EVENT_STEP_VERIFIED,
+    PHASE_LAYOUT,
+    get_active_session as get_pack_active_session,
+    get_plan_for_session as get_pack_plan_for_session,
+)
+from services.state_version import state_version
+from services.step_verification import FAILED_RESULTS, POLICY_IGNORE, VERIFY_PENDING, step_verifier
 from services.timers import compute_work_idle_seconds, get_heartbeat_age_sec
 from core.voice import say
-from core.beds_catalog import get_bed_info
+from core.catalog_index import get_bed_info
 # from core.detector import Detector  # подключим, когда будем работать с видео
 
 
@@ -85,6 +99,7 @@ class KioskUIState:
     last_pack_seconds: int
     best_pack_seconds: int
     avg_pack_seconds: int
+    p90_pack_seconds: int
 
     instruction_main: str
     instruction_sub: str
@@ -117,8 +132,9 @@ class KioskEngine:
     STEP_DURATION = 15.0  # секунд на один шаг
     TARGET_PACK_TIME = TOTAL_STEPS * STEP_DURATION
 
-    def __init__(self) -> None:
+    def __init__(self, station_id: str = DEFAULT_STATION) -> None:
         self._lock = threading.Lock()
+        self.station_id = station_id
 
         # инициализируем базу
         init_db()
@@ -127,11 +143,6 @@ class KioskEngine:
         self._session: Optional[PackSession] = None
         self._session_start_ts: Optional[float] = None
 
-        # временная "заглушка" по SKU (потом заменим на реальные данные из БД)
-        self._last_pack_per_sku = {}  # sku -> last_sec
-        self._best_pack_per_sku = {}
-        self._avg_pack_per_sku = {}
-
         # статический поток камеры (потом вынесём в конфиг)
         self.camera_stream_url = "http://127.0.0.1:8080/stream"
 
@@ -148,26 +159,12 @@ class KioskEngine:
         s = s.replace("Ю", ".").replace("ю", ".").replace("Б", ",").replace("б", ",")
         return s
 
-    def _get_day_start_ts(self, now: float) -> float:
-        local_now = time.localtime(now)
-        day_start = time.struct_time((
-            local_now.tm_year,
-            local_now.tm_mon,
-            local_now.tm_mday,
-            0,
-            0,
-            0,
-            local_now.tm_wday,
-            local_now.tm_yday,
-            local_now.tm_isdst,
-        ))
-        return time.mktime(day_start)
-
     def set_worker(self, worker_id: str, worker_name: Optional[str], shift_label: Optional[str]) -> None:
         with self._lock:
             wid = self._normalize_scan(worker_id)
             self._current_worker_name = worker_name or wid or "—"
             self._current_shift_label = shift_label or "Смена не выбрана"
+        state_version.bump()
 
     # ─── смены/РЦ ───
 
@@ -191,6 +188,7 @@ class KioskEngine:
         # для верхней карточки показываем «текущего» сотрудника, если ещё не задан
         if getattr(self, "_current_worker_name", "—") in ("—", ""):
             self._current_worker_name = wid
+        state_version.bump()
         return shift_id
 
     def close_worker_shift(self, worker_id: str, work_centers: Optional[list[str]] = None) -> int:
@@ -199,6 +197,7 @@ class KioskEngine:
             return 0
         n = end_worker_shift(wid, work_centers=work_centers)
         self._active_shifts_cache = get_active_shifts()
+        state_version.bump()
         return n
 
     def get_active_session_shift_context(self) -> tuple[int | None, str | None]:
@@ -223,6 +222,7 @@ class KioskEngine:
             self._current_bed_sku = code
             self._current_bed_title = bed_title
             self._current_bed_details = bed_details
+        state_version.bump()
 
 
 
@@ -293,6 +293,7 @@ class KioskEngine:
             self._current_bed_sku = code
             self._current_bed_title = bed_title
             self._current_bed_details = bed_details
+        state_version.bump()
 
     def finish_session(self, status: str = "done") -> None:
         with self._lock:
@@ -300,7 +301,7 @@ class KioskEngine:
                 return
 
             self._session.finish(status=status)
-            session_id = save_session(self._session)
+            session_id = self._save_session_locked()
 
             # Если упаковка завершилась успешно, фиксируем событие,
             # чтобы packed_count считался по events (без ручных счётчиков).
@@ -313,26 +314,40 @@ class KioskEngine:
                     worker_id=self._session.worker_id,
                 )
 
-            total_sec = int(self._session.worktime_sec + self._session.downtime_sec)
-            sku = self._session.product_code
-
-            self._last_pack_per_sku[sku] = total_sec
-
-            best = self._best_pack_per_sku.get(sku)
-            if best is None or total_sec < best:
-                self._best_pack_per_sku[sku] = total_sec
-
-            # простая "средняя" по 2 значениям (для примера)
-            avg_prev = self._avg_pack_per_sku.get(sku)
-            if avg_prev is None:
-                self._avg_pack_per_sku[sku] = total_sec
-            else:
-                self._avg_pack_per_sku[sku] = int((avg_prev + total_sec) / 2)
+            self._record_pack_time_locked(status)
 
             say("Упаковка завершена")
 
             self._session = None
             self._session_start_ts = None
+        state_version.bump()
+
+    def _save_session_locked(self) -> int:
+        # Запись в sessions и дневной счётчик в памяти — вместе: storage про кэши API не знает.
+        session_id = save_session(self._session)
+        pack_counter.on_session_saved(self._session.start_time, self._session.worker_id)
+        return session_id
+
+    def _record_pack_time_locked(self, status: str) -> None:
+        # В статистику времени идут только успешные упаковки:
+        # прерванные сессии исказили бы среднее и квантили.
+        if status != "done":
+            return
+        total_sec = self._session.worktime_sec + self._session.downtime_sec
+        pack_time_stats.record(
+            sku=self._session.product_code,
+            worker_id=self._session.worker_id,
+            seconds=total_sec,
+            ts=self._session.finish_time,
+        )
+
+    def _pack_time_fields(self, sku: str) -> dict:
+        # last/best/avg/p90 для UI — из памяти, без запросов к БД.
+        summary = pack_time_stats.get(sku)
+        return {
+            key + "_pack_seconds": int(round(summary[key] or 0))
+            for key in ("last", "best", "avg", "p90")
+        }
 
     def _finish_session_locked(self, status: str = "done") -> None:
         #ВНИМАНИЕ: эту функцию вызываем ТОЛЬКО тогда, когда self._lock УЖЕ взят!
@@ -350,8 +365,8 @@ class KioskEngine:
         # 1) фиксируем завершение сессии
         self._session.finish(status=status)
 
-        # 2) сохраняем в базу
-        session_id = save_session(self._session)
+        # 2) сохраняем в базу (и в дневной счётчик)
+        session_id = self._save_session_locked()
 
         # Если упаковка завершилась успешно, пишем событие в events.
         # Это нужно для корректного packed_count в отчётах по смене.
@@ -364,24 +379,8 @@ class KioskEngine:
                 worker_id=self._session.worker_id,
             )
 
-        # 3) считаем время (работа+простой), чтобы обновить "последнее / лучшее / среднее"
-        total_sec = int(self._session.worktime_sec + self._session.downtime_sec)
-        sku = self._session.product_code
-
-        # "Последняя упаковка"
-        self._last_pack_per_sku[sku] = total_sec
-
-        # "Лучшее время"
-        best = self._best_pack_per_sku.get(sku)
-        if best is None or total_sec < best:
-            self._best_pack_per_sku[sku] = total_sec
-
-        # "Среднее время" — пока простая формула (потом можно по-настоящему)
-        avg_prev = self._avg_pack_per_sku.get(sku)
-        if avg_prev is None:
-            self._avg_pack_per_sku[sku] = total_sec
-        else:
-            self._avg_pack_per_sku[sku] = int((avg_prev + total_sec) / 2)
+        # 3) время (работа+простой) -> статистика "последнее / лучшее / среднее / p90"
+        self._record_pack_time_locked(status)
 
         # голос
         say("Упаковка завершена")
@@ -389,67 +388,78 @@ class KioskEngine:
         # 4) очищаем текущую сессию в памяти (важно!)
         self._session = None
         self._session_start_ts = None
+        state_version.bump()
 
 
-    # ─── внутренняя "симуляция" шагов ───
+    # ─── шаги и слоты из реального состояния упаковки ───
 
     def _build_steps_and_slots(self, now: float):
         """
-        Пока что симуляция, завязанная на время.
-        Позже сюда встраиваем результаты YOLO + правила проверки.
-        """
-        if not self._session_start_ts:
-            # нет активной сессии — шаги пустые
-            return 0, 0, [], []
+        Шаги и слоты берём из FSM упаковки (services.packaging), а не по времени.
 
-        elapsed = now - self._session_start_ts
+        Почему так:
+        - шаг закрывается по факту: вручную (/pack/step/complete)
+          или движком занятости слотов (services.occupancy) по детекциям камеры;
+        - UI видит тот же план (LAYOUT, затем PACKING), что и backend упаковки.
 
-        raw_step_index = int(elapsed // self.STEP_DURATION)
-        current_step_index = min(max(raw_step_index + 1, 0), self.TOTAL_STEPS)
-        completed_steps = min(max(raw_step_index, 0), self.TOTAL_STEPS)
+        Возвращаем (current_step_index, completed_steps, total_steps, steps, slots),
+        где индексы сквозные по обеим фазам.
+        """
+        active = get_pack_active_session(self.station_id)
+        if not active:
+            return 0, 0, self.TOTAL_STEPS, [], []
+
+        plan = get_pack_plan_for_session(active)
+        phase = active["phase"] or PHASE_LAYOUT
+        phase_index = active["current_step_index"] or 0
+        layout_total = sum(1 for step in plan if step["phase"] == PHASE_LAYOUT)
+        offset = 0 if phase == PHASE_LAYOUT else layout_total
+        completed_steps = min(offset + phase_index, len(plan))
+        current_step_index = min(completed_steps + 1, len(plan))
 
-        # шаги
         steps: List[StepDTO] = []
-        for i in range(self.TOTAL_STEPS):
+        for i, step in enumerate(plan):
             if i < completed_steps:
                 st = "done"
-            elif i == current_step_index - 1:
+            elif i == completed_steps:
                 st = "current"
             else:
                 st = "pending"
-
+            action = "Положите" if step["phase"] == PHASE_LAYOUT else "Уложите в коробку"
             steps.append(
                 StepDTO(
                     index=i,
-                    title=f"Положите деталь {i + 1} в подсвеченную зону",
+                    title=f"{action} деталь {step['part_code']} (слот {step['slot']})",
                     status=st,
                     meta="Проверьте ориентацию детали.",
                 )
             )
 
-        # слоты
+        # Подсвечиваем только слоты текущей фазы.
         slots: List[OverlaySlotDTO] = []
-        for i in range(self.TOTAL_STEPS):
-            if i < completed_steps:
+        for step in plan:
+            if step["phase"] != phase:
+                continue
+            if step["index"] < phase_index:
                 st = "done"
-            elif i == current_step_index - 1:
+            elif step["index"] == phase_index:
                 st = "current"
             else:
                 st = "pending"
-
+            x, y, w, h = step["rect"]
             slots.append(
                 OverlaySlotDTO(
-                    id=i,
-                    x=0.06 + 0.15 * i,
-                    y=0.18 if i % 2 == 0 else 0.38,
-                    w=0.12,
-                    h=0.18,
+                    id=step["index"],
+                    x=x,
+                    y=y,
+                    w=w,
+                    h=h,
                     status=st,
-                    title=f"Деталь {i + 1}",
+                    title=f"{step['slot']}: {step['part_code']}",
                 )
             )
 
-        return current_step_index, completed_steps, steps, slots
+        return current_step_index, completed_steps, len(plan), steps, slots
 
     def _build_events(self, now: float, completed_steps: int) -> List[EventDTO]:
         events: List[EventDTO] = []
@@ -465,16 +475,35 @@ class KioskEngine:
                 )
             )
 
-            for i in range(completed_steps):
-                ts = t0 + (i + 1) * self.STEP_DURATION
-                if ts > now:
+        # Завершённые шаги берём из pack_events (источник истины для аудита).
+        active = get_pack_active_session(self.station_id)
+        if active:
+            rows = list_pack_events(active["id"], limit=12)
+            # Результаты фоновой проверки (STEP_VERIFIED) подмешиваем к своим шагам.
+            verified = {}
+            for row in rows:
+                if row["type"] == EVENT_STEP_VERIFIED:
+                    payload = json.loads(row["payload_json"] or "{}")
+                    verified[payload.get("step_event_id")] = payload.get("result")
+            warn = step_verifier.policy != POLICY_IGNORE
+            for row in rows:
+                if row["type"] != EVENT_STEP_COMPLETED:
                     continue
+                payload = json.loads(row["payload_json"] or "{}")
+                result = verified.get(row["id"], payload.get("verify_result"))
+                failed = warn and result in FAILED_RESULTS
+                text = f"Деталь {payload.get('part_code', '')} — слот {payload.get('slot', '')} готов"
+                if failed:
+                    text += " (проверка не пройдена)"
+                elif result == VERIFY_PENDING:
+                    text += " (проверяется)"
+                ts = float(row["ts"])
                 events.append(
                     EventDTO(
                         ts_epoch=ts,
                         time=time.strftime("%H:%M", time.localtime(ts)),
-                        text=f"Деталь {i + 1} успешно уложена",
-                        level="info",
+                        text=text,
+                        level="warning" if failed else "info",
                     )
                 )
 
@@ -486,8 +515,7 @@ class KioskEngine:
     def get_ui_state(self) -> KioskUIState:
         with self._lock:
             now = time.time()
-            today_start = self._get_day_start_ts(now)
-            session_count_today = count_sessions_since(today_start)
+            session_count_today = pack_counter.get(now=now)
 
             # актуализируем список активных смен для UI
             try:
@@ -545,9 +573,7 @@ class KioskEngine:
                     work_minutes=work_minutes,
                     idle_minutes=idle_minutes,
                     heartbeat_age_sec=heartbeat_age_sec,
-                    last_pack_seconds=self._last_pack_per_sku.get(getattr(self, "_current_bed_sku", "—"), 0),
-                    best_pack_seconds=self._best_pack_per_sku.get(getattr(self, "_current_bed_sku", "—"), 0),
-                    avg_pack_seconds=self._avg_pack_per_sku.get(getattr(self, "_current_bed_sku", "—"), 0),
+                    **self._pack_time_fields(getattr(self, "_current_bed_sku", "—")),
                     instruction_main="Ожидание начала упаковки…",
                     instruction_sub="Просканируйте QR-код кровати и сотрудника для старта.",
                     instruction_extra="Голосовые подсказки повторяют текст.",
@@ -570,14 +596,14 @@ class KioskEngine:
             work_sec = int(sess.worktime_sec)
             idle_sec = int(sess.downtime_sec)
 
-            current_step_index, completed_steps, steps, slots = self._build_steps_and_slots(now)
+            current_step_index, completed_steps, total_steps, steps, slots = self._build_steps_and_slots(now)
             events = self._build_events(now, completed_steps)
 
                         # ─────────────────────────────────────────────────────────────
-            # АВТО-ЗАВЕРШЕНИЕ СЕССИИ В ЭМУЛЯЦИИ
+            # АВТО-ЗАВЕРШЕНИЕ СЕССИИ ПО ПЛАНУ УПАКОВКИ
             #
-            # Сейчас шаги "идут по времени": 6 шагов * 15 секунд.
-            # Когда completed_steps дошёл до 6 — значит, все детали уложены.
+            # Шаги закрываются по факту (вручную или камерой).
+            # Когда выполнены все шаги LAYOUT и PACKING — значит, все детали уложены.
             #
             # Нам нужно завершить сессию, чтобы:
             # - остановился таймер
@@ -588,7 +614,7 @@ class KioskEngine:
             # Мы НЕ вызываем finish_session(), потому что она снова берёт lock.
             # Вместо этого вызываем _finish_session_locked(), потому что lock уже взят.
             # ─────────────────────────────────────────────────────────────
-            if status == "running" and completed_steps >= self.TOTAL_STEPS:
+            if status == "running" and steps and completed_steps >= total_steps:
                 # Добавим событие в ленту (приятно для UI)
                 # (события у нас строятся отдельно, но это объяснение логики)
                 # Завершаем сессию:
@@ -616,15 +642,13 @@ class KioskEngine:
                     work_minutes=work_minutes,
                     idle_minutes=idle_minutes,
                     heartbeat_age_sec=heartbeat_age_sec,
-                    last_pack_seconds=self._last_pack_per_sku.get(getattr(self, "_current_bed_sku", "—"), 0),
-                    best_pack_seconds=self._best_pack_per_sku.get(getattr(self, "_current_bed_sku", "—"), 0),
-                    avg_pack_seconds=self._avg_pack_per_sku.get(getattr(self, "_current_bed_sku", "—"), 0),
+                    **self._pack_time_fields(getattr(self, "_current_bed_sku", "—")),
                     instruction_main="Комплект готов. Закройте коробку.",
                     instruction_sub="Можно сканировать следующую кровать, если стол пустой.",
                     instruction_extra="Этикетка печатается после определения 'коробка закрыта'.",
-                    current_step_index=self.TOTAL_STEPS,
-                    total_steps=self.TOTAL_STEPS,
-                    completed_steps=self.TOTAL_STEPS,
+                    current_step_index=total_steps,
+                    total_steps=total_steps,
+                    completed_steps=total_steps,
                     error_steps=0,
                     steps=steps,
                     events=events,
@@ -639,7 +663,7 @@ class KioskEngine:
 
             # пока грубо: считаем всю длительность как "работу"
             if status == "running":
-                work_sec += int(elapsed)
+                work_sec += int(now - sess.start_time)
 
             # Если есть события таймера, используем их как источник истины.
             # Это обеспечивает расчёт work/idle на основе событий.
@@ -647,10 +671,6 @@ class KioskEngine:
                 work_sec = work_seconds
                 idle_sec = idle_seconds
 
-            sku = sess.product_code
-            last_pack = self._last_pack_per_sku.get(sku, 0)
-            best_pack = self._best_pack_per_sku.get(sku, 0)
-            avg_pack = self._avg_pack_per_sku.get(sku, 0)
 
             return KioskUIState(
                 worker_name=getattr(self, "_current_worker_name", "—"),
@@ -671,9 +691,7 @@ class KioskEngine:
                 work_minutes=work_minutes,
                 idle_minutes=idle_minutes,
                 heartbeat_age_sec=heartbeat_age_sec,
-                last_pack_seconds=last_pack,
-                best_pack_seconds=best_pack,
-                avg_pack_seconds=avg_pack,
+                **self._pack_time_fields(sess.product_code),
                 instruction_main=(
                     "Комплект готов. Закройте коробку."
                     if status == "done"
@@ -686,7 +704,7 @@ class KioskEngine:
                 ),
                 instruction_extra="Следите за подсветкой и голосовыми подсказками.",
                 current_step_index=current_step_index,
-                total_steps=self.TOTAL_STEPS,
+                total_steps=total_steps,
                 completed_steps=completed_steps,
                 error_steps=0,
                 steps=steps,
@@ -696,5 +714,37 @@ class KioskEngine:
             )
 
 
-# Глобальный экземпляр для киоска
-engine = KioskEngine()
+class KioskEngineRegistry:
+    """
+    Движки по станциям: один процесс API обслуживает несколько столов.
+
+    У каждого движка свой lock, поэтому станции не ждут друг друга;
+    общий lock реестра берётся только при создании нового движка.
+    Движки создаются только для настроенных станций (KZ_STATIONS), иначе
+    UnknownStationError — произвольный идентификатор от клиента не заводит новый стол.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._engines: dict[str, KioskEngine] = {}
+
+    def get(self, station_id: Optional[str] = None) -> KioskEngine:
+        station_id = check_station(station_id or get_current_station())
+        engine = self._engines.get(station_id)
+        if engine is not None:
+            return engine
+        with self._lock:
+            engine = self._engines.get(station_id)
+            if engine is None:
+                engine = KioskEngine(station_id=station_id)
+                self._engines[station_id] = engine
+            return engine
+
+    def stations(self) -> list[str]:
+        """Все настроенные станции (движок создаётся при первом запросе станции)."""
+        return sorted(configured_stations())
+
+
+# Глобальный реестр; engine — движок станции по умолчанию (совместимость со старым кодом)
+engines = KioskEngineRegistry()
+engine = engines.get(DEFAULT_STATION)
@@ -0,0 +1,119 @@
+"""
+Счётчик упаковок за текущие сутки (всего и по сотрудникам).
+
+Раньше /state на каждом опросе считал COUNT(*) по sessions.
+Теперь:
+- счётчик загружается одним запросом при старте и после полуночи;
+- движок киоска увеличивает его сразу после записи сессии (save_session);
+- check_consistency() периодически сверяет память с SQL и чинит расхождение.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Optional
+
+from core import storage
+
+
+def local_day_start(now: float) -> float:
+    # Полночь по локальному времени киоска.
+    local_now = time.localtime(now)
+    return time.mktime((local_now.tm_year, local_now.tm_mon, local_now.tm_mday, 0, 0, 0, 0, 0, -1))
+
+
+def next_day_start(day_start: float) -> float:
+    # +26 ч и снова к полуночи: корректно при переходе на летнее/зимнее время.
+    return local_day_start(day_start + 26 * 3600)
+
+
+class DailyPackCounter:
+    """Счётчик сессий за сутки: O(1) чтение без обращения к БД."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._db_key: Optional[str] = None
+        self._day_start = 0.0
+        self._day_end = 0.0
+        self._total = 0
+        self._by_worker: dict[str, int] = {}
+        self._last_check: Optional[dict] = None
+
+    def _ensure_loaded_locked(self, now: float) -> bool:
+        # Смена БД (тесты) или полночь — перечитываем сутки одним запросом.
+        if self._db_key != str(storage.DB) or not (self._day_start <= now < self._day_end):
+            self._load_locked(now)
+            return True
+        return False
+
+    def _load_locked(self, now: float) -> None:
+        self._db_key = str(storage.DB)
+        self._day_start = local_day_start(now)
+        self._day_end = next_day_start(self._day_start)
+        self._by_worker = storage.count_sessions_by_worker(self._day_start, self._day_end)
+        self._total = sum(self._by_worker.values())
+
+    def load(self, now: float | None = None) -> None:
+        """Загружает счётчик текущих суток из БД (при старте API)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._load_locked(now)
+
+    def get(self, worker_id: str | None = None, now: float | None = None) -> int:
+        """Число упаковок за сегодня: всего или по сотруднику."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._ensure_loaded_locked(now)
+            if worker_id:
+                return self._by_worker.get(worker_id, 0)
+            return self._total
+
+    def snapshot(self, now: float | None = None) -> dict:
+        now = time.time() if now is None else now
+        with self._lock:
+            self._ensure_loaded_locked(now)
+            return {
+                "day_start": self._day_start,
+                "total": self._total,
+                "by_worker": dict(self._by_worker),
+                "last_check": self._last_check,
+            }
+
+    def on_session_saved(self, start_time: float, worker_id: str | None) -> None:
+        """Вызывается движком киоска после успешной записи сессии (save_session)."""
+        now = time.time()
+        with self._lock:
+            if self._ensure_loaded_locked(now):
+                # Только что перечитали из БД — новая запись уже учтена.
+                return
+            # Сессия, начатая до полуночи, в сегодняшний счётчик не входит (как и в SQL).
+            if not (self._day_start <= float(start_time or 0) < self._day_end):
+                return
+            self._total += 1
+            key = worker_id or ""
+            self._by_worker[key] = self._by_worker.get(key, 0) + 1
+
+    def check_consistency(self, now: float | None = None) -> dict:
+        """
+        Сверяет счётчик с SQL. При расхождении берём значения из БД.
+
+        Возвращает {"ok", "memory", "db", "ts"}.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._ensure_loaded_locked(now)
+            memory = self._total
+            by_worker = storage.count_sessions_by_worker(self._day_start, self._day_end)
+            db_total = sum(by_worker.values())
+            ok = by_worker == self._by_worker
+            if not ok:
+                print(f"[PackCounter] Расхождение со счётчиком в БД: память={memory}, БД={db_total}")
+                self._by_worker = by_worker
+                self._total = db_total
+            self._last_check = {"ok": ok, "memory": memory, "db": db_total, "ts": now}
+            return dict(self._last_check)
+
+
+# Глобальный счётчик (используется движком киоска и API)
+pack_counter = DailyPackCounter()
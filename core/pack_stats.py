@@ -0,0 +1,228 @@
+"""
+Статистика времени упаковки по SKU и по паре сотрудник × SKU.
+
+Что считаем на каждую завершённую сессию (инкрементально, O(1)):
+- count, последнее и лучшее (минимальное) время;
+- среднее и дисперсию по Уэлфорду (без хранения всех значений);
+- p50/p90 алгоритмом P² (Jain & Chlamtac): 5 маркеров на квантиль.
+
+Состояние хранится в таблице pack_time_stats и целиком читается одним
+запросом при первом обращении, дальше /state берёт цифры из памяти.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from core import storage
+
+# Ключ "все сотрудники" в таблице и в памяти.
+ALL_WORKERS = ""
+
+
+class P2Quantile:
+    """
+    Потоковая оценка квантиля p алгоритмом P².
+
+    Первые 5 значений храним как есть (там квантиль считается точно),
+    дальше двигаем 5 маркеров параболической интерполяцией.
+    """
+
+    def __init__(self, p: float) -> None:
+        self.p = p
+        self.q: list[float] = []
+        self.n = [1, 2, 3, 4, 5]
+        self.np = [1.0, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5.0]
+        self.dn = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, x: float) -> None:
+        q, n = self.q, self.n
+        if len(q) < 5:
+            q.append(float(x))
+            q.sort()
+            return
+
+        if x < q[0]:
+            q[0] = float(x)
+            k = 0
+        elif x >= q[4]:
+            q[4] = float(x)
+            k = 3
+        else:
+            k = next(i for i in range(4) if q[i] <= x < q[i + 1])
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.np[i] += self.dn[i]
+
+        for i in (1, 2, 3):
+            d = self.np[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if d > 0 else -1
+                candidate = self._parabolic(i, step)
+                if not q[i - 1] < candidate < q[i + 1]:
+                    candidate = q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+                q[i] = candidate
+                n[i] += step
+
+    def _parabolic(self, i: int, d: int) -> float:
+        q, n = self.q, self.n
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self) -> Optional[float]:
+        if not self.q:
+            return None
+        if len(self.q) < 5:
+            # Мало данных — точный квантиль по рангу.
+            rank = max(0, math.ceil(self.p * len(self.q)) - 1)
+            return self.q[rank]
+        return self.q[2]
+
+    def to_json(self) -> str:
+        return json.dumps({"p": self.p, "q": self.q, "n": self.n, "np": self.np})
+
+    @classmethod
+    def from_json(cls, text: str | None, p: float) -> "P2Quantile":
+        est = cls(p)
+        if text:
+            data = json.loads(text)
+            est.q = [float(v) for v in data.get("q", [])]
+            est.n = [int(v) for v in data.get("n", est.n)]
+            est.np = [float(v) for v in data.get("np", est.np)]
+        return est
+
+
+@dataclass
+class RunningStats:
+    """Накопленная статистика одного ключа (sku, worker_id)."""
+
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    min_sec: Optional[float] = None
+    max_sec: Optional[float] = None
+    last_sec: Optional[float] = None
+    last_ts: Optional[float] = None
+    p50: P2Quantile = field(default_factory=lambda: P2Quantile(0.5))
+    p90: P2Quantile = field(default_factory=lambda: P2Quantile(0.9))
+
+    def add(self, seconds: float, ts: float) -> None:
+        # Уэлфорд: устойчивое к округлению обновление среднего и M2.
+        self.count += 1
+        delta = seconds - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (seconds - self.mean)
+        self.min_sec = seconds if self.min_sec is None else min(self.min_sec, seconds)
+        self.max_sec = seconds if self.max_sec is None else max(self.max_sec, seconds)
+        self.last_sec = seconds
+        self.last_ts = ts
+        self.p50.add(seconds)
+        self.p90.add(seconds)
+
+    @property
+    def variance(self) -> float:
+        # Выборочная дисперсия (n - 1).
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "last": self.last_sec,
+            "best": self.min_sec,
+            "worst": self.max_sec,
+            "avg": self.mean if self.count else None,
+            "std": math.sqrt(self.variance),
+            "p50": self.p50.value(),
+            "p90": self.p90.value(),
+            "last_ts": self.last_ts,
+        }
+
+    def to_row(self, sku: str, worker_id: str) -> dict:
+        return {
+            "sku": sku,
+            "worker_id": worker_id,
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "min_sec": self.min_sec,
+            "max_sec": self.max_sec,
+            "last_sec": self.last_sec,
+            "last_ts": self.last_ts,
+            "p50_json": self.p50.to_json(),
+            "p90_json": self.p90.to_json(),
+        }
+
+    @classmethod
+    def from_row(cls, row: dict) -> "RunningStats":
+        return cls(
+            count=int(row["count"]),
+            mean=float(row["mean"] or 0.0),
+            m2=float(row["m2"] or 0.0),
+            min_sec=row["min_sec"],
+            max_sec=row["max_sec"],
+            last_sec=row["last_sec"],
+            last_ts=row["last_ts"],
+            p50=P2Quantile.from_json(row["p50_json"], 0.5),
+            p90=P2Quantile.from_json(row["p90_json"], 0.9),
+        )
+
+
+class PackTimeStats:
+    """Статистика времени упаковки в памяти с записью в БД на каждое обновление."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._db_key: Optional[str] = None
+        self._stats: dict[tuple[str, str], RunningStats] = {}
+
+    def _ensure_loaded_locked(self) -> None:
+        if self._db_key == str(storage.DB):
+            return
+        self._db_key = str(storage.DB)
+        self._stats = {
+            (row["sku"], row["worker_id"]): RunningStats.from_row(row)
+            for row in storage.load_pack_time_stats()
+        }
+
+    def load(self) -> None:
+        """Читает всю статистику одним запросом (при старте)."""
+        with self._lock:
+            self._db_key = None
+            self._ensure_loaded_locked()
+
+    def record(self, sku: str, worker_id: str | None, seconds: float, ts: float | None = None) -> None:
+        """Учитывает завершённую сессию: общий ключ SKU и ключ сотрудник × SKU."""
+        if not sku:
+            return
+        ts = time.time() if ts is None else ts
+        seconds = float(seconds)
+        keys = [(sku, ALL_WORKERS)]
+        if worker_id:
+            keys.append((sku, worker_id))
+        with self._lock:
+            self._ensure_loaded_locked()
+            rows = []
+            for key in keys:
+                stats = self._stats.setdefault(key, RunningStats())
+                stats.add(seconds, ts)
+                rows.append(stats.to_row(*key))
+            storage.upsert_pack_time_stats(rows)
+
+    def get(self, sku: str, worker_id: str | None = None) -> dict:
+        """Сводка по SKU (или по сотруднику × SKU); пустая сводка, если данных нет."""
+        with self._lock:
+            self._ensure_loaded_locked()
+            stats = self._stats.get((sku, worker_id or ALL_WORKERS))
+            return (stats or RunningStats()).summary()
+
+
+# Глобальная статистика (используется движком и API)
+pack_time_stats = PackTimeStats()
@@ -0,0 +1,132 @@
+"""
+Станции (упаковочные столы) в одном процессе API.
+
+Станция запроса определяется так (первое найденное):
+- префикс пути /api/kiosk/stations/<station_id>/... (переписывается в обычный путь);
+- заголовок X-Station-Id;
+- иначе DEFAULT_STATION — старые клиенты работают как раньше.
+
+Станции процесса задаются списком KZ_STATIONS (через запятую, например "T2,T3");
+DEFAULT_STATION есть всегда. Неизвестная станция — 404: опечатка в заголовке
+не заводит фантомный стол, а клиент не может плодить движки.
+
+Текущая станция хранится в contextvar: код ниже API (движок, сервисы)
+берёт её через get_current_station(), не протаскивая параметр по всем вызовам.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import functools
+import json
+import os
+import re
+
+DEFAULT_STATION = "default"
+STATION_HEADER = "x-station-id"
+STATION_PATH_PREFIX = "/api/kiosk/stations/"
+STATIONS_ENV = "KZ_STATIONS"
+
+_STATION_RE = re.compile(r"[A-Za-z0-9_-]{1,32}")
+
+current_station: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "current_station", default=DEFAULT_STATION
+)
+
+
+class InvalidStationError(ValueError):
+    pass
+
+
+class UnknownStationError(LookupError):
+    pass
+
+
+@functools.lru_cache(maxsize=8)
+def _parse_stations(raw: str) -> frozenset[str]:
+    return frozenset({DEFAULT_STATION} | {normalize_station_id(item) for item in raw.split(",") if item.strip()})
+
+
+def configured_stations() -> frozenset[str]:
+    """Станции процесса: DEFAULT_STATION и KZ_STATIONS."""
+    return _parse_stations(os.getenv(STATIONS_ENV, ""))
+
+
+def check_station(station_id: str | None) -> str:
+    """Нормализует идентификатор и проверяет, что станция настроена."""
+    station_id = normalize_station_id(station_id)
+    if station_id not in configured_stations():
+        raise UnknownStationError(f"Неизвестная станция: {station_id!r}")
+    return station_id
+
+
+def normalize_station_id(station_id: str | None) -> str:
+    """Пустое значение — станция по умолчанию; допускаем латиницу, цифры, '_' и '-'."""
+    station_id = (station_id or "").strip()
+    if not station_id:
+        return DEFAULT_STATION
+    if not _STATION_RE.fullmatch(station_id):
+        raise InvalidStationError(f"Некорректный идентификатор станции: {station_id!r}")
+    return station_id
+
+
+def get_current_station() -> str:
+    return current_station.get()
+
+
+def resolve_station(path: str, headers: list[tuple[bytes, bytes]]) -> tuple[str, str]:
+    """Возвращает (station_id, путь без префикса станции)."""
+    if path.startswith(STATION_PATH_PREFIX):
+        station_id, _, rest = path[len(STATION_PATH_PREFIX):].partition("/")
+        return check_station(station_id), "/api/kiosk/" + rest
+    for name, value in headers:
+        if name.lower() == STATION_HEADER.encode():
+            return check_station(value.decode("latin-1")), path
+    return DEFAULT_STATION, path
+
+
+class StationRoutingMiddleware:
+    """
+    ASGI-middleware: выставляет текущую станцию для HTTP и WebSocket.
+
+    Чистый ASGI (не BaseHTTPMiddleware), чтобы переписывать путь до роутинга
+    и одинаково обслуживать /api/kiosk/ws.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        try:
+            station_id, path = resolve_station(scope["path"], scope.get("headers") or [])
+        except InvalidStationError as exc:
+            await _reject(scope, send, str(exc))
+            return
+        except UnknownStationError as exc:
+            await _reject(scope, send, str(exc), status=404)
+            return
+        if path != scope["path"]:
+            scope = dict(scope, path=path, raw_path=path.encode())
+        token = current_station.set(station_id)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_station.reset(token)
+
+
+async def _reject(scope, send, detail: str, status: int = 400) -> None:
+    if scope["type"] == "websocket":
+        await send({"type": "websocket.close", "code": 1008})
+        return
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
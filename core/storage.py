@@ -1,17 +1,146 @@
+import json
+import re
 import sqlite3
+import threading
 import time
+from contextlib import contextmanager
 from pathlib import Path
 
+from core.stations import DEFAULT_STATION
+
 DB = Path("storage/kz_pack.db")
 DB.parent.mkdir(exist_ok=True)
 
 
+class _ThreadConnection(sqlite3.Connection):
+    """
+    Постоянное соединение потока core.storage_executor.
+
+    close() не закрывает файл: откатывает незавершённое и возвращает
+    соединение потоку для следующего get_conn().
+    """
+
+    db_key = ""
+    in_use = False
+
+    def close(self) -> None:
+        if self.in_transaction:
+            self.rollback()
+        self.isolation_level = ""
+        self.row_factory = sqlite3.Row
+        self.in_use = False
+
+
+_thread_conn = threading.local()
+
+
+def enable_thread_connection() -> None:
+    # Вызывается при старте потока пула: дальше get_conn() в этом потоке переиспользует соединение.
+    _thread_conn.enabled = True
+    _thread_conn.conn = None
+
+
+def release_thread_connection() -> None:
+    # После задачи пула: соединение, которое забыли закрыть (исключение), не держит транзакцию.
+    conn = getattr(_thread_conn, "conn", None)
+    if conn is not None:
+        conn.close()
+
+
+def _pooled_conn() -> sqlite3.Connection | None:
+    conn = _thread_conn.conn
+    if conn is not None and conn.db_key != str(DB) and not conn.in_use:
+        sqlite3.Connection.close(conn)
+        conn = _thread_conn.conn = None
+    if conn is None:
+        conn = sqlite3.connect(DB, factory=_ThreadConnection)
+        conn.db_key = str(DB)
+        conn.row_factory = sqlite3.Row
+        _thread_conn.conn = conn
+    if conn.in_use or conn.db_key != str(DB):
+        # Вложенный get_conn() — отдельное соединение, чтобы не закрыть внешнее.
+        return None
+    conn.in_use = True
+    return conn
+
+
 def get_conn():
+    if getattr(_thread_conn, "enabled", False):
+        conn = _pooled_conn()
+        if conn is not None:
+            return conn
     conn = sqlite3.connect(DB)
     conn.row_factory = sqlite3.Row
     return conn
 
 
+@contextmanager
+def transaction():
+    # Несколько записей одним коммитом (один fsync вместо нескольких).
+    # BEGIN IMMEDIATE сразу берёт блокировку записи: проверка и запись внутри
+    # транзакции атомарны и между потоками, и между процессами.
+    conn = get_conn()
+    conn.isolation_level = None
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+# Долгоживущее соединение только для PRAGMA data_version.
+_data_version_lock = threading.Lock()
+_data_version_conn: tuple[str, sqlite3.Connection] | None = None
+
+
+def get_data_version() -> int:
+    # data_version меняется, когда коммитит любое другое соединение (в том числе
+    # другой процесс). Поэтому читаем его на одном постоянном соединении:
+    # на свежем соединении значение ни с чем не сравнить.
+    global _data_version_conn
+    with _data_version_lock:
+        if _data_version_conn is None or _data_version_conn[0] != str(DB):
+            if _data_version_conn is not None:
+                _data_version_conn[1].close()
+            _data_version_conn = (str(DB), sqlite3.connect(DB, check_same_thread=False))
+        return int(_data_version_conn[1].execute("PRAGMA data_version").fetchone()[0])
+
+
+def _init_change_counter(cur: sqlite3.Cursor, table: str) -> None:
+    # Счётчик изменений таблицы: триггеры увеличивают его при любой записи
+    # (этот процесс, другой процесс, ручная правка). В отличие от PRAGMA data_version,
+    # записи в другие таблицы (heartbeat, таймеры, настройки) его не трогают.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS change_counters (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    )
+    """)
+    cur.execute("INSERT OR IGNORE INTO change_counters(name, version) VALUES (?, 0)", [table])
+    for suffix, operation in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE")):
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_changes_{suffix} AFTER {operation} ON {table} BEGIN
+            UPDATE change_counters SET version = version + 1 WHERE name = '{table}';
+        END
+        """)
+
+
+def get_change_counter(table: str, conn: sqlite3.Connection | None = None) -> int:
+    """Текущее значение счётчика изменений таблицы (внутри транзакции — с её записями)."""
+    own = conn is None
+    if own:
+        conn = get_conn()
+    row = conn.execute("SELECT version FROM change_counters WHERE name=?", [table]).fetchone()
+    if own:
+        conn.close()
+    return int(row[0]) if row else 0
+
+
 def init_db():
     conn = get_conn()
     cur = conn.cursor()
@@ -67,6 +196,12 @@ def init_db():
     ON worker_shifts(worker_id, is_active)
     """)
 
+    # Счёт упаковок за сутки (загрузка счётчика и сверка) идёт по start_time.
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_sessions_start_time
+    ON sessions(start_time)
+    """)
+
     # Минимальная таблица событий (events).
     # Зачем: хранит факты смены состояний таймера и heartbeat,
     # чтобы считать work/idle по событиям, а не по "тикерам".
@@ -113,6 +248,11 @@ def init_db():
         cur.execute("ALTER TABLE pack_sessions ADD COLUMN current_step_index INTEGER")
     if "total_steps" not in pack_columns:
         cur.execute("ALTER TABLE pack_sessions ADD COLUMN total_steps INTEGER")
+    # Станция (стол): у каждой своя FSM. Старые строки относим к станции по умолчанию.
+    if "station_id" not in pack_columns:
+        cur.execute(
+            "ALTER TABLE pack_sessions ADD COLUMN station_id TEXT NOT NULL DEFAULT 'default'"
+        )
 
     cur.execute("""
     CREATE TABLE IF NOT EXISTS pack_events (
@@ -124,6 +264,22 @@ def init_db():
         sku TEXT
     )
     """)
+    cur.execute("PRAGMA table_info(pack_events)")
+    if "station_id" not in [row["name"] for row in cur.fetchall()]:
+        cur.execute(
+            "ALTER TABLE pack_events ADD COLUMN station_id TEXT NOT NULL DEFAULT 'default'"
+        )
+
+    # Последняя сессия станции — ORDER BY id DESC LIMIT 1 по индексу, без скана таблицы.
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_pack_sessions_station
+    ON pack_sessions(station_id, id)
+    """)
+    _init_change_counter(cur, "pack_sessions")
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_pack_events_session
+    ON pack_events(session_id, id)
+    """)
 
     # Таблица сменных заданий для упаковки.
     # Мы сохраняем список SKU одной строкой JSON,
@@ -201,6 +357,115 @@ def init_db():
         updated_at INTEGER NOT NULL
     )
     """)
+    _init_sku_catalog_fts(cur)
+
+    # План выкладки SKU: шаги LAYOUT по порядку (PACKING — в обратном порядке).
+    # x/y/w/h — геометрия слота в долях кадра; NULL — считаем по имени слота.
+    # plan_version растёт при каждой замене плана SKU (ключ кэша планов).
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS layout_plans (
+        sku TEXT NOT NULL,
+        step_index INTEGER NOT NULL,
+        slot TEXT NOT NULL,
+        part_code TEXT NOT NULL,
+        x REAL,
+        y REAL,
+        w REAL,
+        h REAL,
+        plan_version INTEGER NOT NULL,
+        updated_at INTEGER NOT NULL,
+        PRIMARY KEY (sku, step_index)
+    )
+    """)
+
+    # Квитанции пакетных событий (/events/batch): повтор с тем же
+    # idempotency_key возвращает сохранённый результат, а не применяет событие снова.
+    # Ключ генерирует клиент станции, поэтому уникален он только в пределах станции.
+    cur.execute("PRAGMA table_info(event_receipts)")
+    receipt_pk = [row["name"] for row in cur.fetchall() if row["pk"]]
+    if receipt_pk == ["idempotency_key"]:
+        # Старая схема (ключ глобальный): переносим квитанции в новую таблицу.
+        cur.execute("ALTER TABLE event_receipts RENAME TO event_receipts_old")
+        cur.execute("DROP INDEX IF EXISTS idx_event_receipts_created")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS event_receipts (
+        station_id TEXT NOT NULL,
+        idempotency_key TEXT NOT NULL,
+        type TEXT NOT NULL,
+        result_json TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (station_id, idempotency_key)
+    )
+    """)
+    if receipt_pk == ["idempotency_key"]:
+        cur.execute("""
+        INSERT OR IGNORE INTO event_receipts(station_id, idempotency_key, type, result_json, created_at)
+        SELECT station_id, idempotency_key, type, result_json, created_at FROM event_receipts_old
+        """)
+        cur.execute("DROP TABLE event_receipts_old")
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_event_receipts_created
+    ON event_receipts(created_at)
+    """)
+
+    # Чекпоинты replay pack_events -> pack_sessions (services.pack_replay):
+    # id последнего учтённого события и незавершённые на тот момент сессии.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS pack_replay_checkpoints (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        last_event_id INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        open_sessions_json TEXT NOT NULL
+    )
+    """)
+
+    # Материализованные длительности шагов (services.step_analytics):
+    # строка на событие STEP_COMPLETED, длительность — от предыдущего события сессии.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS step_cycle_times (
+        event_id INTEGER PRIMARY KEY,
+        session_id INTEGER NOT NULL,
+        ts REAL NOT NULL,
+        duration_sec REAL NOT NULL,
+        sku TEXT NOT NULL,
+        station_id TEXT NOT NULL,
+        worker_id TEXT NOT NULL,
+        phase TEXT NOT NULL,
+        step_id TEXT NOT NULL,
+        slot TEXT,
+        part_code TEXT
+    )
+    """)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_step_cycle_times_ts
+    ON step_cycle_times(ts)
+    """)
+    # Водяные знаки инкрементальных пересчётов: до какого события уже учтено.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS analytics_watermarks (
+        name TEXT PRIMARY KEY,
+        last_event_id INTEGER NOT NULL
+    )
+    """)
+
+    # Статистика времени упаковки: по SKU (worker_id='') и по сотруднику × SKU.
+    # Храним накопленное состояние (Уэлфорд + маркеры P²), а не сырые значения.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS pack_time_stats (
+        sku TEXT NOT NULL,
+        worker_id TEXT NOT NULL DEFAULT '',
+        count INTEGER NOT NULL,
+        mean REAL NOT NULL,
+        m2 REAL NOT NULL,
+        min_sec REAL,
+        max_sec REAL,
+        last_sec REAL,
+        last_ts REAL,
+        p50_json TEXT,
+        p90_json TEXT,
+        PRIMARY KEY (sku, worker_id)
+    )
+    """)
 
     # Создаём дефолтную строку мастер-сессии.
     # Это упрощает обновления: всегда есть одна запись id=1.
@@ -239,6 +504,23 @@ def set_kiosk_setting(key: str, value: int) -> None:
     conn.close()
 
 
+def set_kiosk_settings(values: dict[str, int]) -> None:
+    # Несколько настроек одной транзакцией (один коммит на сохранение формы мастера).
+    with transaction() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO kiosk_settings(key, value) VALUES (?, ?)",
+            [(key, int(value)) for key, value in values.items()],
+        )
+
+
+def list_kiosk_settings() -> dict[str, int]:
+    # Все настройки разом — для загрузки кэша core.kiosk_settings.
+    conn = get_conn()
+    rows = conn.execute("SELECT key, value FROM kiosk_settings").fetchall()
+    conn.close()
+    return {row["key"]: int(row["value"] or 0) for row in rows}
+
+
 def get_kiosk_settings(keys: list[str]) -> dict[str, int]:
     # Массовое чтение настроек.
     # Это ускоряет UI-запросы и упрощает обработку.
@@ -333,33 +615,127 @@ def update_master_last_active(last_active_ts: int) -> None:
     conn.close()
 
 
-def list_sku_catalog(search: str | None = None, include_inactive: bool = False) -> list[dict]:
+def _init_sku_catalog_fts(cur: sqlite3.Cursor) -> None:
+    # Полнотекстовый индекс каталога (FTS5, external content): хранит только токены,
+    # строки берёт из sku_catalog. Триггеры держат его в синхроне при любой записи.
+    # Если SQLite собран без FTS5 — поиск работает через LIKE (см. list_sku_catalog).
+    exists = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='sku_catalog_fts'"
+    ).fetchone()
+    if exists:
+        return
+    try:
+        cur.execute("""
+        CREATE VIRTUAL TABLE sku_catalog_fts USING fts5(
+            sku_code, name, model_code,
+            content='sku_catalog', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='1 2 3'
+        )
+        """)
+    except sqlite3.OperationalError:
+        return
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS sku_catalog_fts_ai AFTER INSERT ON sku_catalog BEGIN
+        INSERT INTO sku_catalog_fts(rowid, sku_code, name, model_code)
+        VALUES (new.id, new.sku_code, new.name, new.model_code);
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS sku_catalog_fts_ad AFTER DELETE ON sku_catalog BEGIN
+        INSERT INTO sku_catalog_fts(sku_catalog_fts, rowid, sku_code, name, model_code)
+        VALUES ('delete', old.id, old.sku_code, old.name, old.model_code);
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS sku_catalog_fts_au
+    AFTER UPDATE OF sku_code, name, model_code ON sku_catalog BEGIN
+        INSERT INTO sku_catalog_fts(sku_catalog_fts, rowid, sku_code, name, model_code)
+        VALUES ('delete', old.id, old.sku_code, old.name, old.model_code);
+        INSERT INTO sku_catalog_fts(rowid, sku_code, name, model_code)
+        VALUES (new.id, new.sku_code, new.name, new.model_code);
+    END
+    """)
+    # Каталог, созданный до индекса, индексируем один раз.
+    cur.execute("INSERT INTO sku_catalog_fts(sku_catalog_fts) VALUES ('rebuild')")
+
+
+SKU_CATALOG_COLUMNS = (
+    "id, sku_code, name, model_code, width_cm, fabric_code, color_code, "
+    "is_active, created_at, updated_at"
+)
+# Вес совпадения по колонкам индекса (sku_code, name, model_code) в bm25: код важнее названия.
+# Сортировка по колонке rank (а не по bm25() в ORDER BY) идёт внутри FTS5 — вдвое быстрее
+# на запросах, которые совпадают с большей частью каталога.
+SKU_SEARCH_WEIGHTS = (10.0, 1.0, 5.0)
+_SKU_SEARCH_RANK = "bm25({})".format(", ".join(str(weight) for weight in SKU_SEARCH_WEIGHTS))
+
+
+def sku_fts_query(search: str) -> str | None:
+    """
+    Запрос FTS5 из строки поиска: каждое слово — префикс, слова через AND.
+
+    "кров 160" -> '"кров"* "160"*'. None — в строке нет ни одного слова.
+    """
+    terms = re.findall(r"\w+", search.lower())
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def list_sku_catalog(
+    search: str | None = None,
+    include_inactive: bool = False,
+    limit: int | None = None,
+    offset: int = 0,
+) -> list[dict]:
     """
     Возвращает список SKU из каталога.
 
     По умолчанию показываем только активные позиции,
     чтобы оператор не видел архивные записи.
+    С search — поиск по индексу FTS5 (префиксы слов в коде, названии и модели),
+    лучшие совпадения первыми; без FTS5 — прежний LIKE по подстроке.
+    limit/offset — страница результата (None — все строки).
     """
     conn = get_conn()
-    cur = conn.cursor()
+    page_sql = " LIMIT ? OFFSET ?" if limit is not None else ""
+    page = [int(limit), int(offset)] if limit is not None else []
+    active_sql = "" if include_inactive else " AND c.is_active = 1"
+    fts_query = sku_fts_query(search) if search else None
+    if fts_query:
+        columns = ", ".join(f"c.{name.strip()}" for name in SKU_CATALOG_COLUMNS.split(","))
+        try:
+            rows = conn.execute(
+                f"""SELECT {columns}
+                    FROM sku_catalog_fts f
+                    JOIN sku_catalog c ON c.id = f.rowid
+                    WHERE sku_catalog_fts MATCH ? AND f.rank MATCH ?{active_sql}
+                    ORDER BY f.rank{page_sql}""",
+                [fts_query, _SKU_SEARCH_RANK, *page],
+            ).fetchall()
+            conn.close()
+            return [dict(row) for row in rows]
+        except sqlite3.OperationalError:
+            # Нет FTS5 (или индекса) — ниже тот же поиск через LIKE.
+            pass
+
     params: list = []
     where = []
     if not include_inactive:
         where.append("is_active = 1")
-    if search:
+    if search and search.strip():
         where.append("(sku_code LIKE ? OR name LIKE ? OR model_code LIKE ?)")
         needle = f"%{search.strip()}%"
         params.extend([needle, needle, needle])
     where_sql = " WHERE " + " AND ".join(where) if where else ""
-    cur.execute(
-        f"""SELECT id, sku_code, name, model_code, width_cm, fabric_code, color_code,
-                is_active, created_at, updated_at
+    rows = conn.execute(
+        f"""SELECT {SKU_CATALOG_COLUMNS}
            FROM sku_catalog
            {where_sql}
-           ORDER BY updated_at DESC, id DESC""",
-        params,
-    )
-    rows = cur.fetchall()
+           ORDER BY updated_at DESC, id DESC{page_sql}""",
+        params + page,
+    ).fetchall()
     conn.close()
     return [dict(row) for row in (rows or [])]
 
@@ -405,6 +781,17 @@ def create_sku_catalog_item(
     return int(sku_id or 0)
 
 
+def get_sku_catalog_item(sku_id: int) -> dict | None:
+    """Одна запись каталога по id (None — нет такой)."""
+    conn = get_conn()
+    row = conn.execute(
+        f"SELECT {SKU_CATALOG_COLUMNS} FROM sku_catalog WHERE id=?",
+        [int(sku_id)],
+    ).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
 def update_sku_catalog_item(
     sku_id: int,
     name: str | None = None,
@@ -438,6 +825,45 @@ def update_sku_catalog_item(
     conn.close()
 
 
+def upsert_sku_catalog(rows: list[tuple]) -> dict[str, int]:
+    """
+    Массовая запись каталога одной транзакцией (импорт из 1С).
+
+    rows: (sku_code, name, model_code, width_cm, fabric_code, color_code, is_active).
+    Новый sku_code добавляется, существующий обновляется; строка, которая ничего
+    не меняет, не трогается (updated_at и индекс поиска остаются прежними).
+    Возвращает {"inserted", "updated", "unchanged"}.
+    """
+    if not rows:
+        return {"inserted": 0, "updated": 0, "unchanged": 0}
+    ts = int(time.time())
+    with transaction() as conn:
+        before = conn.execute("SELECT COUNT(*) FROM sku_catalog").fetchone()[0]
+        cur = conn.executemany(
+            """INSERT INTO sku_catalog(
+                   sku_code, name, model_code, width_cm, fabric_code, color_code,
+                   is_active, created_at, updated_at
+               )
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(sku_code) DO UPDATE SET
+                   name=excluded.name,
+                   model_code=excluded.model_code,
+                   width_cm=excluded.width_cm,
+                   fabric_code=excluded.fabric_code,
+                   color_code=excluded.color_code,
+                   is_active=excluded.is_active,
+                   updated_at=excluded.updated_at
+               WHERE (name, model_code, width_cm, fabric_code, color_code, is_active)
+                   IS NOT (excluded.name, excluded.model_code, excluded.width_cm,
+                           excluded.fabric_code, excluded.color_code, excluded.is_active)""",
+            [(*row, ts, ts) for row in rows],
+        )
+        # rowcount — вставленные + реально обновлённые строки (без изменений триггеров).
+        changed = cur.rowcount
+        inserted = conn.execute("SELECT COUNT(*) FROM sku_catalog").fetchone()[0] - before
+    return {"inserted": inserted, "updated": changed - inserted, "unchanged": len(rows) - changed}
+
+
 def get_active_sku_codes() -> set[str]:
     """
     Возвращает множество активных SKU из каталога.
@@ -452,6 +878,69 @@ def get_active_sku_codes() -> set[str]:
     return {row["sku_code"] for row in (rows or [])}
 
 
+def load_layout_plans(skus: list[str] | None = None) -> dict[str, tuple[int, list[dict]]]:
+    """
+    Возвращает планы выкладки {sku: (plan_version, шаги по порядку)}.
+
+    skus=None — все планы; иначе только указанные (одним запросом).
+    SKU без строк в таблице в результат не попадают.
+    """
+    conn = get_conn()
+    cur = conn.cursor()
+    sql = """SELECT sku, step_index, slot, part_code, x, y, w, h, plan_version
+             FROM layout_plans"""
+    params: list = []
+    if skus is not None:
+        sql += " WHERE sku IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps(list(skus), ensure_ascii=False))
+    cur.execute(sql + " ORDER BY sku, step_index", params)
+    rows = cur.fetchall()
+    conn.close()
+    plans: dict[str, tuple[int, list[dict]]] = {}
+    for row in rows or []:
+        version, steps = plans.setdefault(row["sku"], (int(row["plan_version"]), []))
+        steps.append(dict(row))
+    return plans
+
+
+def replace_layout_plan(sku: str, steps: list[dict]) -> int:
+    """
+    Заменяет план выкладки SKU целиком и возвращает новый plan_version.
+
+    Пустой steps удаляет план (SKU вернётся к плану по умолчанию).
+    """
+    ts = int(time.time())
+    with transaction() as conn:
+        row = conn.execute(
+            "SELECT COALESCE(MAX(plan_version), 0) AS version FROM layout_plans WHERE sku=?",
+            [sku],
+        ).fetchone()
+        version = int(row["version"]) + 1
+        conn.execute("DELETE FROM layout_plans WHERE sku=?", [sku])
+        conn.executemany(
+            """INSERT INTO layout_plans(
+                   sku, step_index, slot, part_code, x, y, w, h, plan_version, updated_at
+               )
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            [
+                [
+                    sku,
+                    idx,
+                    step["slot"],
+                    step["part_code"],
+                    step.get("x"),
+                    step.get("y"),
+                    step.get("w"),
+                    step.get("h"),
+                    version,
+                    ts,
+                ]
+                for idx, step in enumerate(steps)
+            ],
+        )
+    return version
+
+
 def get_report_rows(report_type: str, date_from: str, date_to: str) -> list[dict]:
     """
     Формирует строки отчёта по типу и диапазону дат.
@@ -536,7 +1025,6 @@ def save_session(session) -> int:
         session.worktime_sec,
         session.downtime_sec,
         session.status,
-        getattr(session, "shift_id", None),
         shift_id,
     ])
 
@@ -553,6 +1041,7 @@ def add_event(
     shift_id: int | None = None,
     session_id: int | None = None,
     worker_id: str | None = None,
+    conn: sqlite3.Connection | None = None,
 ) -> int:
     """
 
@@ -566,9 +1055,12 @@ def add_event(
     - Что делаем: записываем тип события и время (ts).
     - Зачем: события нужны для вычисления work/idle и heartbeat-авто-idle.
     - Как использовать: вызовы из /api/kiosk/timer/state и /api/kiosk/timer/heartbeat.
+    - conn передаётся внутри transaction(): тогда коммит делает вызывающий.
 
     """
-    conn = get_conn()
+    own_conn = conn is None
+    if own_conn:
+        conn = get_conn()
     cur = conn.cursor()
     cur.execute(
         """INSERT INTO events(ts, type, payload_json, shift_id, session_id, worker_id)
@@ -576,11 +1068,45 @@ def add_event(
         [ts, event_type, payload_json or "", shift_id, session_id, worker_id],
     )
     event_id = cur.lastrowid
-    conn.commit()
-    conn.close()
+    if own_conn:
+        conn.commit()
+        conn.close()
     return int(event_id or 0)
 
 
+def get_event_receipts(conn: sqlite3.Connection, station_id: str, keys: list[str]) -> dict[str, dict]:
+    # Сохранённые результаты по ключам идемпотентности станции (одним запросом).
+    if not keys:
+        return {}
+    rows = conn.execute(
+        """SELECT idempotency_key, result_json FROM event_receipts
+           WHERE station_id = ? AND idempotency_key IN (SELECT value FROM json_each(?))""",
+        [station_id, json.dumps(keys, ensure_ascii=False)],
+    ).fetchall()
+    return {row["idempotency_key"]: json.loads(row["result_json"]) for row in rows}
+
+
+def add_event_receipt(
+    conn: sqlite3.Connection,
+    idempotency_key: str,
+    station_id: str,
+    event_type: str,
+    result: dict,
+    ts: float,
+) -> None:
+    conn.execute(
+        """INSERT INTO event_receipts(station_id, idempotency_key, type, result_json, created_at)
+           VALUES (?, ?, ?, ?, ?)""",
+        [station_id, idempotency_key, event_type, json.dumps(result, ensure_ascii=False), ts],
+    )
+
+
+def prune_event_receipts(conn: sqlite3.Connection, older_than: float) -> int:
+    # Клиент переигрывает очередь минуты/часы, а не недели — старые квитанции не нужны.
+    cur = conn.execute("DELETE FROM event_receipts WHERE created_at < ?", [older_than])
+    return cur.rowcount
+
+
 def create_pack_session(
     sku: str,
     ts: float,
@@ -590,23 +1116,29 @@ def create_pack_session(
     phase: str | None = None,
     current_step_index: int | None = None,
     total_steps: int | None = None,
+    station_id: str = DEFAULT_STATION,
+    conn: sqlite3.Connection | None = None,
 ) -> int:
     # Здесь мы сохраняем старт упаковки в БД.
     # Важно фиксировать phase/current_step_index/total_steps сразу,
     # чтобы UI мог корректно показывать прогресс даже после перезапуска сервиса.
-    conn = get_conn()
+    # conn передаётся внутри transaction(): тогда коммит делает вызывающий.
+    own_conn = conn is None
+    if own_conn:
+        conn = get_conn()
     cur = conn.cursor()
     cur.execute(
         """INSERT INTO pack_sessions(
                sku, start_time, end_time, state, shift_id, worker_id,
-               phase, current_step_index, total_steps
+               phase, current_step_index, total_steps, station_id
            )
-           VALUES (?, ?, NULL, ?, ?, ?, ?, ?, ?)""",
-        [sku, ts, state, shift_id, worker_id, phase, current_step_index, total_steps],
+           VALUES (?, ?, NULL, ?, ?, ?, ?, ?, ?, ?)""",
+        [sku, ts, state, shift_id, worker_id, phase, current_step_index, total_steps, station_id],
     )
     session_id = cur.lastrowid
-    conn.commit()
-    conn.close()
+    if own_conn:
+        conn.commit()
+        conn.close()
     return int(session_id or 0)
 
 
@@ -653,6 +1185,57 @@ def update_pack_session_progress(
     conn.close()
 
 
+def cas_pack_session_state(
+    conn: sqlite3.Connection,
+    session_id: int,
+    expected_state: str,
+    state: str,
+    end_time: float | None = None,
+) -> bool:
+    # Compare-and-set перехода FSM внутри transaction().
+    # False — состояние уже сменил другой клиент (киоск/планшет), переход не применён.
+    cur = conn.execute(
+        """UPDATE pack_sessions
+           SET state=?, end_time=COALESCE(?, end_time)
+           WHERE id=? AND state=?""",
+        [state, end_time, session_id, expected_state],
+    )
+    return cur.rowcount == 1
+
+
+def cas_pack_session_progress(
+    conn: sqlite3.Connection,
+    session_id: int,
+    expected_phase: str,
+    expected_step_index: int,
+    phase: str,
+    current_step_index: int,
+    total_steps: int,
+) -> bool:
+    # Compare-and-set прогресса шагов: шаг засчитывается ровно один раз,
+    # даже если оператор и камера закрывают его одновременно.
+    # NULL в старых строках трактуем как начало LAYOUT (как и сервис упаковки).
+    cur = conn.execute(
+        """UPDATE pack_sessions
+           SET phase=?, current_step_index=?, total_steps=?
+           WHERE id=? AND state IN ('started', 'box_closed')
+             AND COALESCE(phase, 'LAYOUT')=? AND COALESCE(current_step_index, 0)=?""",
+        [phase, current_step_index, total_steps, session_id, expected_phase, expected_step_index],
+    )
+    return cur.rowcount == 1
+
+
+def get_latest_pack_session_head(
+    conn: sqlite3.Connection, station_id: str = DEFAULT_STATION
+) -> tuple[int, str] | None:
+    # (id, state) последней сессии станции — для CAS при старте нового SKU.
+    row = conn.execute(
+        "SELECT id, state FROM pack_sessions WHERE station_id=? ORDER BY id DESC LIMIT 1",
+        [station_id],
+    ).fetchone()
+    return (int(row["id"]), row["state"]) if row else None
+
+
 def create_shift_plan(shift_id: int, name: str, created_at: float, items_json: str) -> int:
     # Создаём сменное задание для активной смены.
     # Храним список SKU в items_json, чтобы сохранять порядок и не терять данные.
@@ -714,50 +1297,133 @@ def add_pack_event(
     ts: float,
     payload_json: str = "",
     sku: str | None = None,
+    station_id: str = DEFAULT_STATION,
+    conn: sqlite3.Connection | None = None,
 ) -> int:
     # Сохраняем событие упаковки.
     # payload_json хранит подробности шага или перехода, чтобы не менять схему БД.
-    conn = get_conn()
+    own_conn = conn is None
+    if own_conn:
+        conn = get_conn()
     cur = conn.cursor()
     cur.execute(
-        """INSERT INTO pack_events(ts, type, payload_json, session_id, sku)
-           VALUES (?, ?, ?, ?, ?)""",
-        [ts, event_type, payload_json or "", session_id, sku],
+        """INSERT INTO pack_events(ts, type, payload_json, session_id, sku, station_id)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        [ts, event_type, payload_json or "", session_id, sku, station_id],
     )
     event_id = cur.lastrowid
+    if own_conn:
+        conn.commit()
+        conn.close()
+    return int(event_id or 0)
+
+
+def add_step_verified_event(
+    step_event_id: int,
+    session_id: int,
+    event_type: str,
+    ts: float,
+    payload_json: str,
+    sku: str | None = None,
+    station_id: str = DEFAULT_STATION,
+) -> bool:
+    # Результат фоновой проверки пишем, только если STEP_COMPLETED действительно
+    # закоммичен (пакет событий мог откатить шаг, пока шла проверка).
+    conn = get_conn()
+    cur = conn.execute(
+        """INSERT INTO pack_events(ts, type, payload_json, session_id, sku, station_id)
+           SELECT ?, ?, ?, ?, ?, ?
+           WHERE EXISTS (SELECT 1 FROM pack_events WHERE id=? AND session_id=?)""",
+        [ts, event_type, payload_json, session_id, sku, station_id, step_event_id, session_id],
+    )
+    written = cur.rowcount > 0
     conn.commit()
     conn.close()
-    return int(event_id or 0)
+    return written
+
+
+def count_failed_step_verifications(
+    session_id: int,
+    event_type: str,
+    conn: sqlite3.Connection | None = None,
+) -> int:
+    own_conn = conn is None
+    if own_conn:
+        conn = get_conn()
+    row = conn.execute(
+        """SELECT COUNT(*) AS n FROM pack_events
+           WHERE session_id=? AND type=? AND json_extract(payload_json, '$.failed') = 1""",
+        [session_id, event_type],
+    ).fetchone()
+    if own_conn:
+        conn.close()
+    return int(row["n"])
+
+
+def get_pack_session(session_id: int, conn: sqlite3.Connection | None = None) -> sqlite3.Row | None:
+    # Точное чтение сессии по ID — в отладке, сервисных сценариях и внутри
+    # транзакции перехода FSM (строка после CAS для кэша сессий).
+    own_conn = conn is None
+    if own_conn:
+        conn = get_conn()
+    row = conn.execute("SELECT * FROM pack_sessions WHERE id=?", [session_id]).fetchone()
+    if own_conn:
+        conn.close()
+    return row
 
 
-def get_pack_session(session_id: int) -> sqlite3.Row | None:
-    # Точное чтение сессии по ID — используется в отладке и сервисных сценариях.
+def list_pack_events(session_id: int, limit: int = 6) -> list[sqlite3.Row]:
+    # Последние события упаковки по сессии (новые сверху) — для ленты событий в UI.
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("SELECT * FROM pack_sessions WHERE id=?", [session_id])
-    row = cur.fetchone()
+    cur.execute(
+        """SELECT id, ts, type, payload_json, session_id, sku
+           FROM pack_events
+           WHERE session_id=?
+           ORDER BY id DESC
+           LIMIT ?""",
+        [session_id, int(limit)],
+    )
+    rows = cur.fetchall()
     conn.close()
-    return row
+    return list(rows or [])
 
 
-def get_latest_pack_session() -> sqlite3.Row | None:
-    # Берём последнюю сессию по id, чтобы восстановить контекст после перезапуска.
+def get_latest_pack_session(station_id: str = DEFAULT_STATION) -> sqlite3.Row | None:
+    # Берём последнюю сессию станции по id, чтобы восстановить контекст после перезапуска.
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("SELECT * FROM pack_sessions ORDER BY id DESC LIMIT 1")
+    cur.execute(
+        "SELECT * FROM pack_sessions WHERE station_id=? ORDER BY id DESC LIMIT 1",
+        [station_id],
+    )
     row = cur.fetchone()
     conn.close()
     return row
 
 
-def get_active_pack_session() -> sqlite3.Row | None:
+def list_latest_pack_sessions() -> list[sqlite3.Row]:
+    # Последняя сессия каждой станции одним запросом — для загрузки кэша при старте.
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        """SELECT * FROM pack_sessions
+           WHERE id IN (SELECT MAX(id) FROM pack_sessions GROUP BY station_id)"""
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return list(rows or [])
+
+
+def get_active_pack_session(station_id: str = DEFAULT_STATION) -> sqlite3.Row | None:
     # Активной считаем сессию в состояниях, где процесс ещё не завершён полностью.
     conn = get_conn()
     cur = conn.cursor()
     cur.execute(
         """SELECT * FROM pack_sessions
-           WHERE state IN ('started', 'box_closed')
-           ORDER BY id DESC LIMIT 1"""
+           WHERE station_id=? AND state IN ('started', 'box_closed')
+           ORDER BY id DESC LIMIT 1""",
+        [station_id],
     )
     row = cur.fetchone()
     conn.close()
@@ -951,6 +1617,258 @@ def count_sessions_since(start_time: float, worker_id: str | None = None) -> int
     return int(row["cnt"] if row else 0)
 
 
+def load_pack_time_stats() -> list[dict]:
+    # Вся статистика одним запросом: строк немного (SKU × сотрудники).
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM pack_time_stats")
+    rows = cur.fetchall() or []
+    conn.close()
+    return [dict(row) for row in rows]
+
+
+def upsert_pack_time_stats(rows: list[dict]) -> None:
+    # Общий ключ SKU и ключ сотрудника пишем одной транзакцией.
+    conn = get_conn()
+    conn.executemany(
+        """INSERT INTO pack_time_stats(
+               sku, worker_id, count, mean, m2, min_sec, max_sec,
+               last_sec, last_ts, p50_json, p90_json
+           )
+           VALUES (
+               :sku, :worker_id, :count, :mean, :m2, :min_sec, :max_sec,
+               :last_sec, :last_ts, :p50_json, :p90_json
+           )
+           ON CONFLICT(sku, worker_id) DO UPDATE SET
+               count=excluded.count,
+               mean=excluded.mean,
+               m2=excluded.m2,
+               min_sec=excluded.min_sec,
+               max_sec=excluded.max_sec,
+               last_sec=excluded.last_sec,
+               last_ts=excluded.last_ts,
+               p50_json=excluded.p50_json,
+               p90_json=excluded.p90_json""",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+
+
+def iter_pack_events(after_id: int = 0, chunk_size: int = 20000):
+    # Поток событий упаковки по возрастанию id кортежами
+    # (id, ts, type, session_id, sku, station_id): без sqlite3.Row и без
+    # загрузки всей таблицы в память — replay года событий идёт за секунды.
+    # Читаем порциями по id (keyset): между порциями не держим блокировку
+    # чтения, и вызывающий может писать в БД (чекпоинты, восстановление).
+    conn = sqlite3.connect(DB)
+    try:
+        while True:
+            rows = conn.execute(
+                """SELECT id, ts, type, session_id, sku, station_id
+                   FROM pack_events
+                   WHERE id > ?
+                   ORDER BY id
+                   LIMIT ?""",
+                [after_id, chunk_size],
+            ).fetchall()
+            if not rows:
+                break
+            after_id = rows[-1][0]
+            yield from rows
+    finally:
+        conn.close()
+
+
+PACK_SESSION_REPLAY_COLUMNS = (
+    "id", "station_id", "sku", "start_time", "end_time",
+    "state", "phase", "current_step_index", "total_steps",
+)
+
+
+def load_pack_sessions_by_id(ids: list[int], last_event_id: int) -> tuple[dict[int, tuple], set[int]]:
+    # Сессии по списку id кортежами в порядке PACK_SESSION_REPLAY_COLUMNS и id
+    # сессий, у которых уже есть события после last_event_id (replay их ещё
+    # не видел — сравнивать с ними нечего). Один SELECT — один снимок БД:
+    # строка и её события читаются согласованно, даже если станция пишет.
+    conn = sqlite3.connect(DB)
+    rows = conn.execute(
+        f"""SELECT {', '.join(PACK_SESSION_REPLAY_COLUMNS)},
+                   EXISTS (SELECT 1 FROM pack_events e
+                           WHERE e.session_id = s.id AND e.id > ?) AS moved
+            FROM pack_sessions s
+            WHERE id IN (SELECT value FROM json_each(?))""",
+        [last_event_id, json.dumps(list(ids))],
+    ).fetchall()
+    conn.close()
+    sessions = {int(row[0]): row[:-1] for row in rows if not row[-1]}
+    moved = {int(row[0]) for row in rows if row[-1]}
+    return sessions, moved
+
+
+def upsert_pack_sessions(rows: list[dict], last_event_id: int) -> int:
+    # Восстановление pack_sessions из replay одной транзакцией.
+    # CAS по журналу: строку переписываем, только если после last_event_id
+    # у сессии не появилось событий (иначе затёрли бы более новое состояние).
+    # BEGIN IMMEDIATE держит запись — между проверкой и записью события не добавятся.
+    with transaction() as conn:
+        moved = {
+            int(row["session_id"])
+            for row in conn.execute(
+                """SELECT DISTINCT session_id FROM pack_events
+                   WHERE id > ? AND session_id IN (SELECT value FROM json_each(?))""",
+                [last_event_id, json.dumps([row["id"] for row in rows])],
+            )
+        }
+        rows = [row for row in rows if row["id"] not in moved]
+        conn.executemany(
+            """INSERT INTO pack_sessions(
+                   id, station_id, sku, start_time, end_time,
+                   state, phase, current_step_index, total_steps
+               )
+               VALUES (
+                   :id, :station_id, :sku, :start_time, :end_time,
+                   :state, :phase, :current_step_index, :total_steps
+               )
+               ON CONFLICT(id) DO UPDATE SET
+                   station_id=excluded.station_id,
+                   sku=excluded.sku,
+                   start_time=excluded.start_time,
+                   end_time=excluded.end_time,
+                   state=excluded.state,
+                   phase=excluded.phase,
+                   current_step_index=excluded.current_step_index,
+                   total_steps=excluded.total_steps""",
+            rows,
+        )
+    return len(rows)
+
+
+def get_replay_checkpoint() -> dict | None:
+    conn = get_conn()
+    row = conn.execute(
+        "SELECT * FROM pack_replay_checkpoints ORDER BY id DESC LIMIT 1"
+    ).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def save_replay_checkpoint(last_event_id: int, open_sessions_json: str, keep: int = 5) -> None:
+    # Храним несколько последних чекпоинтов: старые для incremental-replay не нужны.
+    with transaction() as conn:
+        conn.execute(
+            """INSERT INTO pack_replay_checkpoints(last_event_id, created_at, open_sessions_json)
+               VALUES (?, ?, ?)""",
+            [last_event_id, time.time(), open_sessions_json],
+        )
+        conn.execute(
+            """DELETE FROM pack_replay_checkpoints
+               WHERE id NOT IN (
+                   SELECT id FROM pack_replay_checkpoints ORDER BY id DESC LIMIT ?
+               )""",
+            [keep],
+        )
+
+
+def get_analytics_watermark(name: str) -> int:
+    conn = get_conn()
+    row = conn.execute(
+        "SELECT last_event_id FROM analytics_watermarks WHERE name=?", [name]
+    ).fetchone()
+    conn.close()
+    return int(row["last_event_id"]) if row else 0
+
+
+def get_max_pack_event_id() -> int:
+    conn = get_conn()
+    row = conn.execute("SELECT COALESCE(MAX(id), 0) AS id FROM pack_events").fetchone()
+    conn.close()
+    return int(row["id"])
+
+
+def load_step_cycle_source(after_id: int, upto_id: int, skip_type: str = "") -> list[tuple]:
+    """
+    События (after_id, upto_id] и для каждой их сессии — последнее событие
+    до after_id (от него считается длительность первого нового шага).
+
+    Кортежи (id, session_id, ts, type, payload_json, sku, station_id, worker_id),
+    отсортированные по (session_id, id). События типа skip_type (результаты
+    фоновой проверки) не считаются действиями оператора и пропускаются.
+    """
+    conn = sqlite3.connect(DB)
+    rows = conn.execute(
+        """WITH fresh AS (
+               SELECT DISTINCT session_id FROM pack_events WHERE id > ? AND id <= ?
+           ),
+           prev AS (
+               SELECT (SELECT MAX(e.id) FROM pack_events e
+                       WHERE e.session_id = fresh.session_id AND e.id <= ?
+                         AND e.type != ?) AS id
+               FROM fresh
+           )
+           SELECT e.id, e.session_id, e.ts, e.type, e.payload_json,
+                  COALESCE(s.sku, e.sku, ''), e.station_id, COALESCE(s.worker_id, '')
+           FROM pack_events e
+           LEFT JOIN pack_sessions s ON s.id = e.session_id
+           WHERE ((e.id > ? AND e.id <= ?) OR e.id IN (SELECT id FROM prev))
+             AND e.type != ?
+           ORDER BY e.session_id, e.id""",
+        [after_id, upto_id, after_id, skip_type, after_id, upto_id, skip_type],
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def save_step_cycle_times(rows: list[tuple], watermark_name: str, last_event_id: int) -> None:
+    # Строки и водяной знак одной транзакцией: повторный пересчёт не задвоит данные.
+    with transaction() as conn:
+        conn.executemany(
+            """INSERT OR REPLACE INTO step_cycle_times(
+                   event_id, session_id, ts, duration_sec, sku, station_id,
+                   worker_id, phase, step_id, slot, part_code
+               )
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            rows,
+        )
+        conn.execute(
+            """INSERT INTO analytics_watermarks(name, last_event_id) VALUES (?, ?)
+               ON CONFLICT(name) DO UPDATE SET last_event_id=excluded.last_event_id""",
+            [watermark_name, last_event_id],
+        )
+
+
+STEP_CYCLE_COLUMNS = (
+    "sku", "station_id", "worker_id", "phase", "step_id", "slot", "part_code", "duration_sec",
+)
+
+
+def load_step_cycle_times(start_ts: float, end_ts: float) -> list[tuple]:
+    # Длительности шагов за период кортежами в порядке STEP_CYCLE_COLUMNS.
+    conn = sqlite3.connect(DB)
+    rows = conn.execute(
+        f"""SELECT {', '.join(STEP_CYCLE_COLUMNS)} FROM step_cycle_times
+            WHERE ts BETWEEN ? AND ?""",
+        [start_ts, end_ts],
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def count_sessions_by_worker(start_time: float, end_time: float) -> dict[str, int]:
+    # Одним запросом: число сессий в интервале по каждому сотруднику.
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        """SELECT COALESCE(worker_id, '') AS worker_id, COUNT(*) AS cnt FROM sessions
+           WHERE start_time >= ? AND start_time < ?
+           GROUP BY COALESCE(worker_id, '')""",
+        [start_time, end_time],
+    )
+    rows = cur.fetchall() or []
+    conn.close()
+    return {row["worker_id"]: int(row["cnt"]) for row in rows}
+
+
 
 def get_shift_report(shift_id: int) -> dict:
     """
@@ -0,0 +1,92 @@
+"""
+Асинхронный доступ к SQLite для эндпоинтов FastAPI.
+
+Зачем:
+- эндпоинты API — async def, а core.storage и services.* — блокирующий sqlite3;
+  медленный запрос или fsync в цикле событий останавливает весь uvicorn
+  (push-состояние, опрос /state, остальные запросы);
+- блокирующая работа уходит в отдельный ограниченный пул потоков: медленный
+  отчёт занимает один поток пула, а цикл событий продолжает отвечать.
+
+Как устроено:
+- у каждого потока пула своё постоянное соединение (storage.get_conn() в нём
+  не открывает файл и не разбирает схему заново); после каждой задачи
+  незавершённая транзакция откатывается, чтобы ошибка не держала блокировку;
+- contextvars (станция запроса, внешняя транзакция) копируются в поток;
+- пул отдельный от asyncio.to_thread: долгие CPU-задачи (replay, аналитика)
+  не отнимают потоки у запросов к БД.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from core import storage
+
+DEFAULT_WORKERS = 4
+
+T = TypeVar("T")
+
+
+def _run_task(fn: Callable[..., T], args: tuple, kwargs: dict) -> T:
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        storage.release_thread_connection()
+
+
+class StorageExecutor:
+    """Ограниченный пул потоков для блокирующих вызовов SQLite."""
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS) -> None:
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._pool: ThreadPoolExecutor | None = None
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        # Пул создаётся при первой задаче и заново после shutdown()
+        # (повторный запуск приложения в том же процессе — тесты).
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="storage",
+                    initializer=storage.enable_thread_connection,
+                )
+            return self._pool
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Выполняет fn(*args, **kwargs) в пуле и ждёт результат, не блокируя цикл событий."""
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(self._get_pool(), ctx.run, _run_task, fn, args, kwargs)
+
+    def shutdown(self) -> None:
+        """Дожидается начатых задач и останавливает потоки пула (при остановке API)."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+def offload(fn: Callable[..., T]) -> Callable[..., Any]:
+    """
+    Декоратор для синхронного тела эндпоинта: FastAPI видит async-функцию
+    с той же сигнатурой, а тело выполняется в пуле storage_executor.
+    """
+
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        return await storage_executor.run(fn, *args, **kwargs)
+
+    return wrapper
+
+
+# Глобальный пул для всего процесса API (размер — KZ_STORAGE_WORKERS)
+storage_executor = StorageExecutor(int(os.getenv("KZ_STORAGE_WORKERS", str(DEFAULT_WORKERS))))
@@ -0,0 +1,254 @@
+"""
+Детектор в отдельном процессе.
+
+Зачем:
+- импорт core.detector тянет ultralytics и torch (секунды и сотни МБ);
+- инференс в потоке API конкурирует с эндпоинтами за GIL.
+
+Как устроено:
+- дочерний процесс (spawn) сам читает камеру (core.camera.FrameSource),
+  прогоняет кадры через Detector и кладёт компактные результаты в очередь;
+- процесс API (DetectorWorkerSupervisor) только читает очередь, раздаёт
+  результаты обработчикам (движок занятости слотов и т.п.) и перезапускает
+  воркер, если тот упал. torch в процессе API никогда не импортируется.
+"""
+
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+WORKER_ENABLED_ENV = "KZ_DETECTOR_WORKER"
+
+DEFAULT_CAMERA_URL = "http://127.0.0.1:8080/stream"
+DEFAULT_MODEL_PATH = "yolov8n.pt"
+DEFAULT_FPS = 5.0
+DEFAULT_IMGSZ = 640
+DEFAULT_QR_INTERVAL_SEC = 0.5
+
+
+def is_worker_enabled() -> bool:
+    # Воркер включается явно: на машине без камеры/модели API должен стартовать как раньше.
+    return os.getenv(WORKER_ENABLED_ENV, "0") == "1"
+
+
+def load_config_from_env() -> dict:
+    return {
+        "camera_url": os.getenv("KZ_CAMERA_URL", DEFAULT_CAMERA_URL),
+        "model_path": os.getenv("KZ_DETECTOR_MODEL", DEFAULT_MODEL_PATH),
+        "fps": float(os.getenv("KZ_DETECTOR_FPS", str(DEFAULT_FPS))),
+        "imgsz": int(os.getenv("KZ_DETECTOR_IMGSZ", str(DEFAULT_IMGSZ))),
+        # Зона стола для проверки TABLE_EMPTY: "x,y,w,h" в долях кадра.
+        "table_roi": _parse_roi(os.getenv("KZ_TABLE_ROI", "0,0,1,1")),
+        # Сканирование QR камерой: выключено, пока не задана зона KZ_QR_ROI.
+        "qr_roi": _parse_roi(os.getenv("KZ_QR_ROI")) if os.getenv("KZ_QR_ROI") else None,
+        "qr_interval_sec": float(os.getenv("KZ_QR_INTERVAL_SEC", str(DEFAULT_QR_INTERVAL_SEC))),
+    }
+
+
+def _parse_roi(text: str) -> tuple[float, float, float, float]:
+    try:
+        x, y, w, h = (float(part) for part in text.split(","))
+    except ValueError:
+        return (0.0, 0.0, 1.0, 1.0)
+    return (x, y, w, h)
+
+
+def _worker_main(results, stop_event, config: dict) -> None:
+    """
+    Точка входа дочернего процесса.
+
+    Импорты тяжёлых модулей — только здесь, чтобы процесс API их не видел.
+    Результат кадра: {"ts", "frame_id", "frame_w", "frame_h", "detections", "table_thumb", "qr_codes"}.
+    table_thumb — уменьшенный серый снимок зоны стола (для TABLE_EMPTY).
+    qr_codes — строки QR-кодов из зоны qr_roi; сканируем не на каждом кадре,
+    а не чаще qr_interval_sec (декодирование QR дороже детекции на малом imgsz).
+    """
+    from core.camera import FrameSource
+    from core.detector import Detector
+    from services.qr_scanner import ScanThrottle, decode_qr_codes
+    from services.table_empty import table_thumbnail
+
+    detector = Detector(
+        model_path=config["model_path"],
+        imgsz=int(config.get("imgsz") or DEFAULT_IMGSZ),
+    )
+    source = FrameSource(config["camera_url"])
+    source.start()
+    table_roi = tuple(config.get("table_roi") or (0.0, 0.0, 1.0, 1.0))
+    qr_roi = tuple(config["qr_roi"]) if config.get("qr_roi") else None
+    qr_throttle = ScanThrottle(float(config.get("qr_interval_sec") or DEFAULT_QR_INTERVAL_SEC))
+    min_interval = 1.0 / max(float(config.get("fps") or DEFAULT_FPS), 0.1)
+    last_frame_id = 0
+    try:
+        while not stop_event.is_set():
+            started = time.time()
+            frame_id, frame_ts, frame = source.latest()
+            if frame is not None and frame_id != last_frame_id:
+                last_frame_id = frame_id
+                detections = detector.detect(frame)
+                frame_h, frame_w = frame.shape[:2]
+                qr_codes: list[str] = []
+                if qr_roi is not None and qr_throttle.ready(started):
+                    try:
+                        qr_codes = decode_qr_codes(frame, qr_roi)
+                    except Exception as exc:  # noqa: BLE001 — сбой QR не должен останавливать детекцию
+                        print(f"[DetectorWorker] Ошибка декодирования QR: {exc}")
+                message = {
+                    "ts": frame_ts,
+                    "frame_id": frame_id,
+                    "frame_w": int(frame_w),
+                    "frame_h": int(frame_h),
+                    "detections": detections,
+                    "table_thumb": table_thumbnail(frame, table_roi),
+                    "qr_codes": qr_codes,
+                }
+                try:
+                    results.put_nowait(message)
+                except queue.Full:
+                    # API не успевает разбирать — пропускаем кадр, очередь не копим.
+                    pass
+            stop_event.wait(max(0.0, min_interval - (time.time() - started)))
+    finally:
+        source.stop()
+
+
+class DetectorWorkerSupervisor:
+    """
+    Запускает воркер детектора и следит за ним из процесса API.
+
+    - результаты раздаём обработчикам в отдельном потоке (не в event loop);
+    - упавший воркер перезапускаем с экспоненциальной паузой;
+    - status() отдаёт краткую диагностику для API.
+    """
+
+    def __init__(
+        self,
+        config: Optional[dict] = None,
+        target: Callable = _worker_main,
+        queue_size: int = 4,
+        max_restart_delay_sec: float = 30.0,
+    ) -> None:
+        self._config = config
+        self._target = target
+        self._queue_size = queue_size
+        self._max_restart_delay_sec = max_restart_delay_sec
+        self._ctx = mp.get_context("spawn")
+        self._lock = threading.Lock()
+        self._handlers: list[Callable[[dict], None]] = []
+        self._process = None
+        self._results = None
+        self._stop_event = None
+        self._monitor: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._restarts = 0
+        self._restart_delay_sec = 1.0
+        self._started_at = 0.0
+        self._latest: Optional[dict] = None
+
+    def add_handler(self, handler: Callable[[dict], None]) -> None:
+        with self._lock:
+            self._handlers.append(handler)
+
+    def latest(self) -> Optional[dict]:
+        """Последний полученный результат (детекции последнего обработанного кадра)."""
+        with self._lock:
+            return self._latest
+
+    def start(self) -> None:
+        with self._lock:
+            if self._monitor and self._monitor.is_alive():
+                return
+            if self._config is None:
+                self._config = load_config_from_env()
+            self._stopping.clear()
+            self._spawn_locked()
+            self._monitor = threading.Thread(
+                target=self._monitor_loop, name="detector-supervisor", daemon=True
+            )
+            self._monitor.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        with self._lock:
+            process, stop_event = self._process, self._stop_event
+        if stop_event is not None:
+            stop_event.set()
+        if process is not None:
+            process.join(timeout=timeout)
+            if process.is_alive():
+                process.terminate()
+        if self._monitor:
+            self._monitor.join(timeout=timeout)
+
+    def status(self) -> dict:
+        with self._lock:
+            process = self._process
+            latest = self._latest
+            return {
+                "running": bool(process and process.is_alive()),
+                "pid": process.pid if process else None,
+                "restarts": self._restarts,
+                "last_result_ts": latest["ts"] if latest else None,
+            }
+
+    def _spawn_locked(self) -> None:
+        self._results = self._ctx.Queue(maxsize=self._queue_size)
+        self._stop_event = self._ctx.Event()
+        self._process = self._ctx.Process(
+            target=self._target,
+            args=(self._results, self._stop_event, self._config),
+            name="kz-detector-worker",
+            daemon=True,
+        )
+        self._process.start()
+        self._started_at = time.time()
+        print(f"[DetectorWorker] Запущен воркер pid={self._process.pid}")
+
+    def _monitor_loop(self) -> None:
+        while not self._stopping.is_set():
+            results = self._results
+            try:
+                message = results.get(timeout=0.5)
+            except queue.Empty:
+                message = None
+            except (EOFError, OSError):
+                message = None
+            if message is not None:
+                self._dispatch(message)
+            if not self._stopping.is_set() and not self._process.is_alive():
+                self._restart()
+
+    def _restart(self) -> None:
+        exitcode = self._process.exitcode
+        # Если воркер проработал долго, считаем падение случайным и не наращиваем паузу.
+        if time.time() - self._started_at > 60.0:
+            self._restart_delay_sec = 1.0
+        print(
+            f"[DetectorWorker] Воркер завершился (exitcode={exitcode}), "
+            f"перезапуск через {self._restart_delay_sec:.0f} с"
+        )
+        if self._stopping.wait(self._restart_delay_sec):
+            return
+        with self._lock:
+            self._restarts += 1
+            self._restart_delay_sec = min(self._restart_delay_sec * 2, self._max_restart_delay_sec)
+            self._spawn_locked()
+
+    def _dispatch(self, message: dict) -> None:
+        with self._lock:
+            self._latest = message
+            handlers = list(self._handlers)
+        for handler in handlers:
+            try:
+                handler(message)
+            except Exception as exc:  # noqa: BLE001 — один обработчик не должен ронять остальные
+                print(f"[DetectorWorker] Ошибка обработчика {handler!r}: {exc}")
+
+
+# Глобальный супервизор для API (запускается только при KZ_DETECTOR_WORKER=1)
+detector_worker = DetectorWorkerSupervisor()
@@ -1,19 +1,30 @@
+from contextlib import asynccontextmanager, suppress
 from pathlib import Path
 from typing import List, Optional, Literal
 import re
 import json
 import time
+import asyncio
+import uuid
 import sqlite3
 
-from fastapi import FastAPI, HTTPException, Query, UploadFile, File
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import FastAPI, HTTPException, Query, Request, UploadFile, File, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from openpyxl import Workbook
 import csv
 import io
 
-from core.logic import engine, KioskUIState
+from core.logic import engines, KioskEngine, KioskUIState
+from core.stations import StationRoutingMiddleware, get_current_station
+from core import storage as storage_module
+from core.storage_executor import offload, storage_executor
+from core.pack_counter import pack_counter
+from core.pack_stats import pack_time_stats
+from core.kiosk_settings import kiosk_settings
+from core.catalog_index import catalog_index
 from core.storage import (
     add_event,
     get_conn,
@@ -21,18 +32,10 @@ from core.storage import (
     get_active_shift_id,
     get_shift_plan,
     list_shift_plans,
-    get_kiosk_setting,
-    get_kiosk_settings,
-    set_kiosk_setting,
-    get_master_session,
-    set_master_session,
-    clear_master_session,
-    update_master_last_active,
     list_sku_catalog,
     create_sku_catalog_item,
     update_sku_catalog_item,
     get_report_rows,
-    get_active_sku_codes,
 )
 from services.packaging import (
     advance_phase,
@@ -42,16 +45,33 @@ from services.packaging import (
     get_active_session as get_pack_active_session,
     get_latest_session as get_pack_latest_session,
     get_plan_for_session,
+    get_snapshot as get_pack_snapshot,
     get_state as get_pack_state,
     get_steps_state,
+    step_dict,
     start_session as start_pack_session,
     EVENT_CLOSE_BOX,
     EVENT_PRINT_LABEL,
     EVENT_TABLE_EMPTY,
     PackagingTransitionError,
+    plan_cache as pack_plan_cache,
+    save_layout_plan,
+    session_cache as pack_session_cache,
+    warm_plan_cache,
 )
 from services.timers import record_timer_state, record_heartbeat
+from services.event_batch import BATCH_EVENT_TYPES, BatchEventError, apply_batch
+from services import pack_replay
+from services import step_analytics
+from services import sku_import
+from services.step_verification import is_camera_enabled as is_verify_camera_enabled, step_verifier
 from services import shift_plans
+from services.occupancy import occupancy_engine
+from services.qr_scanner import CameraCodeRouter
+from services.json_patch import make_patch
+from services.state_version import state_version
+from services.table_empty import table_empty_monitor
+from service.detector_worker import detector_worker, is_worker_enabled
 
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -112,6 +132,7 @@ class KioskState(BaseModel):
     last_pack_seconds: int
     best_pack_seconds: int
     avg_pack_seconds: int
+    p90_pack_seconds: int = 0
 
     instruction_main: str
     instruction_sub: str
@@ -171,10 +192,43 @@ class TimerHeartbeatRequest(BaseModel):
     source: Optional[str] = "kiosk"
 
 
+class BatchEventItem(BaseModel):
+    type: Literal[BATCH_EVENT_TYPES]
+    idempotency_key: Optional[str] = Field(None, max_length=128)
+    ts: Optional[float] = None
+    sku: Optional[str] = None
+    expected_step_id: Optional[str] = None
+    state: Optional[Literal["work", "idle"]] = None
+    reason: Optional[str] = None
+    source: Optional[str] = None
+
+
+class EventBatchRequest(BaseModel):
+    events: List[BatchEventItem]
+
+
+class PackReplayRequest(BaseModel):
+    full: bool = False
+    repair: bool = False
+
+
 class PackStartRequest(BaseModel):
     sku: str
 
 
+class VisionDetection(BaseModel):
+    class_name: str
+    conf: float = 1.0
+    bbox: List[float]  # [x1, y1, x2, y2] в пикселях кадра
+
+
+class VisionDetectionsRequest(BaseModel):
+    frame_w: int
+    frame_h: int
+    detections: List[VisionDetection] = []
+    ts: Optional[float] = None
+
+
 class ShiftPlanUploadRequest(BaseModel):
     name: Optional[str] = None
     text: Optional[str] = None
@@ -217,6 +271,16 @@ class SkuUpdateRequest(BaseModel):
     is_active: Optional[bool] = None
 
 
+class LayoutPlanStep(BaseModel):
+    slot: str
+    part_code: str
+    rect: Optional[List[float]] = None
+
+
+class LayoutPlanRequest(BaseModel):
+    steps: List[LayoutPlanStep]
+
+
 class ReportSaveRequest(BaseModel):
     report_type: str
     date_from: str
@@ -227,7 +291,7 @@ class ReportSaveRequest(BaseModel):
 def update_master_activity():
     # Фиксируем время последнего действия мастера в базе.
     # Так таймаут считается устойчиво, даже после перезапуска сервиса.
-    update_master_last_active(int(time.time()))
+    kiosk_settings.touch_master(int(time.time()))
 
 
 def ensure_master_session_alive():
@@ -238,26 +302,23 @@ def ensure_master_session_alive():
     - фронт регулярно опрашивает /api/kiosk/state;
     - так мы автоматически выключаем режим при бездействии,
       даже если оператор ничего не нажимал.
+    Проверка идёт по кэшу kiosk_settings: пока мастер активен, БД не читается.
     """
-    session = get_master_session()
-    if not session.get("enabled"):
+    expired = kiosk_settings.expire_master(time.time())
+    if not expired:
         return
-    timeout_min = get_kiosk_setting("master_session_timeout_min", 15)
-    timeout_min = max(1, min(int(timeout_min or 15), 240))
-    last_activity = session.get("last_active_ts") or 0
-    if (time.time() - last_activity) > (timeout_min * 60):
-        master_id = session.get("master_id")
-        if master_id:
-            add_event(
-                event_type="master_logout",
-                ts=time.time(),
-                payload_json=json.dumps(
-                    {"master_id": master_id, "reason": "timeout"},
-                    ensure_ascii=False,
-                ),
-                shift_id=get_active_shift_id(),
-            )
-        clear_master_session()
+    master_id = expired.get("master_id")
+    if master_id:
+        add_event(
+            event_type="master_logout",
+            ts=time.time(),
+            payload_json=json.dumps(
+                {"master_id": master_id, "reason": "timeout"},
+                ensure_ascii=False,
+            ),
+            shift_id=get_active_shift_id(),
+        )
+    state_version.bump()
 
 
 def ensure_master_mode() -> dict:
@@ -268,7 +329,7 @@ def ensure_master_mode() -> dict:
     по всем endpoint-ам каталога.
     """
     ensure_master_session_alive()
-    session = get_master_session()
+    session = kiosk_settings.master_session()
     if not session.get("enabled"):
         raise HTTPException(status_code=403, detail="Доступно только в мастер-режиме.")
     return session
@@ -344,7 +405,195 @@ def build_usb_report_path(base_dir: Path, filename: str) -> Path:
     return target
 
 
-app = FastAPI(title="KZ Kiosk API")
+def _on_camera_bed(sku: str) -> None:
+    # Кровать с камеры: как скан кровати + старт упаковки, если FSM его разрешает.
+    _apply_session_scan(worker_id="", sku=sku)
+    session = get_pack_active_session() or get_pack_latest_session()
+    if not compute_pack_ui_flags(session)["can_start_sku"]:
+        return
+    shift_id, worker_id = _engine().get_active_session_shift_context()
+    try:
+        start_pack_session(sku, shift_id=shift_id, worker_id=worker_id)
+    except PackagingTransitionError as exc:
+        print(f"[QR] Упаковка {sku} не начата: {exc}")
+
+
+camera_code_router = CameraCodeRouter(
+    on_master=lambda master_id: _login_master(master_id, source="camera"),
+    on_worker=lambda worker_id: _apply_session_scan(worker_id=worker_id, sku=""),
+    on_bed=_on_camera_bed,
+)
+
+
+def _on_detector_result(result: dict) -> None:
+    # QR-коды из зоны сканирования -> те же действия, что и ручной скан.
+    if result.get("qr_codes"):
+        camera_code_router.handle(result["qr_codes"], now=result["ts"])
+    # Результат кадра из воркера детектора -> движок занятости слотов.
+    occupancy_engine.process(
+        detections=result["detections"],
+        frame_w=result["frame_w"],
+        frame_h=result["frame_h"],
+        now=result["ts"],
+    )
+    # Снимок зоны стола -> автоподтверждение TABLE_EMPTY.
+    if result.get("table_thumb") is not None:
+        table_empty_monitor.update(result["table_thumb"], now=result["ts"])
+
+
+# Как часто тикает таймер (work/idle секунды и возраст heartbeat меняются сами по себе).
+STATE_TICK_SEC = 1.0
+# Пинг push-соединения без изменений: держит прокси/NAT и выявляет отключившихся клиентов.
+PUSH_KEEPALIVE_SEC = 15.0
+# Как часто сверяем дневной счётчик упаковок с SQL.
+PACK_COUNTER_CHECK_SEC = 300.0
+# Incremental replay pack_events -> pack_sessions (сверка и чекпоинт).
+PACK_REPLAY_CHECK_SEC = 3600.0
+
+
+def _timers_running() -> bool:
+    # Время в состоянии идёт только при открытой смене; мастер-режим истекает по таймауту.
+    return bool(get_active_shift_id()) or bool(kiosk_settings.master_session().get("enabled"))
+
+
+async def _state_ticker() -> None:
+    """
+    Тик таймера: раз в секунду поднимаем версию состояния, пока идут таймеры.
+
+    Без смены и мастер-режима состояние от времени не зависит,
+    и версия стоит на месте (push-клиенты ничего не получают).
+    """
+    while True:
+        await asyncio.sleep(STATE_TICK_SEC)
+        try:
+            if await storage_executor.run(_timers_running):
+                state_version.bump()
+        except sqlite3.Error as exc:
+            print(f"[StateTicker] Ошибка чтения БД: {exc}")
+
+
+async def _pack_counter_checker() -> None:
+    # Счётчик в памяти обновляет движок при записи сессии; сверка ловит записи в обход (ручные правки БД).
+    while True:
+        await asyncio.sleep(PACK_COUNTER_CHECK_SEC)
+        try:
+            if not (await storage_executor.run(pack_counter.check_consistency))["ok"]:
+                state_version.bump()
+        except sqlite3.Error as exc:
+            print(f"[PackCounter] Ошибка сверки: {exc}")
+
+
+async def _pack_replay_checker() -> None:
+    # Периодически сворачиваем новые события: и сверка, и свежий чекпоинт для быстрого rebuild.
+    while True:
+        await asyncio.sleep(PACK_REPLAY_CHECK_SEC)
+        try:
+            report = await asyncio.to_thread(pack_replay.rebuild)
+        except sqlite3.Error as exc:
+            print(f"[PackReplay] Ошибка replay: {exc}")
+            continue
+        if report["mismatches"] or report["anomalies"]:
+            print(
+                f"[PackReplay] Расхождения pack_sessions: {report['mismatches']}, "
+                f"аномалии pack_events: {report['anomalies']}"
+            )
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """
+    Жизненный цикл API.
+
+    Детектор запускаем отдельным процессом и только по флагу KZ_DETECTOR_WORKER=1,
+    чтобы сам API стартовал быстро и не импортировал torch.
+    """
+    if is_worker_enabled():
+        detector_worker.add_handler(_on_detector_result)
+        detector_worker.start()
+    pack_counter.load()
+    pack_time_stats.load()
+    pack_session_cache.load()
+    warm_plan_cache()
+    if is_verify_camera_enabled():
+        step_verifier.start_camera()
+    background = [
+        asyncio.create_task(_state_ticker()),
+        asyncio.create_task(_pack_counter_checker()),
+        asyncio.create_task(_pack_replay_checker()),
+    ]
+    try:
+        yield
+    finally:
+        for task in background:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        if is_worker_enabled():
+            detector_worker.stop()
+        step_verifier.stop()
+        storage_executor.shutdown()
+
+
+app = FastAPI(title="KZ Kiosk API", lifespan=lifespan)
+
+
+# Опрашиваемые эндпоинты, которые отдают ETag по версии состояния.
+VERSIONED_GET_PATHS = {
+    "/api/kiosk/state",
+    "/api/kiosk/pack/ui-state",
+    "/api/kiosk/pack/snapshot",
+    "/api/kiosk/pack/steps/state",
+    "/api/kiosk/pack/plan/list",
+    "/api/kiosk/settings",
+}
+# Версия живёт в памяти процесса: метка запуска не даёт спутать ETag до и после рестарта.
+_ETAG_BOOT_ID = uuid.uuid4().hex[:8]
+
+
+def _state_etag(version: int) -> str:
+    return f'"{_ETAG_BOOT_ID}-{version}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    return any(tag.strip() in (etag, "*") for tag in if_none_match.split(","))
+
+
+@app.middleware("http")
+async def bump_state_version_on_mutation(request: Request, call_next):
+    """
+    Версия состояния и условные GET.
+
+    - Любой успешный мутирующий запрос к API киоска поднимает версию:
+      не нужно помнить о ней в каждом эндпоинте (смены, таймер, мастер, настройки).
+    - Опрашиваемые GET отдают сильный ETag по версии; при совпадении If-None-Match
+      отвечаем 304, не вызывая эндпоинт (ни расчёта состояния, ни SQLite).
+    """
+    if request.method == "GET" and request.url.path in VERSIONED_GET_PATHS:
+        # Версию берём до расчёта: если состояние поменяется во время ответа,
+        # ETag окажется "старым" и следующий запрос просто получит 200.
+        etag = _state_etag(state_version.current())
+        if _etag_matches(request.headers.get("if-none-match", ""), etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+        response = await call_next(request)
+        if response.status_code == 200:
+            response.headers["ETag"] = etag
+            response.headers["Cache-Control"] = "no-cache"
+            # Станция может приходить заголовком — ответы разных станций не смешиваем.
+            response.headers["Vary"] = "X-Station-Id"
+        return response
+
+    response = await call_next(request)
+    if (
+        request.method not in ("GET", "HEAD", "OPTIONS")
+        and request.url.path.startswith("/api/kiosk/")
+        and response.status_code < 400
+    ):
+        state_version.bump()
+    return response
+
+
+# Добавлена последней — значит, внешняя: станция и путь известны до остальных middleware.
+app.add_middleware(StationRoutingMiddleware)
 
 app.mount(
     "/static",
@@ -352,6 +601,11 @@ app.mount(
     name="kiosk_static",
 )
 
+def _engine() -> KioskEngine:
+    # Движок станции текущего запроса (путь /stations/<id>/... или заголовок X-Station-Id).
+    return engines.get()
+
+
 def _ensure_shift_active(shift_id: int) -> None:
     # Проверяем, что смена ещё активна в БД.
     # Важно: поведение и тексты ошибок должны совпадать с текущими ручными проверками.
@@ -373,10 +627,11 @@ async def root():
 
 
 @app.get("/api/kiosk/state", response_model=KioskState)
-async def get_state():
+@offload
+def get_state():
     ensure_master_session_alive()
-    ui: KioskUIState = engine.get_ui_state()
-    session = get_master_session()
+    ui: KioskUIState = _engine().get_ui_state()
+    session = kiosk_settings.master_session()
     master_id = session.get("master_id") if session.get("enabled") else None
     return KioskState(
         worker_name=ui.worker_name,
@@ -400,6 +655,7 @@ async def get_state():
         last_pack_seconds=ui.last_pack_seconds,
         best_pack_seconds=ui.best_pack_seconds,
         avg_pack_seconds=ui.avg_pack_seconds,
+        p90_pack_seconds=ui.p90_pack_seconds,
         instruction_main=ui.instruction_main,
         instruction_sub=ui.instruction_sub,
         instruction_extra=ui.instruction_extra,
@@ -444,7 +700,8 @@ async def get_state():
 
 
 @app.post("/api/kiosk/master/login")
-async def master_login(payload: MasterLoginRequest):
+@offload
+def master_login(payload: MasterLoginRequest):
     """
     Вход в режим мастера по QR-коду.
 
@@ -462,24 +719,32 @@ async def master_login(payload: MasterLoginRequest):
             detail="Неверный QR мастера. Ожидается формат M######## (например, M13540876).",
         )
     master_id = match.group(1)
-    set_master_session(master_id=master_id, last_active_ts=int(time.time()))
+    _login_master(master_id)
+    return {"status": "ok", "master_id": master_id}
+
+
+def _login_master(master_id: str, source: str = "scanner") -> None:
+    # Общий путь входа мастера: ручной скан и камера.
+    kiosk_settings.set_master(master_id=master_id, last_active_ts=int(time.time()))
     add_event(
         event_type="master_login",
         ts=time.time(),
-        payload_json=json.dumps({"master_id": master_id}, ensure_ascii=False),
+        payload_json=json.dumps({"master_id": master_id, "source": source}, ensure_ascii=False),
         shift_id=get_active_shift_id(),
     )
-    return {"status": "ok", "master_id": master_id}
+    # Камера входит мимо HTTP, поэтому версию поднимаем здесь, а не только в middleware.
+    state_version.bump()
 
 
 @app.post("/api/kiosk/master/logout")
-async def master_logout(payload: MasterLogoutRequest):
+@offload
+def master_logout(payload: MasterLogoutRequest):
     """
     Выход из режима мастера.
 
     Мы просто очищаем master_id, чтобы UI вернулся к обычному режиму.
     """
-    session = get_master_session()
+    session = kiosk_settings.master_session()
     master_id = session.get("master_id") if session.get("enabled") else None
     reason = payload.reason or "manual"
     if master_id:
@@ -492,69 +757,85 @@ async def master_logout(payload: MasterLogoutRequest):
             ),
             shift_id=get_active_shift_id(),
         )
-    clear_master_session()
+    kiosk_settings.clear_master()
     return {"status": "ok", "reason": reason}
 
 
 @app.post("/api/kiosk/session/start")
-async def start_session(payload: StartSessionRequest):
-    worker_id = payload.worker_id or ""
-    sku = payload.sku or ""
+@offload
+def start_session(payload: StartSessionRequest):
+    _apply_session_scan(
+        worker_id=payload.worker_id or "",
+        sku=payload.sku or "",
+        worker_name=payload.worker_name,
+        shift_label=payload.shift_label,
+    )
+    return {"status": "ok"}
+
 
+def _apply_session_scan(
+    worker_id: str,
+    sku: str,
+    worker_name: Optional[str] = None,
+    shift_label: Optional[str] = None,
+) -> None:
     # 1) обновляем контекст (можно сканировать по отдельности)
     if worker_id:
-        engine.set_worker(worker_id=worker_id, worker_name=payload.worker_name, shift_label=payload.shift_label)
+        _engine().set_worker(worker_id=worker_id, worker_name=worker_name, shift_label=shift_label)
     if sku:
-        engine.set_bed(product_code=sku)
+        _engine().set_bed(product_code=sku)
 
     # 2) стартуем только когда есть И сотрудник И кровать
-    ui = engine.get_ui_state()
+    ui = _engine().get_ui_state()
     ready_worker = (ui.worker_name and ui.worker_name != "—")
     ready_bed = (ui.bed_sku and ui.bed_sku != "—")
 
     if ready_worker and ready_bed and ui.status == "idle":
-        engine.start_session(
+        _engine().start_session(
             worker_id=worker_id or ui.worker_name,
-            worker_name=payload.worker_name or ui.worker_name,
+            worker_name=worker_name or ui.worker_name,
             product_code=sku or ui.bed_sku,
-            shift_label=payload.shift_label or ui.shift_label,
+            shift_label=shift_label or ui.shift_label,
         )
 
-    return {"status": "ok"}
-
 
 @app.post("/api/kiosk/session/finish")
-async def finish_session(payload: FinishSessionRequest):
-    engine.finish_session(status=payload.status or "done")
+@offload
+def finish_session(payload: FinishSessionRequest):
+    _engine().finish_session(status=payload.status or "done")
     return {"status": "ok"}
 
 
 @app.post("/api/kiosk/shift/add")
-async def shift_add(payload: ShiftWorkerRequest):
-    engine.add_worker_to_shift(worker_id=payload.worker_id, work_center=payload.work_center or "")
+@offload
+def shift_add(payload: ShiftWorkerRequest):
+    _engine().add_worker_to_shift(worker_id=payload.worker_id, work_center=payload.work_center or "")
     return {"status": "ok"}
 
 
 @app.post("/api/kiosk/shift/start")
-async def shift_start(payload: ShiftStartRequest):
+@offload
+def shift_start(payload: ShiftStartRequest):
     # Новый эндпоинт старта смены.
     # Возвращаем shift_id, чтобы фронт/интеграции могли связать события со сменой.
-    shift_id = engine.add_worker_to_shift(worker_id=payload.worker_id, work_center=payload.work_center)
+    shift_id = _engine().add_worker_to_shift(worker_id=payload.worker_id, work_center=payload.work_center)
     return {"status": "ok", "shift_id": shift_id}
 
 
 @app.post("/api/kiosk/shift/end")
-async def shift_end(payload: ShiftEndRequest):
-    closed = engine.close_worker_shift(worker_id=payload.worker_id, work_centers=payload.work_centers)
+@offload
+def shift_end(payload: ShiftEndRequest):
+    closed = _engine().close_worker_shift(worker_id=payload.worker_id, work_centers=payload.work_centers)
     return {"status": "ok", "closed": closed}
 
 
 @app.post("/api/kiosk/timer/state")
-async def timer_state(payload: TimerStateRequest):
+@offload
+def timer_state(payload: TimerStateRequest):
     # Смена состояния таймера work/idle.
     # Что делаем: ищем активную сессию и её shift_id.
     # Если смена не активна — возвращаем 409.
-    shift_id, worker_id = engine.get_active_session_shift_context()
+    shift_id, worker_id = _engine().get_active_session_shift_context()
     if not shift_id:
         raise HTTPException(
             status_code=409,
@@ -576,12 +857,36 @@ async def timer_state(payload: TimerStateRequest):
     return {"status": "ok", "created": created}
 
 
+@app.post("/api/kiosk/events/batch")
+@offload
+def events_batch(payload: EventBatchRequest):
+    """
+    Пакет событий упаковки и таймера (очередь браузера после обрыва сети).
+
+    События применяются по порядку одной транзакцией; результат — по каждому
+    событию (ok / duplicate / error с кодом, который вернул бы одиночный запрос).
+    """
+    try:
+        results = apply_batch(
+            [event.model_dump() for event in payload.events],
+            shift_context=_engine().get_active_session_shift_context,
+        )
+    except BatchEventError as exc:
+        raise HTTPException(status_code=exc.code, detail=str(exc)) from exc
+    return {
+        "status": "ok",
+        "applied": sum(1 for r in results if r["status"] == "ok"),
+        "results": results,
+    }
+
+
 @app.post("/api/kiosk/timer/heartbeat")
-async def timer_heartbeat(payload: TimerHeartbeatRequest):
+@offload
+def timer_heartbeat(payload: TimerHeartbeatRequest):
     # Heartbeat-сигнал от киоска.
     # Что делаем: записываем HEARTBEAT для активной смены.
     # Зачем: используется в auto-idle расчёте (без добавления новых событий состояния).
-    shift_id, worker_id = engine.get_active_session_shift_context()
+    shift_id, worker_id = _engine().get_active_session_shift_context()
     if not shift_id:
         raise HTTPException(
             status_code=409,
@@ -610,7 +915,8 @@ async def timer_heartbeat(payload: TimerHeartbeatRequest):
 
 
 @app.post("/api/kiosk/pack/start")
-async def pack_start(payload: PackStartRequest):
+@offload
+def pack_start(payload: PackStartRequest):
     """
     Старт упаковочной сессии по SKU.
 
@@ -618,15 +924,18 @@ async def pack_start(payload: PackStartRequest):
     - Бизнес-правила проверяются в сервисе packaging.
     - Здесь мы только транслируем ошибки в HTTP 409.
     """
+    # Сотрудник и смена — для аналитики по сотрудникам (pack_sessions.worker_id).
+    shift_id, worker_id = _engine().get_active_session_shift_context()
     try:
-        state = start_pack_session(payload.sku)
+        state = start_pack_session(payload.sku, shift_id=shift_id, worker_id=worker_id)
     except PackagingTransitionError as exc:
         raise HTTPException(status_code=409, detail=str(exc)) from exc
     return {"status": "ok", "state": state}
 
 
 @app.post("/api/kiosk/pack/table-empty")
-async def pack_table_empty():
+@offload
+def pack_table_empty():
     """
     Подтверждает, что стол пустой.
 
@@ -641,7 +950,8 @@ async def pack_table_empty():
 
 
 @app.post("/api/kiosk/pack/close-box")
-async def pack_close_box():
+@offload
+def pack_close_box():
     """
     Фиксирует закрытие коробки.
 
@@ -655,7 +965,8 @@ async def pack_close_box():
 
 
 @app.post("/api/kiosk/pack/print-label")
-async def pack_print_label():
+@offload
+def pack_print_label():
     """
     Фиксирует печать этикетки.
 
@@ -668,8 +979,22 @@ async def pack_print_label():
     return {"status": "ok", "state": state}
 
 
+@app.post("/api/kiosk/pack/replay")
+async def pack_replay_run(payload: PackReplayRequest):
+    """
+    Replay pack_events -> pack_sessions (только мастер): аудит или восстановление.
+
+    full=true — с нуля, иначе от последнего чекпоинта; repair=true — переписать расхождения.
+    """
+    await storage_executor.run(ensure_master_mode)
+    report = await asyncio.to_thread(pack_replay.rebuild, payload.full, payload.repair)
+    await storage_executor.run(update_master_activity)
+    return {"status": "ok", **report}
+
+
 @app.get("/api/kiosk/pack/state")
-async def pack_state():
+@offload
+def pack_state():
     """
     Возвращает компактное состояние упаковки.
     Это вспомогательный endpoint, без расширенных флагов UI.
@@ -678,7 +1003,8 @@ async def pack_state():
 
 
 @app.get("/api/kiosk/pack/ui-state")
-async def pack_ui_state():
+@offload
+def pack_ui_state():
     """
     Расширенное состояние упаковки для UI.
 
@@ -686,18 +1012,34 @@ async def pack_ui_state():
     - active_session показывает текущий SKU (если есть).
     - pack_state/flags вычисляются из FSM, чтобы фронт не дублировал правила.
     """
-    active_session = get_pack_active_session()
-    session_for_flags = active_session or get_pack_latest_session()
-    flags = compute_pack_ui_flags(session_for_flags)
+    snapshot = get_pack_snapshot()
+    snapshot.pop("steps")
+    snapshot.pop("plan")
+    return snapshot
+
+
+@app.get("/api/kiosk/pack/snapshot")
+@offload
+def pack_snapshot():
+    """
+    Всё состояние упаковки для UI одним запросом: ui-state, шаги и план.
+
+    Собирается из одного чтения сессии; version — версия состояния
+    (та же, что в ETag), чтобы UI мог сравнивать снимки.
+    """
+    version = state_version.current()
+    snapshot = get_pack_snapshot()
     return {
-        "active_session": active_session,
-        "pack_state": session_for_flags["state"] if session_for_flags else None,
-        **flags,
+        "status": "ok",
+        "version": version,
+        **snapshot,
+        "steps": {"status": "ok", **snapshot["steps"]} if snapshot["steps"] else None,
     }
 
 
 @app.post("/api/kiosk/pack/plan/upload")
-async def pack_plan_upload(payload: ShiftPlanUploadRequest):
+@offload
+def pack_plan_upload(payload: ShiftPlanUploadRequest):
     """
     Загружает сменное задание (список SKU) для активной смены.
 
@@ -710,7 +1052,7 @@ async def pack_plan_upload(payload: ShiftPlanUploadRequest):
 
     # Проверяем право редактирования количества/очереди.
     # Если мастер запретил редактирование, оператор не должен менять список.
-    if get_kiosk_setting("operator_can_edit_qty", 1) == 0:
+    if kiosk_settings.get("operator_can_edit_qty", 1) == 0:
         raise HTTPException(
             status_code=403,
             detail="Редактирование списка запрещено настройками мастера.",
@@ -744,24 +1086,32 @@ async def shift_plan_import(file: UploadFile = File(...)):
     Формат CSV:
     - sku_code, qty
     """
-    ensure_master_mode()
-    shift_id = get_active_shift_id()
-    if not shift_id:
-        raise HTTPException(status_code=409, detail="Нет активной смены для импорта плана.")
-
+    shift_id = await storage_executor.run(_import_shift_id)
     if not file.filename or not file.filename.lower().endswith(".csv"):
         raise HTTPException(status_code=400, detail="Нужен файл CSV.")
 
     content = await file.read()
     if not content:
         raise HTTPException(status_code=400, detail="Файл CSV пуст.")
+    return await storage_executor.run(_import_shift_plan_csv, shift_id, content)
+
+
+def _import_shift_id() -> int:
+    ensure_master_mode()
+    shift_id = get_active_shift_id()
+    if not shift_id:
+        raise HTTPException(status_code=409, detail="Нет активной смены для импорта плана.")
+    return shift_id
 
+
+def _import_shift_plan_csv(shift_id: int, content: bytes) -> dict:
+    # Разбор CSV и запись плана — в пуле storage_executor (чтение файла осталось в цикле событий).
     text = content.decode("utf-8-sig")
     reader = csv.DictReader(io.StringIO(text))
     if not reader.fieldnames or "sku_code" not in reader.fieldnames or "qty" not in reader.fieldnames:
         raise HTTPException(status_code=400, detail="CSV должен содержать колонки sku_code и qty.")
 
-    active_skus = get_active_sku_codes()
+    active_skus = catalog_index.active_codes()
     errors = []
     skipped = 0
     aggregated: dict[str, int] = {}
@@ -807,7 +1157,8 @@ async def shift_plan_import(file: UploadFile = File(...)):
 
 
 @app.get("/api/kiosk/pack/plan/list")
-async def pack_plan_list():
+@offload
+def pack_plan_list():
     """
     Возвращает список сменных заданий для активной смены.
     Выбранный план отмечаем отдельно, чтобы UI мог показать текущий выбор.
@@ -844,7 +1195,8 @@ async def pack_plan_list():
 
 
 @app.post("/api/kiosk/pack/plan/select")
-async def pack_plan_select(payload: ShiftPlanSelectRequest):
+@offload
+def pack_plan_select(payload: ShiftPlanSelectRequest):
     """
     Выбирает активный план для текущей смены.
     Это влияет только на подсказки в UI и не меняет логику упаковки.
@@ -871,7 +1223,8 @@ async def pack_plan_select(payload: ShiftPlanSelectRequest):
 
 
 @app.get("/api/kiosk/settings")
-async def get_kiosk_settings_api():
+@offload
+def get_kiosk_settings_api():
     """
     Возвращает настройки киоска.
 
@@ -879,7 +1232,7 @@ async def get_kiosk_settings_api():
     чтобы UI мог стабильно строить интерфейс.
     """
     ensure_master_session_alive()
-    settings = get_kiosk_settings(
+    settings = kiosk_settings.get_many(
         [
             "operator_can_reorder",
             "operator_can_edit_qty",
@@ -889,7 +1242,7 @@ async def get_kiosk_settings_api():
             "master_session_timeout_min",
         ]
     )
-    session = get_master_session()
+    session = kiosk_settings.master_session()
     master_id = session.get("master_id") if session.get("enabled") else None
     return {
         "status": "ok",
@@ -907,7 +1260,8 @@ async def get_kiosk_settings_api():
 
 
 @app.post("/api/kiosk/settings")
-async def set_kiosk_settings_api(payload: KioskSettingsRequest):
+@offload
+def set_kiosk_settings_api(payload: KioskSettingsRequest):
     """
     Сохраняет настройки киоска.
 
@@ -916,30 +1270,22 @@ async def set_kiosk_settings_api(payload: KioskSettingsRequest):
     - изменения сразу сохраняются в SQLite и переживают перезапуск сервиса.
     """
     ensure_master_session_alive()
-    session = get_master_session()
+    session = kiosk_settings.master_session()
     if not session.get("enabled"):
         raise HTTPException(status_code=403, detail="Настройки доступны только мастеру.")
 
-    changed_keys: list[str] = []
+    # Собираем все изменения и пишем одной транзакцией: ошибка валидации ничего не меняет.
+    values: dict[str, int] = {}
     if payload.operator_can_reorder is not None:
-        set_kiosk_setting("operator_can_reorder", int(payload.operator_can_reorder))
-        changed_keys.append("operator_can_reorder")
+        values["operator_can_reorder"] = int(payload.operator_can_reorder)
     if payload.operator_can_edit_qty is not None:
-        set_kiosk_setting("operator_can_edit_qty", int(payload.operator_can_edit_qty))
-        changed_keys.append("operator_can_edit_qty")
+        values["operator_can_edit_qty"] = int(payload.operator_can_edit_qty)
     if payload.operator_can_add_sku_to_shift is not None:
-        set_kiosk_setting(
-            "operator_can_add_sku_to_shift", int(payload.operator_can_add_sku_to_shift)
-        )
-        changed_keys.append("operator_can_add_sku_to_shift")
+        values["operator_can_add_sku_to_shift"] = int(payload.operator_can_add_sku_to_shift)
     if payload.operator_can_remove_sku_from_shift is not None:
-        set_kiosk_setting(
-            "operator_can_remove_sku_from_shift", int(payload.operator_can_remove_sku_from_shift)
-        )
-        changed_keys.append("operator_can_remove_sku_from_shift")
+        values["operator_can_remove_sku_from_shift"] = int(payload.operator_can_remove_sku_from_shift)
     if payload.operator_can_manual_mode is not None:
-        set_kiosk_setting("operator_can_manual_mode", int(payload.operator_can_manual_mode))
-        changed_keys.append("operator_can_manual_mode")
+        values["operator_can_manual_mode"] = int(payload.operator_can_manual_mode)
     if payload.master_session_timeout_min is not None:
         timeout = int(payload.master_session_timeout_min)
         if timeout < 1 or timeout > 240:
@@ -947,8 +1293,9 @@ async def set_kiosk_settings_api(payload: KioskSettingsRequest):
                 status_code=400,
                 detail="Таймаут мастера должен быть в диапазоне 1..240 минут.",
             )
-        set_kiosk_setting("master_session_timeout_min", timeout)
-        changed_keys.append("master_session_timeout_min")
+        values["master_session_timeout_min"] = timeout
+    kiosk_settings.set_many(values)
+    changed_keys = list(values)
 
     update_master_activity()
     if changed_keys:
@@ -961,7 +1308,7 @@ async def set_kiosk_settings_api(payload: KioskSettingsRequest):
             ),
             shift_id=get_active_shift_id(),
         )
-    settings = get_kiosk_settings(
+    settings = kiosk_settings.get_many(
         [
             "operator_can_reorder",
             "operator_can_edit_qty",
@@ -987,23 +1334,33 @@ async def set_kiosk_settings_api(payload: KioskSettingsRequest):
 
 
 @app.get("/api/kiosk/sku")
-async def sku_list(
+@offload
+def sku_list(
     q: Optional[str] = Query(None, description="Поиск по SKU/названию/модели"),
     include_inactive: bool = Query(False, description="Показывать неактивные SKU"),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
 ):
     """
     Возвращает список SKU из каталога.
 
     По умолчанию отдаём только активные позиции,
     чтобы UI не захламлялся архивом.
+    Поиск q — по префиксам слов (FTS5), лучшие совпадения первыми; ответ —
+    страница limit/offset, next_offset=null — дальше строк нет.
     """
     ensure_master_mode()
-    items = list_sku_catalog(search=q, include_inactive=include_inactive)
-    return {"status": "ok", "items": items}
+    # Берём на одну строку больше, чтобы без COUNT(*) понять, есть ли следующая страница.
+    items = list_sku_catalog(
+        search=q, include_inactive=include_inactive, limit=limit + 1, offset=offset
+    )
+    next_offset = offset + limit if len(items) > limit else None
+    return {"status": "ok", "items": items[:limit], "next_offset": next_offset}
 
 
 @app.post("/api/kiosk/sku")
-async def sku_create(payload: SkuCreateRequest):
+@offload
+def sku_create(payload: SkuCreateRequest):
     """
     Создаёт SKU в каталоге (только мастер).
     """
@@ -1024,11 +1381,39 @@ async def sku_create(payload: SkuCreateRequest):
         )
     except sqlite3.IntegrityError:
         raise HTTPException(status_code=409, detail="SKU с таким кодом уже существует.")
+    catalog_index.refresh(sku_id)
+    pack_plan_cache.invalidate(sku_code)
     return {"status": "ok", "id": sku_id}
 
 
+@app.post("/api/kiosk/sku/import")
+async def sku_catalog_import(file: UploadFile = File(...)):
+    """
+    Массовый импорт/обновление каталога SKU из CSV или XLSX (только мастер).
+
+    Колонки: sku_code, name, model_code, width_cm, fabric_code, color_code[, is_active].
+    Валидные строки пишутся одной транзакцией (новые — добавляются, существующие
+    sku_code — обновляются), невалидные — в errors; счётчики inserted/updated/rejected.
+    """
+    await storage_executor.run(ensure_master_mode)
+    # Файл не читаем в память целиком: разбор идёт потоково из временного файла загрузки.
+    return await storage_executor.run(_import_sku_catalog, file.filename or "", file.file)
+
+
+def _import_sku_catalog(filename: str, stream) -> dict:
+    try:
+        result = sku_import.import_catalog(filename, stream)
+    except sku_import.SkuImportError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    if result["inserted"] or result["updated"]:
+        catalog_index.invalidate()
+        pack_plan_cache.invalidate()
+    return {"status": "ok", **result}
+
+
 @app.put("/api/kiosk/sku/{sku_id}")
-async def sku_update(sku_id: int, payload: SkuUpdateRequest):
+@offload
+def sku_update(sku_id: int, payload: SkuUpdateRequest):
     """
     Редактирует SKU (только имя и активность), только мастер.
     """
@@ -1038,11 +1423,50 @@ async def sku_update(sku_id: int, payload: SkuUpdateRequest):
         name=payload.name.strip() if payload.name is not None else None,
         is_active=1 if payload.is_active else (0 if payload.is_active is False else None),
     )
+    # Индекс знает код по id — сбрасываем план только этого SKU.
+    sku_code = catalog_index.refresh(sku_id)
+    if sku_code:
+        pack_plan_cache.invalidate(sku_code)
     return {"status": "ok"}
 
 
+def _plan_payload(plan) -> dict:
+    return {
+        "status": "ok",
+        "sku": plan.sku,
+        "plan_version": plan.plan_version,
+        "layout": [step_dict(step) for step in plan.layout],
+        "packing": [step_dict(step) for step in plan.packing],
+    }
+
+
+@app.get("/api/kiosk/layout-plans/{sku}")
+@offload
+def layout_plan_get(sku: str):
+    """
+    План выкладки SKU из кэша (plan_version=0 — план по умолчанию).
+    """
+    return _plan_payload(pack_plan_cache.get(sku))
+
+
+@app.put("/api/kiosk/layout-plans/{sku}")
+@offload
+def layout_plan_put(sku: str, payload: LayoutPlanRequest):
+    """
+    Заменяет план выкладки SKU (только мастер). Пустой список шагов — план по умолчанию.
+    """
+    ensure_master_mode()
+    try:
+        plan = save_layout_plan(sku, [step.model_dump() for step in payload.steps])
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    update_master_activity()
+    return _plan_payload(plan)
+
+
 @app.get("/api/kiosk/reports/preview")
-async def report_preview(
+@offload
+def report_preview(
     report_type: str = Query(..., alias="type"),
     date_from: str = Query(...),
     date_to: str = Query(...),
@@ -1057,7 +1481,8 @@ async def report_preview(
 
 
 @app.get("/api/kiosk/reports/export")
-async def report_export(
+@offload
+def report_export(
     report_type: str = Query(..., alias="type"),
     date_from: str = Query(...),
     date_to: str = Query(...),
@@ -1085,7 +1510,8 @@ async def report_export(
 
 
 @app.post("/api/kiosk/reports/save_to_usb")
-async def report_save_to_usb(payload: ReportSaveRequest):
+@offload
+def report_save_to_usb(payload: ReportSaveRequest):
     """
     Сохраняет отчёт на USB-носитель.
     """
@@ -1111,8 +1537,73 @@ async def report_save_to_usb(payload: ReportSaveRequest):
     return {"status": "ok", "path": str(target_path)}
 
 
+def _analytics_period(date_from: str, date_to: str) -> tuple[float, float]:
+    # Те же правила дат, что у отчётов: YYYY-MM-DD, конец дня включительно.
+    validate_report_params("sku", date_from, date_to)
+    start_ts = time.mktime(time.strptime(date_from, "%Y-%m-%d"))
+    end_ts = time.mktime(time.strptime(date_to, "%Y-%m-%d")) + 86399
+    return start_ts, end_ts
+
+
+async def _step_analytics(date_from: str, date_to: str, **kwargs) -> list[dict]:
+    await storage_executor.run(ensure_master_mode)
+    start_ts, end_ts = _analytics_period(date_from, date_to)
+
+    def run() -> list[dict]:
+        step_analytics.refresh()
+        return step_analytics.aggregate(start_ts, end_ts, **kwargs)
+
+    try:
+        return await asyncio.to_thread(run)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@app.get("/api/kiosk/analytics/steps")
+async def analytics_steps(
+    date_from: str = Query(...),
+    date_to: str = Query(...),
+    group_by: str = Query("sku,step_id"),
+    sort: str = Query("mean_sec"),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """
+    Время шагов упаковки за период (только мастер).
+
+    group_by — поля через запятую: sku, station_id, worker_id, phase, step_id, slot, part_code.
+    """
+    fields = tuple(name.strip() for name in group_by.split(",") if name.strip())
+    rows = await _step_analytics(date_from, date_to, group_by=fields, sort=sort, limit=limit)
+    return {"status": "ok", "rows": rows}
+
+
+@app.get("/api/kiosk/analytics/bottlenecks/steps")
+async def analytics_slowest_steps(
+    date_from: str = Query(...),
+    date_to: str = Query(...),
+    limit: int = Query(20, ge=1, le=1000),
+):
+    """Самые медленные шаги (SKU + фаза + шаг) по среднему времени."""
+    rows = await _step_analytics(
+        date_from, date_to, group_by=("sku", "phase", "step_id"), sort="mean_sec", limit=limit
+    )
+    return {"status": "ok", "rows": rows}
+
+
+@app.get("/api/kiosk/analytics/bottlenecks/slots")
+async def analytics_slot_p90(
+    date_from: str = Query(...),
+    date_to: str = Query(...),
+    limit: int = Query(20, ge=1, le=1000),
+):
+    """p90 времени шага по слотам раскладки/коробки."""
+    rows = await _step_analytics(date_from, date_to, group_by=("slot",), sort="p90_sec", limit=limit)
+    return {"status": "ok", "rows": rows}
+
+
 @app.get("/api/kiosk/pack/plan")
-async def pack_plan():
+@offload
+def pack_plan():
     """
     Возвращает план шагов для активного SKU.
 
@@ -1125,7 +1616,8 @@ async def pack_plan():
 
 
 @app.get("/api/kiosk/pack/steps/state")
-async def pack_steps_state():
+@offload
+def pack_steps_state():
     """
     Возвращает состояние шагов (фаза, индекс, текущий шаг).
     Это основная точка синхронизации UI и backend.
@@ -1137,7 +1629,8 @@ async def pack_steps_state():
 
 
 @app.post("/api/kiosk/pack/step/complete")
-async def pack_step_complete():
+@offload
+def pack_step_complete():
     """
     Завершает текущий шаг упаковки.
 
@@ -1152,7 +1645,8 @@ async def pack_step_complete():
 
 
 @app.post("/api/kiosk/pack/phase/next")
-async def pack_phase_next():
+@offload
+def pack_phase_next():
     """
     Переводит процесс из LAYOUT в PACKING.
 
@@ -1165,6 +1659,141 @@ async def pack_phase_next():
     return {"status": "ok", **result}
 
 
+# Снимок для push: один на версию и станцию, общий для всех подключённых киосков станции.
+# Ключ включает путь БД, чтобы тесты с разными БД не видели чужой снимок.
+_push_snapshot_cache: dict[str, tuple[tuple, dict]] = {}
+
+
+async def _build_push_snapshot(version: int) -> dict:
+    """
+    Полное состояние для UI: то же, что отдают /state, /pack/ui-state и /pack/steps/state.
+    """
+    station_id = get_current_station()
+    key = (str(storage_module.DB), version)
+    cached = _push_snapshot_cache.get(station_id)
+    if cached and cached[0] == key:
+        return cached[1]
+    pack = await storage_executor.run(get_pack_snapshot)
+    steps = pack.pop("steps")
+    pack.pop("plan")
+    snapshot = jsonable_encoder(
+        {
+            "state": await get_state(),
+            "pack_ui": pack,
+            "pack_steps": {"status": "ok", **steps} if steps else None,
+        }
+    )
+    _push_snapshot_cache[station_id] = (key, snapshot)
+    return snapshot
+
+
+@app.websocket("/api/kiosk/ws")
+async def kiosk_state_ws(websocket: WebSocket):
+    """
+    Push-состояние киоска вместо опроса.
+
+    Протокол (сервер -> клиент, JSON):
+    - {"type": "full", "version", "data"} — сразу после подключения;
+    - {"type": "patch", "version", "ops"} — JSON Patch (RFC 6902) к предыдущему
+      снимку, только когда версия состояния изменилась;
+    - {"type": "ping", "version"} — keepalive, если изменений давно не было.
+    """
+    await websocket.accept()
+    try:
+        version = state_version.current()
+        snapshot = await _build_push_snapshot(version)
+        await websocket.send_json({"type": "full", "version": version, "data": snapshot})
+        while True:
+            new_version = await state_version.wait_changed(version, timeout=PUSH_KEEPALIVE_SEC)
+            if new_version == version:
+                await websocket.send_json({"type": "ping", "version": version})
+                continue
+            version = new_version
+            fresh = await _build_push_snapshot(version)
+            ops = make_patch(snapshot, fresh)
+            snapshot = fresh
+            if ops:
+                await websocket.send_json({"type": "patch", "version": version, "ops": ops})
+    except WebSocketDisconnect:
+        return
+
+
+@app.post("/api/kiosk/vision/detections")
+@offload
+def vision_detections(payload: VisionDetectionsRequest):
+    """
+    Принимает детекции одного кадра и обновляет занятость слотов.
+
+    Если ожидаемая деталь устойчиво легла в текущий слот (LAYOUT)
+    или слот освободился (PACKING), шаг завершается автоматически.
+    """
+    report = occupancy_engine.process(
+        detections=[d.model_dump() for d in payload.detections],
+        frame_w=payload.frame_w,
+        frame_h=payload.frame_h,
+        now=payload.ts,
+    )
+    return {"status": "ok", **report}
+
+
+@app.post("/api/kiosk/vision/table-reference")
+@offload
+def vision_table_reference():
+    """
+    Запоминает текущий вид стола как эталон "пустой стол" (только мастер).
+
+    Вызывать, когда стол действительно пуст: по эталону камера
+    сама подтверждает TABLE_EMPTY после закрытия коробки.
+    """
+    ensure_master_mode()
+    latest = detector_worker.latest()
+    if not latest or latest.get("table_thumb") is None:
+        raise HTTPException(status_code=409, detail="Нет свежего кадра с камеры.")
+    table_empty_monitor.capture_reference(latest["table_thumb"])
+    return {"status": "ok"}
+
+
+@app.get("/api/kiosk/vision/table-state")
+async def vision_table_state():
+    """Диагностика автопроверки пустого стола."""
+    return {"status": "ok", **table_empty_monitor.status()}
+
+
+@app.get("/api/kiosk/stations")
+async def list_stations():
+    """Станции, которые уже обслуживает этот процесс, и станция текущего запроса."""
+    return {"status": "ok", "current": get_current_station(), "stations": engines.stations()}
+
+
+@app.get("/api/kiosk/stats/today")
+@offload
+def stats_today():
+    """
+    Упаковки за сегодня: всего и по сотрудникам (из счётчика в памяти)
+    и результат последней сверки с БД.
+    """
+    return {"status": "ok", **pack_counter.snapshot()}
+
+
+@app.get("/api/kiosk/stats/pack-time")
+@offload
+def stats_pack_time(sku: str = Query(...), worker_id: Optional[str] = Query(None)):
+    """
+    Статистика времени упаковки SKU (секунды): count, last, best, avg, std, p50, p90.
+    С worker_id — по конкретному сотруднику.
+    """
+    return {"status": "ok", "sku": sku, "worker_id": worker_id, **pack_time_stats.get(sku, worker_id)}
+
+
+@app.get("/api/kiosk/vision/worker")
+async def vision_worker_status():
+    """
+    Диагностика воркера детектора: жив ли процесс, сколько было перезапусков,
+    когда пришёл последний результат.
+    """
+    return {"status": "ok", "enabled": is_worker_enabled(), **detector_worker.status()}
+
+
 if __name__ == "__main__":
     import uvicorn
 
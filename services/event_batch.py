@@ -0,0 +1,173 @@
+"""
+Пакетная отправка событий киоска: POST /api/kiosk/events/batch.
+
+Зачем:
+- при нестабильной сети браузер копит действия оператора и раньше
+  переигрывал их по одному POST (каждый — свои соединения и коммиты);
+- пакет применяется одной транзакцией SQLite (один fsync на пакет);
+- каждое событие — в своём SAVEPOINT: ошибка одного (например, 409 FSM)
+  откатывает только его, остальные применяются в исходном порядке;
+- idempotency_key защищает от повторного применения при переотправке:
+  повтор получает сохранённый результат со статусом "duplicate".
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Callable, Optional
+
+from core import storage
+from core.stations import get_current_station
+from services import packaging
+from services.state_version import state_version
+from services.timers import record_heartbeat, record_timer_state
+
+EVENT_PACK_START = "pack_start"
+EVENT_STEP_COMPLETE = "step_complete"
+EVENT_PHASE_NEXT = "phase_next"
+EVENT_CLOSE_BOX = "close_box"
+EVENT_PRINT_LABEL = "print_label"
+EVENT_TABLE_EMPTY = "table_empty"
+EVENT_TIMER_STATE = "timer_state"
+EVENT_HEARTBEAT = "heartbeat"
+
+BATCH_EVENT_TYPES = (
+    EVENT_PACK_START,
+    EVENT_STEP_COMPLETE,
+    EVENT_PHASE_NEXT,
+    EVENT_CLOSE_BOX,
+    EVENT_PRINT_LABEL,
+    EVENT_TABLE_EMPTY,
+    EVENT_TIMER_STATE,
+    EVENT_HEARTBEAT,
+)
+
+MAX_BATCH_EVENTS = 200
+# Квитанции старше суток удаляем: очередь браузера столько не живёт.
+RECEIPT_TTL_SEC = 24 * 3600
+
+_FSM_EVENTS = {
+    EVENT_CLOSE_BOX: packaging.EVENT_CLOSE_BOX,
+    EVENT_PRINT_LABEL: packaging.EVENT_PRINT_LABEL,
+    EVENT_TABLE_EMPTY: packaging.EVENT_TABLE_EMPTY,
+}
+
+
+class BatchEventError(ValueError):
+    """Событие пакета не применено; code — HTTP-код, который вернул бы одиночный запрос."""
+
+    def __init__(self, message: str, code: int = 409) -> None:
+        super().__init__(message)
+        self.code = code
+
+
+def _event_ts(client_ts: Optional[float], now: float) -> float:
+    # Клиентское время сохраняет порядок и длительности при переигрывании очереди,
+    # но не может быть в будущем (часы планшета могут спешить).
+    if client_ts is None:
+        return now
+    return min(float(client_ts), now)
+
+
+def _apply_one(
+    conn,
+    event: dict,
+    ts: float,
+    shift_context: Callable[[], tuple[Optional[int], Optional[str]]],
+) -> dict:
+    event_type = event["type"]
+    if event_type == EVENT_PACK_START:
+        shift_id, worker_id = shift_context()
+        return packaging.start_session(
+            event.get("sku") or "", ts=ts, shift_id=shift_id, worker_id=worker_id
+        )
+    if event_type == EVENT_STEP_COMPLETE:
+        return packaging.complete_current_step(expected_step_id=event.get("expected_step_id"), ts=ts)
+    if event_type == EVENT_PHASE_NEXT:
+        return packaging.advance_phase(ts=ts)
+    if event_type in _FSM_EVENTS:
+        return packaging.apply_event(_FSM_EVENTS[event_type], ts=ts)
+
+    shift_id, worker_id = shift_context()
+    if not shift_id:
+        raise BatchEventError("Нет активной смены для текущей упаковочной сессии.")
+    row = conn.execute("SELECT is_active FROM worker_shifts WHERE id=?", [shift_id]).fetchone()
+    if not row or int(row["is_active"]) != 1:
+        raise BatchEventError("Смена уже закрыта, таймер не может менять состояние.")
+    if event_type == EVENT_TIMER_STATE:
+        if event.get("state") not in ("work", "idle"):
+            raise BatchEventError("state должен быть work или idle.", code=400)
+        created = record_timer_state(
+            shift_id=shift_id,
+            session_id=None,
+            state=event["state"],
+            reason=event.get("reason"),
+            ts=ts,
+            worker_id=worker_id,
+            conn=conn,
+        )
+        return {"created": created}
+    if event_type == EVENT_HEARTBEAT:
+        record_heartbeat(
+            shift_id=shift_id,
+            session_id=None,
+            ts=ts,
+            worker_id=worker_id,
+            source=event.get("source") or "kiosk",
+            conn=conn,
+        )
+        return {}
+    raise BatchEventError(f"Неизвестный тип события: {event_type}", code=400)
+
+
+def apply_batch(
+    events: list[dict],
+    shift_context: Callable[[], tuple[Optional[int], Optional[str]]],
+) -> list[dict]:
+    """
+    Применяет события по порядку одной транзакцией и возвращает результат по каждому.
+
+    events — словари с полями type, idempotency_key, ts и параметрами типа
+    (sku, expected_step_id, state, reason, source).
+    shift_context() возвращает (shift_id, worker_id) для событий таймера.
+    Результат: {"index", "idempotency_key", "type", "status": ok|duplicate|error, ...}.
+    """
+    if len(events) > MAX_BATCH_EVENTS:
+        raise BatchEventError(f"Не больше {MAX_BATCH_EVENTS} событий в пакете.", code=400)
+    station_id = get_current_station()
+    now = time.time()
+    results: list[dict] = []
+    try:
+        with storage.transaction() as conn, packaging.use_transaction(conn):
+            storage.prune_event_receipts(conn, now - RECEIPT_TTL_SEC)
+            keys = [e["idempotency_key"] for e in events if e.get("idempotency_key")]
+            receipts = storage.get_event_receipts(conn, station_id, keys)
+            for index, event in enumerate(events):
+                key = event.get("idempotency_key")
+                entry = {"index": index, "idempotency_key": key, "type": event["type"]}
+                if key and key in receipts:
+                    results.append({**entry, "status": "duplicate", "result": receipts[key]})
+                    continue
+                conn.execute("SAVEPOINT batch_event")
+                try:
+                    result = _apply_one(conn, event, _event_ts(event.get("ts"), now), shift_context)
+                except (packaging.PackagingTransitionError, BatchEventError) as exc:
+                    conn.execute("ROLLBACK TO batch_event")
+                    conn.execute("RELEASE batch_event")
+                    code = exc.code if isinstance(exc, BatchEventError) else 409
+                    results.append({**entry, "status": "error", "code": code, "error": str(exc)})
+                    continue
+                if key:
+                    storage.add_event_receipt(conn, key, station_id, event["type"], result, now)
+                    # Повтор ключа внутри того же пакета — тоже дубликат.
+                    receipts[key] = result
+                conn.execute("RELEASE batch_event")
+                results.append({**entry, "status": "ok", "result": result})
+    except BaseException:
+        # Переходы внутри пакета уже обновили кэш и версию состояния, а транзакция
+        # откатилась: сбрасываем кэш и ещё раз поднимаем версию, чтобы клиенты
+        # (push, ETag) перечитали состояние, а не держали незакоммиченное.
+        packaging.session_cache.invalidate(station_id)
+        state_version.bump()
+        raise
+    return results
@@ -0,0 +1,68 @@
+"""
+Минимальный JSON Patch (RFC 6902) для push-обновлений состояния.
+
+Генерируем только add/remove/replace:
+- словари сравниваем рекурсивно по ключам;
+- списки одинаковой длины — поэлементно, иначе заменяем целиком
+  (списки в состоянии киоска короткие, а move/copy усложнили бы клиент).
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+
+def _escape(key: str) -> str:
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def make_patch(old: Any, new: Any, path: str = "") -> list[dict]:
+    """Операции, превращающие old в new."""
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops: list[dict] = []
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in old:
+                ops.append({"op": "add", "path": child, "value": value})
+            else:
+                ops.extend(make_patch(old[key], value, child))
+        return ops
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        ops = []
+        for index, (a, b) in enumerate(zip(old, new)):
+            ops.extend(make_patch(a, b, f"{path}/{index}"))
+        return ops
+    # bool и int в Python равны (True == 1), а в JSON — нет.
+    if type(old) is type(new) and old == new:
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+def apply_patch(doc: Any, ops: list[dict]) -> Any:
+    """Применяет операции make_patch (используется в тестах и отладке)."""
+    for op in ops:
+        tokens = [_unescape(t) for t in op["path"].split("/")[1:]]
+        if not tokens:
+            doc = op.get("value")
+            continue
+        parent = doc
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        last = tokens[-1]
+        if isinstance(parent, list):
+            if op["op"] == "remove":
+                del parent[int(last)]
+            else:
+                parent[int(last)] = op["value"]
+        elif op["op"] == "remove":
+            del parent[last]
+        else:
+            parent[last] = op["value"]
+    return doc
@@ -0,0 +1,271 @@
+"""
+Движок занятости слотов по детекциям камеры.
+
+Что делает:
+- сопоставляет детекции (bbox + класс детали) с прямоугольниками слотов
+  через векторизованную матрицу IoU;
+- сглаживает "дребезг" детектора по времени (debounce): слот считается
+  занятым/свободным, только если наблюдение держится заданное время;
+- завершает текущий шаг упаковки через services.packaging.complete_current_step.
+
+Правила завершения шага:
+- LAYOUT: в текущем слоте устойчиво лежит ожидаемая деталь (part_code);
+- PACKING: текущий слот был занят и устойчиво освободился
+  (деталь забрали со стола в коробку).
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from services import packaging
+
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """
+    Матрица IoU между наборами боксов в формате xyxy.
+
+    boxes_a: (N, 4), boxes_b: (M, 4) -> (N, M).
+    Считаем через broadcasting, без циклов: на десятках детекций
+    и слотов это микросекунды.
+    """
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    if a.shape[0] == 0 or b.shape[0] == 0:
+        return np.zeros((a.shape[0], b.shape[0]), dtype=np.float32)
+
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0).astype(np.float32)
+
+
+def rects_to_xyxy(rects) -> np.ndarray:
+    """[x, y, w, h] (доли кадра) -> [x1, y1, x2, y2]."""
+    r = np.asarray(rects, dtype=np.float32).reshape(-1, 4)
+    return np.concatenate([r[:, :2], r[:, :2] + r[:, 2:]], axis=1)
+
+
+def detections_to_arrays(
+    detections: list[dict],
+    frame_w: float,
+    frame_h: float,
+    min_conf: float = 0.0,
+) -> tuple[np.ndarray, list[str]]:
+    """
+    Переводит детекции Detector.detect() в нормированные боксы xyxy.
+
+    Возвращаем массив (N, 4) и список кодов деталей (class_name) той же длины.
+    Детекции ниже порога уверенности отбрасываем сразу.
+    """
+    kept = [d for d in detections if float(d.get("conf", 1.0)) >= min_conf]
+    if not kept or frame_w <= 0 or frame_h <= 0:
+        return np.zeros((0, 4), dtype=np.float32), []
+    boxes = np.asarray([d["bbox"] for d in kept], dtype=np.float32).reshape(-1, 4)
+    boxes /= np.asarray([frame_w, frame_h, frame_w, frame_h], dtype=np.float32)
+    return boxes, [str(d.get("class_name") or "") for d in kept]
+
+
+@dataclass
+class SlotState:
+    slot: str
+    occupied: bool | None = None      # None — ещё не знаем (нет устойчивого наблюдения)
+    part_code: str | None = None
+    since: float | None = None        # с какого момента держится устойчивое состояние
+
+    # Кандидат на смену состояния (сырое наблюдение, ждёт debounce).
+    pending_part: str | None = None
+    pending_occupied: bool | None = None
+    pending_since: float | None = None
+
+
+class SlotOccupancyTracker:
+    """
+    Трекер занятости слотов с гистерезисом по времени.
+
+    Почему debounce по времени, а не по числу кадров:
+    - частота кадров плавает (нагрузка, сеть камеры);
+    - оператору важно "деталь лежит полсекунды", а не "N кадров подряд".
+    """
+
+    def __init__(
+        self,
+        iou_threshold: float = 0.3,
+        min_conf: float = 0.5,
+        occupy_after_sec: float = 0.5,
+        release_after_sec: float = 0.8,
+    ) -> None:
+        self.iou_threshold = iou_threshold
+        self.min_conf = min_conf
+        self.occupy_after_sec = occupy_after_sec
+        self.release_after_sec = release_after_sec
+        self._states: dict[str, SlotState] = {}
+
+    def reset(self) -> None:
+        self._states.clear()
+
+    def get(self, slot: str) -> SlotState | None:
+        return self._states.get(slot)
+
+    def observe(
+        self,
+        slots: list[tuple[str, list[float]]],
+        detections: list[dict],
+        frame_w: float,
+        frame_h: float,
+        now: float,
+    ) -> dict[str, SlotState]:
+        """
+        Обновляет состояния слотов по одному кадру.
+
+        slots — список (имя слота, [x, y, w, h]).
+        Каждому слоту сопоставляем детекцию с максимальным IoU выше порога.
+        """
+        if not slots:
+            return {}
+        names = [name for name, _ in slots]
+        slot_boxes = rects_to_xyxy([rect for _, rect in slots])
+        det_boxes, det_parts = detections_to_arrays(
+            detections, frame_w, frame_h, min_conf=self.min_conf
+        )
+
+        raw: list[str | None] = [None] * len(names)
+        if det_parts:
+            iou = iou_matrix(det_boxes, slot_boxes)
+            best_det = iou.argmax(axis=0)
+            best_iou = iou[best_det, np.arange(len(names))]
+            for slot_idx in np.flatnonzero(best_iou >= self.iou_threshold):
+                raw[slot_idx] = det_parts[int(best_det[slot_idx])]
+
+        for name, part in zip(names, raw):
+            state = self._states.setdefault(name, SlotState(slot=name))
+            self._apply(state, part, now)
+        return {name: self._states[name] for name in names}
+
+    def _apply(self, state: SlotState, part: str | None, now: float) -> None:
+        occupied = part is not None
+        if state.occupied == occupied and state.part_code == part:
+            state.pending_since = None
+            return
+
+        if (
+            state.pending_since is None
+            or state.pending_occupied != occupied
+            or state.pending_part != part
+        ):
+            state.pending_occupied = occupied
+            state.pending_part = part
+            state.pending_since = now
+            return
+
+        delay = self.occupy_after_sec if occupied else self.release_after_sec
+        if now - state.pending_since >= delay:
+            state.occupied = occupied
+            state.part_code = part
+            state.since = now
+            state.pending_since = None
+
+
+class OccupancyEngine:
+    """
+    Связывает трекер занятости с FSM упаковки.
+
+    Один экземпляр на процесс API: детекции приходят из детектора
+    (эндпоинт /api/kiosk/vision/detections или воркер детектора),
+    а решение "шаг выполнен" принимается здесь.
+    """
+
+    def __init__(self, tracker: SlotOccupancyTracker | None = None) -> None:
+        self._lock = threading.Lock()
+        self._tracker = tracker or SlotOccupancyTracker()
+        self._context: tuple[int, str] | None = None
+        # Слоты, которые в текущей фазе хотя бы раз были устойчиво заняты.
+        # Для PACKING освобождение слота засчитываем только после этого.
+        self._seen_occupied: set[str] = set()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._tracker.reset()
+            self._context = None
+            self._seen_occupied.clear()
+
+    def process(
+        self,
+        detections: list[dict],
+        frame_w: float,
+        frame_h: float,
+        now: float | None = None,
+    ) -> dict:
+        """
+        Обрабатывает детекции одного кадра.
+
+        Возвращает отчёт: состояние слотов текущей фазы и завершённый шаг (если был).
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            active = packaging.get_active_session()
+            if not active:
+                self._tracker.reset()
+                self._context = None
+                self._seen_occupied.clear()
+                return {"status": "idle", "slots": {}, "completed": None}
+
+            steps_state = packaging.get_steps_state(active)
+            phase = steps_state["phase"]
+            context = (active["id"], phase)
+            if context != self._context:
+                # Новая сессия или фаза: старые наблюдения не относятся к делу.
+                self._tracker.reset()
+                self._seen_occupied.clear()
+                self._context = context
+
+            phase_steps = [
+                step for step in packaging.get_plan_for_session(active)
+                if step["phase"] == phase
+            ]
+            slots = list({step["slot"]: step["rect"] for step in phase_steps}.items())
+            states = self._tracker.observe(slots, detections, frame_w, frame_h, now)
+            self._seen_occupied.update(name for name, st in states.items() if st.occupied)
+
+            completed = None
+            current = steps_state["current_step"]
+            if current and self._is_step_done(phase, current, states.get(current["slot"])):
+                try:
+                    completed = packaging.complete_current_step(
+                        expected_step_id=current["step_id"],
+                        verify_result="ok",
+                    )
+                except packaging.PackagingTransitionError:
+                    # Шаг уже закрыли вручную — это не ошибка камеры.
+                    completed = None
+
+            return {
+                "status": "ok",
+                "phase": phase,
+                "slots": {
+                    name: {"occupied": st.occupied, "part_code": st.part_code}
+                    for name, st in states.items()
+                },
+                "completed": completed,
+            }
+
+    def _is_step_done(self, phase: str, step: dict, state: SlotState | None) -> bool:
+        if state is None or state.occupied is None:
+            return False
+        if phase == packaging.PHASE_LAYOUT:
+            return bool(state.occupied) and state.part_code == step["part_code"]
+        return (not state.occupied) and step["slot"] in self._seen_occupied
+
+
+# Глобальный экземпляр для API
+occupancy_engine = OccupancyEngine()
@@ -0,0 +1,215 @@
+"""
+Восстановление pack_sessions из журнала pack_events (event sourcing).
+
+pack_sessions меняется на месте, а pack_events хранит каждый переход.
+Replay сворачивает события в состояние сессий по той же таблице переходов,
+что и services.packaging, и сверяет результат с pack_sessions:
+- аудит: расхождения (ручные правки, сбои записи) попадают в отчёт;
+- восстановление: repair=True переписывает расходящиеся строки.
+
+Журнал читается без блокировки, станции в это время пишут. Поэтому строка
+сессии сравнивается, только если после прочитанного события у неё нет новых
+(проверка и чтение строки — один SELECT), а восстановление ещё раз проверяет
+это в транзакции записи (CAS по id последнего события).
+
+Чекпоинт хранит id последнего учтённого события и незавершённые сессии.
+Завершённая (TABLE_EMPTY) сессия больше не меняется, поэтому следующий
+replay начинает с чекпоинта и читает только новые события.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from typing import Iterable
+
+from core import storage
+from services import packaging
+
+# Индексы полей состояния сессии в replay (список — быстрее dict на миллионах событий).
+STATION, SKU, START_TIME, END_TIME, STATE, PHASE, STEP_INDEX, TOTAL_STEPS = range(8)
+
+# Сравниваемые поля pack_sessions (total_steps зависит от плана на момент старта — не сверяем).
+_COMPARED_FIELDS = (
+    ("station_id", STATION),
+    ("sku", SKU),
+    ("start_time", START_TIME),
+    ("end_time", END_TIME),
+    ("state", STATE),
+    ("phase", PHASE),
+    ("current_step_index", STEP_INDEX),
+)
+
+CHECKPOINT_EVERY_EVENTS = 200_000
+MAX_REPORTED = 100
+
+
+def fold_events(events: Iterable[tuple], sessions: dict[int, list], anomalies: list) -> int:
+    """
+    Сворачивает события (id, ts, type, session_id, sku, station_id) в sessions.
+
+    Событие, недопустимое для текущего состояния, пропускается и попадает
+    в anomalies. Возвращает id последнего события (0, если событий не было).
+    """
+    active_states = packaging.ACTIVE_STATES
+    layout_sizes: dict[str, int] = {}
+    last_id = 0
+    for event_id, ts, event_type, session_id, sku, station_id in events:
+        last_id = event_id
+        if event_type == packaging.EVENT_STEP_VERIFIED:
+            # Результат фоновой проверки шага состояние сессии не меняет.
+            continue
+        session = sessions.get(session_id)
+        if event_type == packaging.EVENT_START:
+            if session is not None:
+                anomalies.append((event_id, session_id, event_type, "повторный START"))
+                continue
+            total = layout_sizes.get(sku)
+            if total is None:
+                total = layout_sizes[sku] = len(packaging.get_plan(sku).layout)
+            sessions[session_id] = [
+                station_id, sku, ts, None,
+                packaging.STATE_STARTED, packaging.PHASE_LAYOUT, 0, total,
+            ]
+            continue
+        if session is None:
+            anomalies.append((event_id, session_id, event_type, "нет START"))
+            continue
+        if event_type == packaging.EVENT_STEP_COMPLETED:
+            if session[STATE] not in active_states:
+                anomalies.append((event_id, session_id, event_type, session[STATE]))
+                continue
+            session[STEP_INDEX] += 1
+        elif event_type == packaging.EVENT_PHASE_CHANGED:
+            if session[PHASE] != packaging.PHASE_LAYOUT:
+                anomalies.append((event_id, session_id, event_type, session[PHASE]))
+                continue
+            session[PHASE] = packaging.PHASE_PACKING
+            session[STEP_INDEX] = 0
+        else:
+            state = packaging.next_state(session[STATE], event_type)
+            if state is None:
+                anomalies.append((event_id, session_id, event_type, session[STATE]))
+                continue
+            session[STATE] = state
+            if state == packaging.STATE_TABLE_EMPTY:
+                session[END_TIME] = ts
+    return last_id
+
+
+def _diff(session: list, row: tuple | None) -> dict | None:
+    if row is None:
+        return {"missing": True}
+    db = dict(zip(storage.PACK_SESSION_REPLAY_COLUMNS, row))
+    # Старые строки без фазы/индекса трактуем как начало LAYOUT (как сервис упаковки).
+    db["phase"] = db["phase"] or packaging.PHASE_LAYOUT
+    db["current_step_index"] = db["current_step_index"] or 0
+    fields = {
+        name: [db[name], session[index]]
+        for name, index in _COMPARED_FIELDS
+        if db[name] != session[index]
+    }
+    return fields or None
+
+
+def _session_row(session_id: int, session: list) -> dict:
+    return {
+        "id": session_id,
+        "station_id": session[STATION],
+        "sku": session[SKU],
+        "start_time": session[START_TIME],
+        "end_time": session[END_TIME],
+        "state": session[STATE],
+        "phase": session[PHASE],
+        "current_step_index": session[STEP_INDEX],
+        "total_steps": session[TOTAL_STEPS],
+    }
+
+
+def rebuild(
+    full: bool = False,
+    repair: bool = False,
+    checkpoint_every: int = CHECKPOINT_EVERY_EVENTS,
+) -> dict:
+    """
+    Replay pack_events -> pack_sessions.
+
+    full=False — от последнего чекпоинта (только новые события), full=True — с нуля.
+    repair=True — переписать расходящиеся/отсутствующие строки pack_sessions.
+    Каждые checkpoint_every событий (и в конце) завершённые сессии сверяются
+    и выгружаются из памяти, а чекпоинт сохраняется.
+    """
+    started = time.perf_counter()
+    checkpoint = None if full else storage.get_replay_checkpoint()
+    from_event_id = int(checkpoint["last_event_id"]) if checkpoint else 0
+    sessions: dict[int, list] = {}
+    if checkpoint:
+        sessions = {int(k): v for k, v in json.loads(checkpoint["open_sessions_json"]).items()}
+
+    report = {
+        "from_event_id": from_event_id,
+        "last_event_id": from_event_id,
+        "events": 0,
+        "sessions_checked": 0,
+        "sessions_skipped": 0,
+        "mismatches": 0,
+        "repaired": 0,
+        "anomalies": 0,
+        "details": [],
+        "anomaly_details": [],
+    }
+    anomalies: list = []
+
+    def flush(last_event_id: int, final: bool) -> None:
+        # Сверяем завершённые сессии (в конце — все) и сохраняем чекпоинт.
+        ids = [
+            sid for sid, s in sessions.items()
+            if final or s[STATE] == packaging.STATE_TABLE_EMPTY
+        ]
+        rows, moved = storage.load_pack_sessions_by_id(ids, last_event_id)
+        to_repair = []
+        for sid in ids:
+            if sid in moved:
+                # Станция продолжила сессию после нашего прохода по журналу:
+                # сверим её при следующем replay (она останется в чекпоинте).
+                report["sessions_skipped"] += 1
+                continue
+            diff = _diff(sessions[sid], rows.get(sid))
+            if diff:
+                report["mismatches"] += 1
+                if len(report["details"]) < MAX_REPORTED:
+                    report["details"].append({"session_id": sid, **diff})
+                to_repair.append(_session_row(sid, sessions[sid]))
+        report["sessions_checked"] += len(ids) - len(moved)
+        if repair and to_repair:
+            report["repaired"] += storage.upsert_pack_sessions(to_repair, last_event_id)
+            for row in to_repair:
+                packaging.session_cache.invalidate(row["station_id"])
+        for sid in ids:
+            if sid not in moved and sessions[sid][STATE] == packaging.STATE_TABLE_EMPTY:
+                del sessions[sid]
+        if last_event_id > from_event_id:
+            storage.save_replay_checkpoint(last_event_id, json.dumps(sessions, ensure_ascii=False))
+
+    last_id = from_event_id
+    batch: list[tuple] = []
+    for event in storage.iter_pack_events(from_event_id):
+        batch.append(event)
+        if len(batch) >= checkpoint_every:
+            last_id = fold_events(batch, sessions, anomalies) or last_id
+            report["events"] += len(batch)
+            batch = []
+            flush(last_id, final=False)
+    if batch:
+        last_id = fold_events(batch, sessions, anomalies) or last_id
+        report["events"] += len(batch)
+    flush(last_id, final=True)
+
+    report["last_event_id"] = last_id
+    report["anomalies"] = len(anomalies)
+    report["anomaly_details"] = [
+        {"event_id": e, "session_id": s, "type": t, "state": st}
+        for e, s, t, st in anomalies[:MAX_REPORTED]
+    ]
+    report["elapsed_sec"] = round(time.perf_counter() - started, 3)
+    return report
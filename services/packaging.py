@@ -1,7 +1,18 @@
 import time
 import json
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
 
 from core import storage
+from core.catalog_index import catalog_index
+from core.stations import get_current_station, normalize_station_id
+from services.state_version import state_version
+from services.step_verification import EVENT_STEP_VERIFIED, VERIFY_PENDING, step_verifier
 
 STATE_STARTED = "started"
 STATE_BOX_CLOSED = "box_closed"
@@ -34,16 +45,252 @@ _ALLOWED_TRANSITIONS = {
 }
 
 
+# Незавершённые состояния: в них сессия станции считается активной.
+ACTIVE_STATES = {STATE_STARTED, STATE_BOX_CLOSED}
+
+
+def next_state(state: str | None, event_type: str) -> str | None:
+    """Состояние после события или None, если переход запрещён (та же таблица, что в apply_event)."""
+    if event_type not in _ALLOWED_TRANSITIONS.get(state, ()):
+        return None
+    return _EVENT_TO_STATE[event_type]
+
+
 class PackagingTransitionError(ValueError):
     pass
 
 
+class PackagingConflictError(PackagingTransitionError):
+    """Сессию одновременно изменил другой клиент: переход не применён (тоже 409)."""
+
+
+class PackSessionCache:
+    """
+    Последняя упаковочная сессия каждой станции в памяти (write-through).
+
+    - Чтения (/pack/ui-state, gate, переходы FSM) обслуживаются из памяти.
+    - Код, который пишет сессию в SQLite, тут же обновляет запись в кэше.
+    - Посторонних писателей (другой процесс, ручная правка БД, replay) ловим по
+      счётчику изменений pack_sessions (триггеры в SQLite). Свои переходы FSM
+      запоминают его значение внутри своей транзакции (begin_write/end_write),
+      пока держат блокировку записи — чужой коммит между нашим COMMIT и
+      проверкой за свой не примем. PRAGMA data_version — дешёвая предпроверка:
+      не сменился — в БД не писал никто, счётчик не читаем. Записи в другие
+      таблицы (heartbeat, таймеры, настройки) кэш не сбрасывают.
+
+    Старт нового SKU возможен только после TABLE_EMPTY последнего, поэтому
+    активной может быть только последняя сессия станции.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._db_key: str | None = None
+        self._data_version: int | None = None
+        # Значение счётчика pack_sessions, которому соответствует кэш.
+        self._sessions_version: int | None = None
+        self._latest: dict[str, dict | None] = {}
+        # True после load(): станции без записи в _latest сессий не имеют.
+        self._complete = False
+
+    def _reset_locked(self) -> None:
+        self._db_key = str(storage.DB)
+        self._data_version = storage.get_data_version()
+        self._sessions_version = storage.get_change_counter("pack_sessions")
+        self._latest = {}
+        self._complete = False
+
+    def _check_locked(self) -> None:
+        if self._db_key != str(storage.DB):
+            self._reset_locked()
+            return
+        data_version = storage.get_data_version()
+        if data_version == self._data_version:
+            return
+        # Кто-то закоммитил; сбрасываем кэш, только если менялись сами сессии.
+        self._data_version = data_version
+        if storage.get_change_counter("pack_sessions") != self._sessions_version:
+            self._reset_locked()
+
+    def load(self) -> None:
+        """Загружает последние сессии всех станций одним запросом (при старте)."""
+        with self._lock:
+            self._reset_locked()
+            self._latest = {
+                row["station_id"]: dict(row) for row in storage.list_latest_pack_sessions()
+            }
+            self._complete = True
+
+    def get(self, station_id: str) -> dict | None:
+        with self._lock:
+            self._check_locked()
+            if station_id not in self._latest:
+                if self._complete:
+                    return None
+                row = storage.get_latest_pack_session(station_id)
+                self._latest[station_id] = dict(row) if row else None
+            session = self._latest[station_id]
+            return dict(session) if session else None
+
+    def put(self, station_id: str, session: dict) -> None:
+        """
+        Write-through: вызывается внутри транзакции записи, до COMMIT.
+
+        Транзакция держит блокировку записи, поэтому put() разных переходов
+        выполняются в порядке их коммитов и не перетирают друг друга.
+        """
+        with self._lock:
+            if self._db_key != str(storage.DB):
+                self._reset_locked()
+            self._latest[station_id] = dict(session)
+
+    def begin_write(self, conn) -> None:
+        """
+        Начало перехода FSM (внутри BEGIN IMMEDIATE, до записей).
+
+        Если сессии успел изменить посторонний писатель — сбрасываем остальные станции
+        (свою защищает CAS), иначе end_write() принял бы его запись за нашу.
+        """
+        with self._lock:
+            if self._db_key != str(storage.DB):
+                self._reset_locked()
+            elif storage.get_change_counter("pack_sessions", conn=conn) != self._sessions_version:
+                self._latest = {}
+                self._complete = False
+
+    def end_write(self, conn) -> None:
+        """Конец перехода FSM (до COMMIT): изменения счётчика в этой транзакции — наши."""
+        with self._lock:
+            if self._db_key == str(storage.DB):
+                self._sessions_version = storage.get_change_counter("pack_sessions", conn=conn)
+
+    def invalidate(self, station_id: str) -> None:
+        """Следующее чтение станции пойдёт в SQLite (после конфликта или ошибки записи)."""
+        with self._lock:
+            self._latest.pop(station_id, None)
+            self._complete = False
+
+
+# Глобальный кэш сессий (используется всеми функциями FSM ниже)
+session_cache = PackSessionCache()
+
+
+def _station(station_id: str | None) -> str:
+    return normalize_station_id(station_id) if station_id else get_current_station()
+
+
+def _latest_row(station_id: str) -> dict | None:
+    return session_cache.get(station_id)
+
+
+def _active_row(station_id: str) -> dict | None:
+    row = _latest_row(station_id)
+    return row if row and row["state"] in ACTIVE_STATES else None
+
+
+# Внешняя транзакция (пакет событий, services.event_batch): переходы FSM
+# пишут в неё, а коммит и откат делает владелец транзакции.
+_outer_conn: contextvars.ContextVar = contextvars.ContextVar("pack_outer_conn", default=None)
+
+
+@contextmanager
+def use_transaction(conn):
+    """Переходы FSM внутри блока пишут в conn вместо собственной транзакции."""
+    token = _outer_conn.set(conn)
+    try:
+        yield conn
+    finally:
+        _outer_conn.reset(token)
+
+
+@contextmanager
+def _transition(station_id: str):
+    """
+    Один переход FSM = одна транзакция: CAS-обновление сессии и событие
+    одним коммитом. Глобального lock нет — гонки разрешает SQLite.
+    """
+    outer = _outer_conn.get()
+    try:
+        if outer is not None:
+            session_cache.begin_write(outer)
+            yield outer
+            session_cache.end_write(outer)
+            return
+        with storage.transaction() as conn:
+            session_cache.begin_write(conn)
+            yield conn
+            session_cache.end_write(conn)
+    except BaseException:
+        session_cache.invalidate(station_id)
+        raise
+
+
+def _cache_session(conn, station_id: str, session_id: int) -> None:
+    # Кэшируем строку, перечитанную после CAS в той же транзакции, а не
+    # прочитанную до неё: CAS сверяет не все поля (состояние или прогресс),
+    # и параллельная запись непроверенного поля не должна пропасть из кэша.
+    session_cache.put(station_id, dict(storage.get_pack_session(session_id, conn=conn)))
+
+
+def _conflict() -> PackagingConflictError:
+    return PackagingConflictError(
+        "Состояние упаковки изменилось параллельно (другой клиент). Обновите экран и повторите."
+    )
+
+
+def _session_dict(row) -> dict:
+    return {
+        "id": int(row["id"]),
+        "station_id": row["station_id"],
+        "shift_id": row["shift_id"],
+        "worker_id": row["worker_id"],
+        "sku": row["sku"],
+        "state": row["state"],
+        "start_time": row["start_time"],
+        "end_time": row["end_time"],
+        "phase": row["phase"],
+        "current_step_index": row["current_step_index"],
+        "total_steps": row["total_steps"],
+    }
+
+
+# Геометрия слотов на столе в нормированных координатах кадра (x, y, w, h).
+# Сетка совпадает с подсветкой в UI: буква — ряд, цифра — колонка.
+_SLOT_ORIGIN_X = 0.06
+_SLOT_ORIGIN_Y = 0.18
+_SLOT_STEP_X = 0.15
+_SLOT_STEP_Y = 0.20
+_SLOT_W = 0.12
+_SLOT_H = 0.18
+
+
+def _slot_rect(slot: str) -> list[float]:
+    """
+    Возвращает прямоугольник слота [x, y, w, h] в долях кадра.
+
+    Почему так:
+    - Движку занятости (services.occupancy) нужна геометрия слота,
+      чтобы сопоставлять детекции камеры со слотами.
+    - Пока реального справочника геометрии нет, считаем её из имени слота.
+    """
+    row = ord(slot[0].upper()) - ord("A") if slot else 0
+    try:
+        col = int(slot[1:]) - 1
+    except ValueError:
+        col = 0
+    return [
+        round(_SLOT_ORIGIN_X + _SLOT_STEP_X * max(col, 0), 4),
+        round(_SLOT_ORIGIN_Y + _SLOT_STEP_Y * max(row, 0), 4),
+        _SLOT_W,
+        _SLOT_H,
+    ]
+
+
 def _get_layout_stub(sku: str) -> list[dict]:
     """
     Возвращает учебный (stub) план выкладки по SKU.
 
     Почему так:
-    - Реальный каталог SKU будет подключён позднее.
+    - Используется, если для SKU нет плана в таблице layout_plans.
     - Нам нужна предсказуемая структура шагов, чтобы отладить workflow.
     - Структура содержит slot и part_code, чтобы фронт мог подсветить цель.
     """
@@ -61,38 +308,178 @@ def _get_layout_stub(sku: str) -> list[dict]:
     return catalog.get(sku, [{"slot": "A1", "part_code": "PART-DEFAULT"}])
 
 
-def _build_plan(sku: str) -> dict:
+def _compile_steps(layout: list[dict], phase: str) -> tuple[Mapping, ...]:
+    # Шаги только для чтения: план один на все запросы и станции.
+    prefix = "layout" if phase == PHASE_LAYOUT else "packing"
+    return tuple(
+        MappingProxyType({
+            "step_id": f"{prefix}-{idx}",
+            "phase": phase,
+            "index": idx,
+            "slot": step["slot"],
+            "part_code": step["part_code"],
+            "rect": tuple(
+                [step["x"], step["y"], step["w"], step["h"]]
+                if step.get("x") is not None
+                else _slot_rect(step["slot"])
+            ),
+        })
+        for idx, step in enumerate(layout)
+    )
+
+
+def step_dict(step: Mapping) -> dict:
+    """Изменяемая копия шага плана (для ответов API, JSON и внешнего кода)."""
+    copy = dict(step)
+    copy["rect"] = list(copy["rect"]) if copy.get("rect") is not None else None
+    return copy
+
+
+@dataclass(frozen=True)
+class CompiledPlan:
     """
-    Строит полный план упаковки: сначала LAYOUT, затем PACKING.
+    Скомпилированный план упаковки SKU: сначала LAYOUT, затем PACKING.
 
+    Один объект разделяют все запросы и станции, поэтому шаги неизменяемые
+    (MappingProxyType, rect — tuple); наружу отдаём копии через step_dict().
     Инвариант:
     - Шаги PACKING идут в обратном порядке относительно LAYOUT.
     - Это важно, потому что физическая упаковка часто идёт "сверху вниз",
       в зеркальном порядке относительно выкладки.
     """
-    layout = _get_layout_stub(sku)
-    packing = list(reversed(layout))
-    layout_steps = [
-        {
-            "step_id": f"layout-{idx}",
-            "phase": PHASE_LAYOUT,
-            "index": idx,
-            "slot": step["slot"],
-            "part_code": step["part_code"],
-        }
-        for idx, step in enumerate(layout)
-    ]
-    packing_steps = [
-        {
-            "step_id": f"packing-{idx}",
-            "phase": PHASE_PACKING,
-            "index": idx,
-            "slot": step["slot"],
-            "part_code": step["part_code"],
-        }
-        for idx, step in enumerate(packing)
-    ]
-    return {"layout": layout_steps, "packing": packing_steps, "all": layout_steps + packing_steps}
+
+    sku: str
+    plan_version: int
+    layout: tuple[Mapping, ...]
+    packing: tuple[Mapping, ...]
+
+    @property
+    def all(self) -> tuple[Mapping, ...]:
+        return self.layout + self.packing
+
+    @classmethod
+    def compile(cls, sku: str, plan_version: int, layout: list[dict]) -> "CompiledPlan":
+        return cls(
+            sku=sku,
+            plan_version=plan_version,
+            layout=_compile_steps(layout, PHASE_LAYOUT),
+            packing=_compile_steps(list(reversed(layout)), PHASE_PACKING),
+        )
+
+
+# plan_version плана по умолчанию (SKU без строк в layout_plans).
+STUB_PLAN_VERSION = 0
+
+
+class PlanCache:
+    """
+    LRU скомпилированных планов по ключу (sku, plan_version).
+
+    Раньше план собирался заново на каждый /pack/plan, /pack/steps/state
+    и каждый шаг. Теперь SKU -> plan_version запоминается, а сам план
+    компилируется один раз. Изменение каталога/плана сбрасывает версии SKU.
+    """
+
+    def __init__(self, maxsize: int = 256) -> None:
+        self._lock = threading.Lock()
+        self._maxsize = maxsize
+        self._db_key: str | None = None
+        self._versions: dict[str, int] = {}
+        self._plans: OrderedDict[tuple[str, int], CompiledPlan] = OrderedDict()
+
+    def _check_db_locked(self) -> None:
+        if self._db_key != str(storage.DB):
+            self._db_key = str(storage.DB)
+            self._versions.clear()
+            self._plans.clear()
+
+    def _store_locked(self, sku: str, version: int, layout: list[dict]) -> CompiledPlan:
+        plan = self._plans.get((sku, version))
+        if plan is None:
+            plan = CompiledPlan.compile(sku, version, layout)
+            self._plans[(sku, version)] = plan
+            while len(self._plans) > self._maxsize:
+                old_sku, old_version = next(iter(self._plans))
+                self._plans.popitem(last=False)
+                if self._versions.get(old_sku) == old_version:
+                    del self._versions[old_sku]
+        self._plans.move_to_end((sku, version))
+        self._versions[sku] = version
+        return plan
+
+    def get(self, sku: str) -> CompiledPlan:
+        with self._lock:
+            self._check_db_locked()
+            version = self._versions.get(sku)
+            if version is not None:
+                plan = self._plans.get((sku, version))
+                if plan is not None:
+                    self._plans.move_to_end((sku, version))
+                    return plan
+            version, layout = storage.load_layout_plans([sku]).get(
+                sku, (STUB_PLAN_VERSION, _get_layout_stub(sku))
+            )
+            return self._store_locked(sku, version, layout)
+
+    def warm(self, skus: list[str]) -> int:
+        """Компилирует планы для списка SKU одним запросом к БД. Возвращает их число."""
+        plans = storage.load_layout_plans(skus)
+        with self._lock:
+            self._check_db_locked()
+            for sku in skus[: self._maxsize]:
+                version, layout = plans.get(sku, (STUB_PLAN_VERSION, _get_layout_stub(sku)))
+                self._store_locked(sku, version, layout)
+        return min(len(skus), self._maxsize)
+
+    def invalidate(self, sku: str | None = None) -> None:
+        """Сбрасывает план SKU (или все планы) после изменения каталога."""
+        with self._lock:
+            if sku is None:
+                self._versions.clear()
+                self._plans.clear()
+                return
+            self._versions.pop(sku, None)
+            for key in [key for key in self._plans if key[0] == sku]:
+                del self._plans[key]
+
+
+# Глобальный кэш планов (используется FSM, API и движком киоска)
+plan_cache = PlanCache()
+
+
+def get_plan(sku: str) -> CompiledPlan:
+    """Скомпилированный план SKU из кэша."""
+    return plan_cache.get(sku)
+
+
+def warm_plan_cache() -> int:
+    """Прогревает кэш планами всех активных SKU каталога (при старте API)."""
+    return plan_cache.warm(sorted(catalog_index.active_codes()))
+
+
+def save_layout_plan(sku: str, steps: list[dict]) -> CompiledPlan:
+    """
+    Сохраняет план выкладки SKU в layout_plans и обновляет кэш.
+
+    Шаг: {"slot", "part_code", "rect": [x, y, w, h] | None}.
+    """
+    sku = (sku or "").strip()
+    if not sku:
+        raise ValueError("SKU обязателен.")
+    rows = []
+    for step in steps:
+        slot = str(step.get("slot") or "").strip()
+        part_code = str(step.get("part_code") or "").strip()
+        if not slot or not part_code:
+            raise ValueError("У каждого шага должны быть slot и part_code.")
+        rect = step.get("rect")
+        if rect is not None and len(rect) != 4:
+            raise ValueError("rect задаётся как [x, y, w, h].")
+        x, y, w, h = (float(v) for v in rect) if rect is not None else (None,) * 4
+        rows.append({"slot": slot, "part_code": part_code, "x": x, "y": y, "w": w, "h": h})
+    storage.replace_layout_plan(sku, rows)
+    plan_cache.invalidate(sku)
+    return plan_cache.get(sku)
 
 
 def verify_step(step: dict, frame=None) -> str:
@@ -101,27 +488,21 @@ def verify_step(step: dict, frame=None) -> str:
 
     Зачем:
     - Позволяет включить интерфейс проверки, не внедряя модель сейчас.
-    - Возвращаем "unknown", чтобы не блокировать поток.
+    - Вызывается в фоне (services.step_verification), не в HTTP-запросе.
     - В будущем сюда можно подать frame и вернуть ok/fail.
     """
     return "unknown"
 
 
-def get_state() -> dict:
+def get_state(station_id: str | None = None) -> dict:
     """
     Возвращает минимальное состояние упаковки для UI/логики.
 
     Если активной сессии нет, отдаём последнюю, чтобы UI мог показать
     "последнее состояние" и правильно рассчитать gate.
+    Активная сессия станции — всегда её последняя, поэтому читаем одну строку.
     """
-    active = storage.get_active_pack_session()
-    if active:
-        return {
-            "session_id": int(active["id"]),
-            "sku": active["sku"],
-            "state": active["state"],
-        }
-    latest = storage.get_latest_pack_session()
+    latest = _latest_row(_station(station_id))
     if latest:
         return {
             "session_id": int(latest["id"]),
@@ -150,52 +531,45 @@ def compute_pack_ui_flags(session: dict | None) -> dict:
     }
 
 
-def get_active_session() -> dict | None:
+def get_active_session(station_id: str | None = None) -> dict | None:
     """
-    Возвращает активную упаковочную сессию в удобном формате.
+    Возвращает активную упаковочную сессию станции в удобном формате.
 
     Это данные, которые UI показывает пользователю: SKU, состояние,
     текущая фаза и индекс шага.
     """
-    active = storage.get_active_pack_session()
-    if not active:
-        return None
-    return {
-        "id": int(active["id"]),
-        "shift_id": active["shift_id"],
-        "worker_id": active["worker_id"],
-        "sku": active["sku"],
-        "state": active["state"],
-        "start_time": active["start_time"],
-        "end_time": active["end_time"],
-        "phase": active["phase"],
-        "current_step_index": active["current_step_index"],
-        "total_steps": active["total_steps"],
-    }
+    active = _active_row(_station(station_id))
+    return _session_dict(active) if active else None
 
 
-def get_latest_session() -> dict | None:
+def get_latest_session(station_id: str | None = None) -> dict | None:
     """
-    Возвращает последнюю сессию (даже если она уже завершена).
+    Возвращает последнюю сессию станции (даже если она уже завершена).
 
     Зачем:
     - UI-флаги и gate должны учитывать последнюю упаковку.
     - Например, start следующего SKU разрешён только после TABLE_EMPTY.
     """
-    latest = storage.get_latest_pack_session()
-    if not latest:
-        return None
+    latest = _latest_row(_station(station_id))
+    return _session_dict(latest) if latest else None
+
+
+def get_snapshot(station_id: str | None = None) -> dict:
+    """
+    Согласованный снимок упаковки станции для UI одним чтением сессии.
+
+    Активная сессия, флаги FSM, состояние шагов и план считаются из одной
+    и той же записи, поэтому не могут разойтись между собой (в отличие от
+    последовательных запросов /pack/ui-state и /pack/steps/state).
+    """
+    latest = _latest_row(_station(station_id))
+    active = latest if latest and latest["state"] in ACTIVE_STATES else None
     return {
-        "id": int(latest["id"]),
-        "shift_id": latest["shift_id"],
-        "worker_id": latest["worker_id"],
-        "sku": latest["sku"],
-        "state": latest["state"],
-        "start_time": latest["start_time"],
-        "end_time": latest["end_time"],
-        "phase": latest["phase"],
-        "current_step_index": latest["current_step_index"],
-        "total_steps": latest["total_steps"],
+        "active_session": _session_dict(active) if active else None,
+        "pack_state": latest["state"] if latest else None,
+        **compute_pack_ui_flags(latest),
+        "steps": get_steps_state(active) if active else None,
+        "plan": get_plan_for_session(active) if active else None,
     }
 
 
@@ -206,7 +580,7 @@ def get_plan_for_session(session: dict) -> list[dict]:
     Мы не храним шаги в БД, а строим их из SKU,
     чтобы оставить схему гибкой на раннем этапе.
     """
-    return _build_plan(session["sku"])["all"]
+    return [step_dict(step) for step in get_plan(session["sku"]).all]
 
 
 def get_steps_state(session: dict) -> dict:
@@ -219,9 +593,9 @@ def get_steps_state(session: dict) -> dict:
 
     Важно: UI не должен вычислять эти вещи сам.
     """
-    plan = _build_plan(session["sku"])
+    plan = get_plan(session["sku"])
     phase = session["phase"] or PHASE_LAYOUT
-    steps = plan["layout"] if phase == PHASE_LAYOUT else plan["packing"]
+    steps = plan.layout if phase == PHASE_LAYOUT else plan.packing
     total_steps = len(steps)
     current_step_index = session["current_step_index"] or 0
     current_step = steps[current_step_index] if current_step_index < total_steps else None
@@ -229,11 +603,17 @@ def get_steps_state(session: dict) -> dict:
         "phase": phase,
         "current_step_index": current_step_index,
         "total_steps": total_steps,
-        "current_step": current_step,
+        "current_step": step_dict(current_step) if current_step is not None else None,
     }
 
 
-def start_session(sku: str) -> dict:
+def start_session(
+    sku: str,
+    station_id: str | None = None,
+    ts: float | None = None,
+    shift_id: int | None = None,
+    worker_id: str | None = None,
+) -> dict:
     """
     Стартует упаковочную сессию для SKU.
 
@@ -247,46 +627,79 @@ def start_session(sku: str) -> dict:
     if not sku:
         raise PackagingTransitionError("SKU обязателен для старта упаковки.")
 
-    active = storage.get_active_pack_session()
-    if active:
+    station_id = _station(station_id)
+    latest = _latest_row(station_id)
+    if latest and latest["state"] in ACTIVE_STATES:
         raise PackagingTransitionError(
             "Нельзя начать новый SKU: завершите текущую упаковку или зафиксируйте TABLE_EMPTY."
         )
-
-    latest = storage.get_latest_pack_session()
     if latest and latest["state"] != STATE_TABLE_EMPTY:
         raise PackagingTransitionError(
             "Стол должен быть пустым перед стартом следующего SKU."
         )
 
-    now = time.time()
-    plan = _build_plan(sku)
-    session_id = storage.create_pack_session(
-        sku=sku,
-        ts=now,
-        state=STATE_STARTED,
-        phase=PHASE_LAYOUT,
-        current_step_index=0,
-        total_steps=len(plan["layout"]),
-    )
-    storage.add_pack_event(
-        session_id=session_id,
-        event_type=EVENT_START,
-        ts=now,
-        sku=sku,
-    )
+    now = time.time() if ts is None else ts
+    plan = get_plan(sku)
+    expected_head = (int(latest["id"]), latest["state"]) if latest else None
+    with _transition(station_id) as conn:
+        # CAS: последняя сессия станции та же, что мы проверили выше.
+        if storage.get_latest_pack_session_head(conn, station_id) != expected_head:
+            raise _conflict()
+        session_id = storage.create_pack_session(
+            sku=sku,
+            ts=now,
+            state=STATE_STARTED,
+            shift_id=shift_id,
+            worker_id=worker_id,
+            phase=PHASE_LAYOUT,
+            current_step_index=0,
+            total_steps=len(plan.layout),
+            station_id=station_id,
+            conn=conn,
+        )
+        storage.add_pack_event(
+            session_id=session_id,
+            event_type=EVENT_START,
+            ts=now,
+            sku=sku,
+            station_id=station_id,
+            conn=conn,
+        )
+        session_cache.put(
+            station_id,
+            {
+                "id": session_id,
+                "sku": sku,
+                "start_time": now,
+                "end_time": None,
+                "state": STATE_STARTED,
+                "shift_id": shift_id,
+                "worker_id": worker_id,
+                "phase": PHASE_LAYOUT,
+                "current_step_index": 0,
+                "total_steps": len(plan.layout),
+                "station_id": station_id,
+            },
+        )
+    state_version.bump()
     return {"session_id": session_id, "sku": sku, "state": STATE_STARTED}
 
 
-def apply_event(event_type: str, sku: str | None = None) -> dict:
+def apply_event(
+    event_type: str,
+    sku: str | None = None,
+    station_id: str | None = None,
+    ts: float | None = None,
+) -> dict:
     """
     Применяет событие FSM (закрытие коробки, печать этикетки, TABLE_EMPTY).
 
     Это единственная точка, где мы меняем состояние FSM по событию,
     поэтому здесь выполняется строгая проверка разрешённых переходов.
+    ts — время события (клиентское время для пакетов), по умолчанию сейчас.
     """
-    active = storage.get_active_pack_session()
-    session = active or storage.get_latest_pack_session()
+    station_id = _station(station_id)
+    session = _latest_row(station_id)
     if not session:
         raise PackagingTransitionError("Нет активной упаковочной сессии.")
 
@@ -296,27 +709,42 @@ def apply_event(event_type: str, sku: str | None = None) -> dict:
         raise PackagingTransitionError(
             f"Событие {event_type} недоступно из состояния {current_state or 'none'}."
         )
+    if event_type == EVENT_CLOSE_BOX and step_verifier.blocks_close_box(int(session["id"])):
+        raise PackagingTransitionError("Есть шаги с непройденной или незавершённой проверкой: закрыть коробку нельзя.")
 
     next_state = _EVENT_TO_STATE[event_type]
-    now = time.time()
-    storage.add_pack_event(
-        session_id=int(session["id"]),
-        event_type=event_type,
-        ts=now,
-        sku=sku or session["sku"],
-    )
-
+    now = time.time() if ts is None else ts
     end_time = now if next_state == STATE_TABLE_EMPTY else None
-    storage.update_pack_session_state(
-        session_id=int(session["id"]),
-        state=next_state,
-        end_time=end_time,
-    )
+    with _transition(station_id) as conn:
+        if not storage.cas_pack_session_state(
+            conn,
+            session_id=int(session["id"]),
+            expected_state=current_state,
+            state=next_state,
+            end_time=end_time,
+        ):
+            raise _conflict()
+        storage.add_pack_event(
+            session_id=int(session["id"]),
+            event_type=event_type,
+            ts=now,
+            sku=sku or session["sku"],
+            station_id=station_id,
+            conn=conn,
+        )
+        _cache_session(conn, station_id, int(session["id"]))
+    state_version.bump()
 
     return {"session_id": int(session["id"]), "sku": session["sku"], "state": next_state}
 
 
-def complete_current_step() -> dict:
+def complete_current_step(
+    expected_step_id: str | None = None,
+    verify_result: str | None = None,
+    station_id: str | None = None,
+    ts: float | None = None,
+    frame=None,
+) -> dict:
     """
     Завершает текущий шаг в активной фазе.
 
@@ -324,8 +752,16 @@ def complete_current_step() -> dict:
     - Нельзя завершать шаги без активной сессии.
     - Нельзя выйти за границы списка шагов.
     - На каждый шаг пишется событие STEP_COMPLETED с подробным payload.
+
+    expected_step_id нужен автоматическим источникам (камера):
+    если оператор уже закрыл шаг вручную, мы не должны "проскочить" следующий.
+    verify_result позволяет источнику передать уже известный результат проверки.
+    Если есть кадр (frame или снимок источника кадров в момент завершения),
+    шаг завершается сразу с verify_result="pending", а проверка идёт в фоне
+    и пишет STEP_VERIFIED.
     """
-    active = storage.get_active_pack_session()
+    station_id = _station(station_id)
+    active = _active_row(station_id)
     if not active:
         raise PackagingTransitionError("Нет активной упаковочной сессии.")
 
@@ -335,14 +771,24 @@ def complete_current_step() -> dict:
         "phase": active["phase"] or PHASE_LAYOUT,
         "current_step_index": active["current_step_index"] or 0,
     }
-    plan = _build_plan(session["sku"])
-    steps = plan["layout"] if session["phase"] == PHASE_LAYOUT else plan["packing"]
+    plan = get_plan(session["sku"])
+    steps = plan.layout if session["phase"] == PHASE_LAYOUT else plan.packing
     total_steps = len(steps)
     if session["current_step_index"] >= total_steps:
         raise PackagingTransitionError("Все шаги текущей фазы уже выполнены.")
 
     step = steps[session["current_step_index"]]
-    verify_result = verify_step(step)
+    if expected_step_id is not None and step["step_id"] != expected_step_id:
+        raise PackagingTransitionError(
+            f"Текущий шаг {step['step_id']}, а не {expected_step_id}."
+        )
+    verify_async = False
+    if verify_result is None:
+        if frame is None:
+            frame = step_verifier.capture_frame(station_id)
+        # Без кадра проверять нечего — результат заглушки, как раньше.
+        verify_async = frame is not None
+        verify_result = VERIFY_PENDING if verify_async else verify_step(step)
     payload = {
         "step_id": step["step_id"],
         "phase": step["phase"],
@@ -350,24 +796,42 @@ def complete_current_step() -> dict:
         "part_code": step["part_code"],
         "verify_result": verify_result,
     }
-    now = time.time()
-    storage.add_pack_event(
-        session_id=session["id"],
-        event_type=EVENT_STEP_COMPLETED,
-        ts=now,
-        payload_json=json.dumps(payload, ensure_ascii=False),
-        sku=session["sku"],
-    )
-    storage.update_pack_session_progress(
-        session_id=session["id"],
-        phase=session["phase"],
-        current_step_index=session["current_step_index"] + 1,
-        total_steps=total_steps,
-    )
-    return {"session_id": session["id"], "step": step, "phase": session["phase"]}
+    now = time.time() if ts is None else ts
+    with _transition(station_id) as conn:
+        if not storage.cas_pack_session_progress(
+            conn,
+            session_id=session["id"],
+            expected_phase=session["phase"],
+            expected_step_index=session["current_step_index"],
+            phase=session["phase"],
+            current_step_index=session["current_step_index"] + 1,
+            total_steps=total_steps,
+        ):
+            raise _conflict()
+        step_event_id = storage.add_pack_event(
+            session_id=session["id"],
+            event_type=EVENT_STEP_COMPLETED,
+            ts=now,
+            payload_json=json.dumps(payload, ensure_ascii=False),
+            sku=session["sku"],
+            station_id=station_id,
+            conn=conn,
+        )
+        _cache_session(conn, station_id, session["id"])
+    state_version.bump()
+    if verify_async:
+        step_verifier.submit(
+            verify_step, step, frame, step_event_id, session["id"], session["sku"], station_id
+        )
+    return {
+        "session_id": session["id"],
+        "step": step_dict(step),
+        "phase": session["phase"],
+        "verify_result": verify_result,
+    }
 
 
-def advance_phase() -> dict:
+def advance_phase(station_id: str | None = None, ts: float | None = None) -> dict:
     """
     Переводит фазу с LAYOUT на PACKING.
 
@@ -375,7 +839,8 @@ def advance_phase() -> dict:
     - Перейти можно только после завершения всех шагов LAYOUT.
     - При переходе пишется событие PHASE_CHANGED.
     """
-    active = storage.get_active_pack_session()
+    station_id = _station(station_id)
+    active = _active_row(station_id)
     if not active:
         raise PackagingTransitionError("Нет активной упаковочной сессии.")
 
@@ -383,26 +848,35 @@ def advance_phase() -> dict:
     if phase != PHASE_LAYOUT:
         raise PackagingTransitionError("Перейти к PACKING можно только из LAYOUT.")
 
-    plan = _build_plan(active["sku"])
-    layout_steps = plan["layout"]
+    plan = get_plan(active["sku"])
+    layout_steps = plan.layout
     current_step_index = active["current_step_index"] or 0
     if current_step_index < len(layout_steps):
         raise PackagingTransitionError("Сначала завершите все шаги LAYOUT.")
 
-    now = time.time()
+    now = time.time() if ts is None else ts
     payload = {"from": PHASE_LAYOUT, "to": PHASE_PACKING}
-    storage.add_pack_event(
-        session_id=int(active["id"]),
-        event_type=EVENT_PHASE_CHANGED,
-        ts=now,
-        payload_json=json.dumps(payload, ensure_ascii=False),
-        sku=active["sku"],
-    )
-    packing_steps = plan["packing"]
-    storage.update_pack_session_progress(
-        session_id=int(active["id"]),
-        phase=PHASE_PACKING,
-        current_step_index=0,
-        total_steps=len(packing_steps),
-    )
+    packing_steps = plan.packing
+    with _transition(station_id) as conn:
+        if not storage.cas_pack_session_progress(
+            conn,
+            session_id=int(active["id"]),
+            expected_phase=PHASE_LAYOUT,
+            expected_step_index=current_step_index,
+            phase=PHASE_PACKING,
+            current_step_index=0,
+            total_steps=len(packing_steps),
+        ):
+            raise _conflict()
+        storage.add_pack_event(
+            session_id=int(active["id"]),
+            event_type=EVENT_PHASE_CHANGED,
+            ts=now,
+            payload_json=json.dumps(payload, ensure_ascii=False),
+            sku=active["sku"],
+            station_id=station_id,
+            conn=conn,
+        )
+        _cache_session(conn, station_id, int(active["id"]))
+    state_version.bump()
     return {"session_id": int(active["id"]), "phase": PHASE_PACKING}
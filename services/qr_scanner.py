@@ -0,0 +1,172 @@
+"""
+Сканирование QR-кодов камерой (дополнительно к сканеру-клавиатуре).
+
+Что распознаём (правила те же, что в handleScan на фронте):
+- мастер: M######## (8 цифр) -> вход в режим мастера;
+- сотрудник: W123 -> set_worker (префикс W обязателен: камера видит и чужие
+  цифровые коды — номера заказов, штрихкоды наклеек; сканер-клавиатура
+  по-прежнему принимает и голые цифры);
+- кровать: MM.Кровать.* (а также MM.BED.* / MM_BED_*) -> set_bed и старт упаковки.
+
+Декодирование (cv2.QRCodeDetector) идёт в воркере детектора по вырезанной зоне
+кадра и с ограничением частоты; в API приходят только строки кодов.
+Камера видит один и тот же код на десятках кадров подряд, поэтому повторы
+в пределах окна подавляются.
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+MASTER_RE = re.compile(r"M(\d{8})")
+WORKER_RE = re.compile(r"W(\d{1,10})", re.IGNORECASE)
+
+KIND_MASTER = "master"
+KIND_WORKER = "worker"
+KIND_BED = "bed"
+
+
+def normalize_bed_code(raw: str) -> str:
+    """
+    Приводит код кровати к виду MM.Кровать.<модель>.<цвет>.
+
+    Повторяет normalizeSkuFromQr из index.html, чтобы камера и сканер
+    давали один и тот же SKU.
+    """
+    sku = (raw or "").strip()
+    if not sku:
+        return ""
+    sku = sku.replace("BED", "Кровать", 1)
+    if sku.startswith("MM_"):
+        parts = sku.split("_")
+        if len(parts) >= 4 and parts[1] == "Кровать":
+            sku = f"MM.Кровать.{parts[2]}.{parts[3]}"
+        elif len(parts) >= 3 and parts[1] != "Кровать":
+            sku = f"MM.Кровать.{parts[1]}.{parts[2]}"
+    return sku
+
+
+def classify_code(raw: str) -> Optional[tuple[str, str]]:
+    """
+    Определяет тип кода: (kind, value) или None, если код не наш.
+
+    Камера может прочитать посторонний QR (упаковка, наклейки),
+    поэтому всё, что не подходит под форматы, отбрасываем.
+    """
+    code = (raw or "").strip()
+    if not code:
+        return None
+    match = MASTER_RE.fullmatch(code)
+    if match:
+        return KIND_MASTER, match.group(1)
+    match = WORKER_RE.fullmatch(code)
+    if match:
+        return KIND_WORKER, f"W{match.group(1)}"
+    sku = normalize_bed_code(code)
+    if sku.startswith("MM.Кровать."):
+        return KIND_BED, sku
+    return None
+
+
+def decode_qr_codes(
+    frame: np.ndarray,
+    roi: tuple[float, float, float, float] = (0.0, 0.0, 1.0, 1.0),
+    detector=None,
+) -> list[str]:
+    """
+    Декодирует QR-коды в зоне roi (x, y, w, h в долях кадра).
+
+    Вырезаем зону заранее: детектор QR на полном кадре 2560 px заметно дороже.
+    """
+    import cv2
+
+    h, w = frame.shape[:2]
+    x0, y0 = int(roi[0] * w), int(roi[1] * h)
+    x1, y1 = int((roi[0] + roi[2]) * w), int((roi[1] + roi[3]) * h)
+    crop = frame[max(0, y0):min(h, y1), max(0, x0):min(w, x1)]
+    if crop.size == 0:
+        return []
+    if crop.ndim == 3:
+        crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    detector = detector or cv2.QRCodeDetector()
+    ok, texts, _points, _ = detector.detectAndDecodeMulti(crop)
+    if not ok:
+        return []
+    return [text for text in texts if text]
+
+
+class ScanThrottle:
+    """Разрешает не чаще одного сканирования за interval_sec."""
+
+    def __init__(self, interval_sec: float = 0.5) -> None:
+        self.interval_sec = interval_sec
+        self._last = float("-inf")
+
+    def ready(self, now: float) -> bool:
+        if now - self._last < self.interval_sec:
+            return False
+        self._last = now
+        return True
+
+
+class DuplicateSuppressor:
+    """
+    Подавляет повторные чтения одного кода.
+
+    Код снова принимается только после того, как он не встречался
+    window_sec секунд (убрали из кадра и показали снова).
+    """
+
+    def __init__(self, window_sec: float = 5.0) -> None:
+        self.window_sec = window_sec
+        self._last_seen: dict[str, float] = {}
+
+    def accept(self, code: str, now: float) -> bool:
+        last = self._last_seen.get(code)
+        self._last_seen[code] = now
+        if len(self._last_seen) > 256:
+            # Чистим старые записи, чтобы словарь не рос бесконечно.
+            cutoff = now - self.window_sec
+            self._last_seen = {k: v for k, v in self._last_seen.items() if v >= cutoff}
+        return last is None or now - last > self.window_sec
+
+
+class CameraCodeRouter:
+    """
+    Раздаёт распознанные камерой коды обработчикам API.
+
+    Обработчики передаются снаружи (kiosk_api), чтобы камера шла
+    ровно по тем же путям, что и ручной скан.
+    """
+
+    def __init__(
+        self,
+        on_master: Callable[[str], None],
+        on_worker: Callable[[str], None],
+        on_bed: Callable[[str], None],
+        window_sec: float = 5.0,
+    ) -> None:
+        self._handlers = {KIND_MASTER: on_master, KIND_WORKER: on_worker, KIND_BED: on_bed}
+        self._suppressor = DuplicateSuppressor(window_sec)
+        self._lock = threading.Lock()
+
+    def handle(self, codes: list[str], now: float | None = None) -> list[dict]:
+        """Возвращает список применённых кодов: [{"kind", "value"}]."""
+        now = time.time() if now is None else now
+        applied: list[dict] = []
+        with self._lock:
+            for raw in codes:
+                parsed = classify_code(raw)
+                if not parsed:
+                    continue
+                kind, value = parsed
+                if not self._suppressor.accept(value, now):
+                    continue
+                self._handlers[kind](value)
+                applied.append({"kind": kind, "value": value})
+        return applied
@@ -0,0 +1,194 @@
+"""
+Массовый импорт каталога SKU из CSV/XLSX (выгрузка 1С).
+
+Зачем:
+- POST /api/kiosk/sku добавляет по одной позиции (проверка мастера, INSERT и
+  коммит на каждую) — выгрузку из тысяч SKU так не загрузить;
+- файл читается потоково (CSV — построчно, XLSX — openpyxl read_only),
+  строки складываются в колонки;
+- проверка идёт над колонками numpy-массивами, без цикла по строкам;
+- валидные строки пишутся одним executemany в одной транзакции
+  (ON CONFLICT(sku_code) DO UPDATE), невалидные возвращаются в отчёте.
+
+Колонки: sku_code, name, model_code, width_cm, fabric_code, color_code,
+is_active (необязательная, по умолчанию 1). Разделитель CSV — «,» или «;».
+Повтор sku_code в файле: действует последняя строка, предыдущие отклоняются.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import zipfile
+from typing import BinaryIO, Iterator
+
+import numpy as np
+
+from core import storage
+
+REQUIRED_COLUMNS = ("sku_code", "name", "model_code", "width_cm", "fabric_code", "color_code")
+COLUMNS = REQUIRED_COLUMNS + ("is_active",)
+TEXT_COLUMNS = ("sku_code", "name", "model_code", "fabric_code", "color_code")
+
+ACTIVE_VALUES = {"": 1, "1": 1, "true": 1, "да": 1, "yes": 1, "0": 0, "false": 0, "нет": 0, "no": 0}
+MAX_WIDTH_CM = 1000
+# Сколько отклонённых строк показывать в ответе (счётчик rejected — полный).
+MAX_REPORTED_ERRORS = 100
+
+
+class SkuImportError(ValueError):
+    """Файл нельзя импортировать целиком (формат, нет обязательных колонок)."""
+
+
+def _cell(value) -> str:
+    # XLSX отдаёт числа: 160.0 -> "160", чтобы ширина и коды читались как в CSV.
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _iter_csv(stream: BinaryIO) -> Iterator[list[str]]:
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        header = text.readline()
+        # 1С по умолчанию выгружает через «;».
+        delimiter = ";" if header.count(";") > header.count(",") else ","
+        yield next(csv.reader([header], delimiter=delimiter), [])
+        for row in csv.reader(text, delimiter=delimiter):
+            yield row
+    finally:
+        # Поток принадлежит вызывающему (UploadFile) — не закрываем его вместе с обёрткой.
+        text.detach()
+
+
+def _iter_xlsx(stream: BinaryIO) -> Iterator[list]:
+    from openpyxl import load_workbook
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    try:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError, OSError) as exc:
+        # Не zip или zip без книги Excel (KeyError — нет нужной части архива).
+        raise SkuImportError("Не удалось прочитать файл: это не книга XLSX.") from exc
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        workbook.close()
+
+
+def read_columns(filename: str, stream: BinaryIO) -> tuple[dict[str, np.ndarray], np.ndarray]:
+    """
+    Читает файл в колонки: ({колонка: массив строк}, номера строк в файле).
+
+    Пустые строки пропускаются. Номер строки считается с заголовком (первая строка данных — 2).
+    """
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        rows = _iter_csv(stream)
+    elif name.endswith(".xlsx"):
+        rows = _iter_xlsx(stream)
+    else:
+        raise SkuImportError("Нужен файл CSV или XLSX.")
+
+    try:
+        header = [_cell(value).lower() for value in next(rows, [])]
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise SkuImportError("Не удалось прочитать файл: нужен CSV в UTF-8.") from exc
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise SkuImportError(f"Нет колонок: {', '.join(missing)}.")
+    positions = {column: header.index(column) for column in COLUMNS if column in header}
+
+    values: dict[str, list[str]] = {column: [] for column in positions}
+    line_numbers: list[int] = []
+    try:
+        for line, row in enumerate(rows, start=2):
+            cells = [_cell(value) for value in row]
+            if not any(cells):
+                continue
+            cells.extend([""] * (len(header) - len(cells)))
+            for column, index in positions.items():
+                values[column].append(cells[index])
+            line_numbers.append(line)
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise SkuImportError("Не удалось прочитать файл: нужен CSV в UTF-8.") from exc
+
+    columns = {column: np.array(cells, dtype=str) for column, cells in values.items()}
+    if "is_active" not in columns:
+        columns["is_active"] = np.full(len(line_numbers), "", dtype=str)
+    return columns, np.array(line_numbers, dtype=np.int64)
+
+
+def validate(columns: dict[str, np.ndarray]) -> tuple[np.ndarray, list[tuple[int, str]]]:
+    """
+    Проверяет колонки целиком. Возвращает (маску валидных строк, [(индекс строки, ошибка)]).
+
+    Для строки берётся первая найденная ошибка.
+    """
+    total = len(columns["sku_code"])
+    error = np.full(total, "", dtype=object)
+
+    def reject(mask: np.ndarray, message: str) -> None:
+        error[mask & (error == "")] = message
+
+    for column in TEXT_COLUMNS:
+        reject(np.char.str_len(columns[column]) == 0, f"Пустое поле {column}.")
+
+    widths = columns["width_cm"]
+    # Только ASCII-цифры: isdigit() пропускает «²» и цифры других письменностей, которые
+    # int64 не разберёт. Длину ограничиваем до перевода: сверхдлинное число — ошибка, а не переполнение.
+    is_number = (
+        np.char.isdigit(widths)
+        & (np.char.str_len(widths) <= len(str(MAX_WIDTH_CM)))
+        & (np.char.str_len(np.char.encode(widths, "ascii", "ignore")) == np.char.str_len(widths))
+    )
+    reject(~is_number, "Ширина должна быть целым числом (см).")
+    width_values = np.where(is_number, widths, "0").astype(np.int64)
+    reject(is_number & ((width_values <= 0) | (width_values > MAX_WIDTH_CM)), "Ширина вне диапазона.")
+
+    active = np.char.lower(columns["is_active"])
+    reject(~np.isin(active, list(ACTIVE_VALUES)), "is_active должен быть 1/0.")
+
+    # Повторы кода: остаётся последняя строка с этим sku_code.
+    codes = columns["sku_code"]
+    _, last_from_end = np.unique(codes[::-1], return_index=True)
+    is_last = np.zeros(total, dtype=bool)
+    is_last[total - 1 - last_from_end] = True
+    reject(~is_last, "SKU повторяется ниже в файле.")
+
+    valid = error == ""
+    return valid, [(int(i), str(error[i])) for i in np.flatnonzero(~valid)]
+
+
+def import_catalog(filename: str, stream: BinaryIO) -> dict:
+    """
+    Импортирует файл каталога: валидные строки — upsert, остальные — в errors.
+
+    Возвращает {"total", "inserted", "updated", "unchanged", "rejected", "errors"}.
+    """
+    columns, line_numbers = read_columns(filename, stream)
+    valid, rejected = validate(columns)
+
+    selected = np.flatnonzero(valid)
+    active = np.char.lower(columns["is_active"])
+    rows = [
+        (
+            str(columns["sku_code"][i]),
+            str(columns["name"][i]),
+            str(columns["model_code"][i]),
+            int(columns["width_cm"][i]),
+            str(columns["fabric_code"][i]),
+            str(columns["color_code"][i]),
+            ACTIVE_VALUES[str(active[i])],
+        )
+        for i in selected
+    ]
+    counts = storage.upsert_sku_catalog(rows)
+    errors = [
+        {"row": int(line_numbers[i]), "sku": str(columns["sku_code"][i]), "error": message}
+        for i, message in rejected[:MAX_REPORTED_ERRORS]
+    ]
+    return {"total": len(line_numbers), **counts, "rejected": len(rejected), "errors": errors}
@@ -0,0 +1,66 @@
+"""
+Версия состояния киоска.
+
+Монотонный счётчик: любое изменение, видимое в UI (движок, FSM упаковки,
+мутирующие эндпоинты, тик таймера), увеличивает версию на 1.
+
+Зачем:
+- сервер пушит состояние клиентам только при смене версии (без опроса);
+- ожидающие корутины будятся из любого потока (воркер камеры, потоки API).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+
+
+class StateVersion:
+    """Счётчик версии с асинхронным ожиданием изменений."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._value = 0
+        self._waiters: set[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+
+    def current(self) -> int:
+        with self._lock:
+            return self._value
+
+    def bump(self) -> int:
+        """Увеличивает версию и будит всех ожидающих. Безопасно из любого потока."""
+        with self._lock:
+            self._value += 1
+            value = self._value
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # Цикл уже закрыт (клиент отключился при остановке сервера).
+                pass
+        return value
+
+    async def wait_changed(self, since: int, timeout: float) -> int:
+        """
+        Ждёт, пока версия станет больше since, но не дольше timeout.
+
+        Возвращает текущую версию (равную since, если изменений не было).
+        """
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            if self._value != since:
+                return self._value
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+        return self.current()
+
+
+# Глобальный счётчик для API и сервисов
+state_version = StateVersion()
@@ -0,0 +1,164 @@
+"""
+Аналитика времени шагов упаковки по pack_events.
+
+Длительность шага — время от предыдущего события той же сессии
+(START, предыдущий шаг, PHASE_CHANGED) до STEP_COMPLETED; результаты
+фоновой проверки (STEP_VERIFIED) действиями оператора не считаются.
+
+- refresh() инкрементально дописывает новые шаги в step_cycle_times
+  (водяной знак — id последнего учтённого события);
+- aggregate() группирует длительности за период по любому набору полей
+  (sku, step_id, worker_id, phase, slot, ...) и считает count/mean/p50/p90/max;
+- разности и агрегаты считаются numpy-массивами, без цикла по строкам.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+
+import numpy as np
+
+from core import storage
+from services import packaging
+
+WATERMARK = "step_cycle_times"
+REFRESH_CHUNK_EVENTS = 200_000
+
+GROUP_FIELDS = ("sku", "station_id", "worker_id", "phase", "step_id", "slot", "part_code")
+SORT_FIELDS = ("count", "mean_sec", "p50_sec", "p90_sec", "max_sec")
+
+# Два запроса аналитики не должны пересчитывать один и тот же диапазон одновременно.
+_refresh_lock = threading.Lock()
+
+
+def step_durations(session_ids: np.ndarray, ts: np.ndarray) -> np.ndarray:
+    """
+    Длительность до предыдущего события той же сессии (NaN для первого события сессии).
+
+    Массивы должны быть отсортированы по (session_id, id).
+    """
+    durations = np.full(len(ts), np.nan)
+    if len(ts) > 1:
+        same_session = session_ids[1:] == session_ids[:-1]
+        durations[1:] = np.where(same_session, ts[1:] - ts[:-1], np.nan)
+    return durations
+
+
+def _cycle_rows(source: list[tuple], after_id: int) -> list[tuple]:
+    ids = np.fromiter((r[0] for r in source), dtype=np.int64, count=len(source))
+    sessions = np.fromiter((r[1] for r in source), dtype=np.int64, count=len(source))
+    ts = np.fromiter((r[2] for r in source), dtype=np.float64, count=len(source))
+    is_step = np.fromiter(
+        (r[3] == packaging.EVENT_STEP_COMPLETED for r in source), dtype=bool, count=len(source)
+    )
+    durations = step_durations(sessions, ts)
+    # Опорные события до after_id нужны только для разности — сами не пишем.
+    selected = np.flatnonzero(is_step & (ids > after_id) & ~np.isnan(durations))
+
+    rows = []
+    for i in selected:
+        event_id, session_id, event_ts, _, payload_json, sku, station_id, worker_id = source[i]
+        try:
+            payload = json.loads(payload_json or "{}")
+        except ValueError:
+            payload = {}
+        rows.append(
+            (
+                event_id,
+                session_id,
+                event_ts,
+                float(durations[i]),
+                sku,
+                station_id,
+                worker_id,
+                payload.get("phase") or "",
+                payload.get("step_id") or "",
+                payload.get("slot"),
+                payload.get("part_code"),
+            )
+        )
+    return rows
+
+
+def refresh(chunk_events: int = REFRESH_CHUNK_EVENTS) -> int:
+    """Дописывает шаги новых событий в step_cycle_times. Возвращает число новых строк."""
+    with _refresh_lock:
+        after_id = storage.get_analytics_watermark(WATERMARK)
+        max_id = storage.get_max_pack_event_id()
+        added = 0
+        while after_id < max_id:
+            upto_id = min(after_id + chunk_events, max_id)
+            source = storage.load_step_cycle_source(
+                after_id, upto_id, skip_type=packaging.EVENT_STEP_VERIFIED
+            )
+            rows = _cycle_rows(source, after_id) if source else []
+            storage.save_step_cycle_times(rows, WATERMARK, upto_id)
+            added += len(rows)
+            after_id = upto_id
+        return added
+
+
+def aggregate(
+    start_ts: float,
+    end_ts: float,
+    group_by: tuple[str, ...] = ("sku", "step_id"),
+    sort: str = "mean_sec",
+    limit: int | None = None,
+) -> list[dict]:
+    """
+    Группирует длительности шагов за [start_ts, end_ts].
+
+    Возвращает [{<поля группы>, count, mean_sec, p50_sec, p90_sec, max_sec}],
+    отсортированные по sort (по убыванию).
+    """
+    unknown = [name for name in group_by if name not in GROUP_FIELDS]
+    if unknown or not group_by:
+        raise ValueError(f"Группировка возможна по полям: {', '.join(GROUP_FIELDS)}")
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"Сортировка возможна по полям: {', '.join(SORT_FIELDS)}")
+
+    rows = storage.load_step_cycle_times(start_ts, end_ts)
+    if not rows:
+        return []
+    columns = storage.STEP_CYCLE_COLUMNS
+    indexes = [columns.index(name) for name in group_by]
+    duration_index = columns.index("duration_sec")
+
+    durations = np.fromiter((r[duration_index] for r in rows), dtype=np.float64, count=len(rows))
+    keys, groups = np.unique(
+        np.array(["\x1f".join(str(r[i] or "") for i in indexes) for r in rows]),
+        return_inverse=True,
+    )
+    groups = groups.reshape(-1)
+
+    # Сортировка по (группа, длительность): квантиль группы — элемент по рангу в её отрезке.
+    order = np.lexsort((durations, groups))
+    sorted_durations = durations[order]
+    counts = np.bincount(groups, minlength=len(keys))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    means = np.bincount(groups, weights=durations, minlength=len(keys)) / counts
+
+    def quantile(p: float) -> np.ndarray:
+        ranks = np.maximum(np.ceil(p * counts).astype(np.int64) - 1, 0)
+        return sorted_durations[starts + ranks]
+
+    stats = {
+        "count": counts,
+        "mean_sec": means,
+        "p50_sec": quantile(0.5),
+        "p90_sec": quantile(0.9),
+        "max_sec": sorted_durations[starts + counts - 1],
+    }
+    top = np.argsort(-stats[sort], kind="stable")
+    if limit is not None:
+        top = top[:limit]
+
+    result = []
+    for g in top:
+        item = dict(zip(group_by, keys[g].split("\x1f")))
+        item["count"] = int(counts[g])
+        for name in ("mean_sec", "p50_sec", "p90_sec", "max_sec"):
+            item[name] = round(float(stats[name][g]), 3)
+        result.append(item)
+    return result
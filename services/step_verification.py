@@ -0,0 +1,241 @@
+"""
+Асинхронная CV-проверка завершённых шагов упаковки.
+
+Зачем:
+- инференс проверки может занимать сотни миллисекунд, а HTTP-запрос
+  оператора не должен его ждать;
+- шаг завершается сразу с verify_result="pending", проверка идёт в фоне
+  по кадру, снятому в момент завершения;
+- результат пишется отдельным событием STEP_VERIFIED (step_event_id —
+  id события STEP_COMPLETED), UI видит его через ленту событий состояния.
+
+Без кадра проверять нечего: если кадр не передан и источник кадров не
+настроен, шаг получает результат заглушки сразу, как раньше.
+
+Настройки (переменные окружения, как у воркера детектора):
+- KZ_VERIFY_CAMERA=1 — держать в API свой источник кадров (KZ_CAMERA_URL);
+- KZ_VERIFY_TIMEOUT_SEC — сколько ждать проверку, дальше результат "timeout";
+- KZ_VERIFY_FAILURE_POLICY — что делать с неуспешной проверкой
+  (fail/timeout/error):
+  ignore — только записать; warn — показать предупреждение в UI (по умолчанию);
+  block — дополнительно запретить закрытие коробки, пока в сессии есть провалы
+  или проверки, результат которых ещё не записан.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from core import storage
+from services.state_version import state_version
+
+EVENT_STEP_VERIFIED = "STEP_VERIFIED"
+
+VERIFY_PENDING = "pending"
+VERIFY_TIMEOUT = "timeout"
+VERIFY_ERROR = "error"
+FAILED_RESULTS = frozenset({"fail", VERIFY_TIMEOUT, VERIFY_ERROR})
+
+POLICY_IGNORE = "ignore"
+POLICY_WARN = "warn"
+POLICY_BLOCK = "block"
+POLICIES = (POLICY_IGNORE, POLICY_WARN, POLICY_BLOCK)
+
+DEFAULT_TIMEOUT_SEC = 2.0
+VERIFY_CAMERA_ENV = "KZ_VERIFY_CAMERA"
+DEFAULT_CAMERA_URL = "http://127.0.0.1:8080/stream"
+
+logger = logging.getLogger(__name__)
+
+
+def is_camera_enabled() -> bool:
+    return os.getenv(VERIFY_CAMERA_ENV, "0") == "1"
+
+
+def load_config_from_env() -> dict:
+    policy = os.getenv("KZ_VERIFY_FAILURE_POLICY", POLICY_WARN)
+    return {
+        "timeout_sec": float(os.getenv("KZ_VERIFY_TIMEOUT_SEC", str(DEFAULT_TIMEOUT_SEC))),
+        "policy": policy if policy in POLICIES else POLICY_WARN,
+    }
+
+
+class StepVerifier:
+    """
+    Очередь проверок шагов: один фоновый поток инференса и таймер на каждую проверку.
+
+    Результат пишется ровно один раз: первым из «проверка завершилась» и «истёк таймаут».
+    Зависшую проверку поток не прерывает — её поздний результат просто игнорируется.
+    """
+
+    def __init__(self, timeout_sec: float = DEFAULT_TIMEOUT_SEC, policy: str = POLICY_WARN) -> None:
+        self.timeout_sec = timeout_sec
+        self.policy = policy
+        self.frame_source: Optional[Callable[[str], Any]] = None
+        self._camera = None
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="step-verify")
+        self._pending: dict[int, threading.Timer] = {}
+        # Проверки, результат которых ещё не записан (включая запись в процессе).
+        self._inflight = 0
+        # То же по сессиям: session_id -> число незаписанных проверок.
+        self._inflight_by_session: dict[int, int] = {}
+
+    def configure(self, timeout_sec: float | None = None, policy: str | None = None) -> None:
+        if timeout_sec is not None:
+            self.timeout_sec = float(timeout_sec)
+        if policy is not None:
+            if policy not in POLICIES:
+                raise ValueError(f"Политика проверки должна быть одной из: {', '.join(POLICIES)}")
+            self.policy = policy
+
+    def set_frame_source(self, source: Optional[Callable[[str], Any]]) -> None:
+        """source(station_id) -> кадр (numpy) или None; вызывается в момент завершения шага."""
+        self.frame_source = source
+
+    def start_camera(self, url: str | None = None) -> None:
+        # core.camera тянет OpenCV — импортируем только когда проверка по камере включена.
+        from core.camera import FrameSource
+
+        self._camera = FrameSource(url or os.getenv("KZ_CAMERA_URL", DEFAULT_CAMERA_URL))
+        self._camera.start()
+
+        def latest_frame(_station_id: str):
+            _, _, frame = self._camera.latest()
+            return None if frame is None else frame.copy()
+
+        self.set_frame_source(latest_frame)
+
+    def stop(self) -> None:
+        self.set_frame_source(None)
+        self.wait_idle(timeout=self.timeout_sec + 1.0)
+        if self._camera is not None:
+            self._camera.stop()
+            self._camera = None
+
+    def capture_frame(self, station_id: str):
+        source = self.frame_source
+        if source is None:
+            return None
+        try:
+            return source(station_id)
+        except Exception:
+            logger.exception("Не удалось снять кадр для проверки шага")
+            return None
+
+    def pending_count(self, session_id: int | None = None) -> int:
+        """Незаписанные проверки: все или только сессии session_id."""
+        with self._lock:
+            if session_id is None:
+                return self._inflight
+            return self._inflight_by_session.get(session_id, 0)
+
+    def submit(
+        self,
+        verify_fn: Callable[[dict, Any], str],
+        step: dict,
+        frame,
+        step_event_id: int,
+        session_id: int,
+        sku: str,
+        station_id: str,
+    ) -> None:
+        """Ставит проверку шага в очередь; результат придёт событием STEP_VERIFIED."""
+        job = {
+            "step": dict(step),
+            "step_event_id": step_event_id,
+            "session_id": session_id,
+            "sku": sku,
+            "station_id": station_id,
+            "started": time.time(),
+        }
+        timer = threading.Timer(self.timeout_sec, self._finish, args=(job, VERIFY_TIMEOUT))
+        timer.daemon = True
+        with self._lock:
+            self._pending[step_event_id] = timer
+            self._inflight += 1
+            self._inflight_by_session[session_id] = self._inflight_by_session.get(session_id, 0) + 1
+        timer.start()
+        future = self._pool.submit(verify_fn, job["step"], frame)
+        future.add_done_callback(lambda f: self._finish(job, self._result(f)))
+
+    def wait_idle(self, timeout: float = 5.0) -> bool:
+        """Ждёт записи всех результатов (для тестов и остановки сервиса)."""
+        deadline = time.monotonic() + timeout
+        while self.pending_count():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    @staticmethod
+    def _result(future: Future) -> str:
+        exc = future.exception()
+        if exc is not None:
+            logger.warning("Проверка шага упала: %s", exc)
+            return VERIFY_ERROR
+        return str(future.result() or "unknown")
+
+    def _finish(self, job: dict, result: str) -> None:
+        with self._lock:
+            timer = self._pending.pop(job["step_event_id"], None)
+        if timer is None:
+            return
+        timer.cancel()
+        try:
+            self._write_result(job, result)
+        finally:
+            with self._lock:
+                self._inflight -= 1
+                left = self._inflight_by_session.pop(job["session_id"], 1) - 1
+                if left:
+                    self._inflight_by_session[job["session_id"]] = left
+
+    def _write_result(self, job: dict, result: str) -> None:
+        now = time.time()
+        payload = {
+            "step_event_id": job["step_event_id"],
+            "step_id": job["step"].get("step_id"),
+            "phase": job["step"].get("phase"),
+            "slot": job["step"].get("slot"),
+            "result": result,
+            "failed": result in FAILED_RESULTS,
+            "latency_sec": round(now - job["started"], 3),
+        }
+        try:
+            written = storage.add_step_verified_event(
+                step_event_id=job["step_event_id"],
+                session_id=job["session_id"],
+                event_type=EVENT_STEP_VERIFIED,
+                ts=now,
+                payload_json=json.dumps(payload, ensure_ascii=False),
+                sku=job["sku"],
+                station_id=job["station_id"],
+            )
+        except Exception:
+            logger.exception("Не удалось записать результат проверки шага")
+            return
+        if written:
+            state_version.bump()
+
+    def blocks_close_box(self, session_id: int, conn=None) -> bool:
+        """
+        Политика block: закрыть коробку нельзя, пока в сессии есть проваленные
+        или ещё не завершённые проверки (иначе провал придёт уже после закрытия).
+        """
+        if self.policy != POLICY_BLOCK:
+            return False
+        # Сначала незавершённые: проверка пишет результат до того, как перестаёт
+        # считаться незавершённой, поэтому между двумя чтениями провал не потеряется.
+        if self.pending_count(session_id):
+            return True
+        return storage.count_failed_step_verifications(session_id, EVENT_STEP_VERIFIED, conn=conn) > 0
+
+
+step_verifier = StepVerifier(**load_config_from_env())
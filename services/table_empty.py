@@ -0,0 +1,184 @@
+"""
+Автоматическое подтверждение TABLE_EMPTY по камере.
+
+Идея (без нейросети):
+- берём уменьшенный серый снимок зоны стола (ROI), например 64×48;
+- сравниваем его с эталоном пустого стола;
+- если стол устойчиво чист заданное время (debounce) — шлём EVENT_TABLE_EMPTY
+  через services.packaging.apply_event, как это делает кнопка оператора.
+
+Стоимость проверки — доли миллисекунды на снимок 64×48; уменьшение кадра
+делается в воркере детектора (там уже есть кадр), в API приходит только снимок.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from core import storage
+from services import packaging
+
+THUMB_SIZE = (64, 48)  # (ширина, высота)
+
+# Автоподтверждение разрешаем только после закрытия коробки:
+# в начале LAYOUT стол тоже пустой, но это не конец упаковки.
+_AUTO_EMPTY_STATES = {packaging.STATE_BOX_CLOSED, packaging.STATE_LABEL_PRINTED}
+
+
+def table_thumbnail(
+    frame: np.ndarray,
+    roi: tuple[float, float, float, float] = (0.0, 0.0, 1.0, 1.0),
+    size: tuple[int, int] = THUMB_SIZE,
+) -> np.ndarray:
+    """
+    Уменьшенный серый снимок зоны стола.
+
+    roi — (x, y, w, h) в долях кадра. Сначала прореживаем кадр до сетки 4×
+    от целевого размера, затем усредняем блоки 4×4: это дешевле полного
+    ресайза и даёт сглаживание шума матрицы.
+    """
+    h, w = frame.shape[:2]
+    x0 = int(max(0.0, roi[0]) * w)
+    y0 = int(max(0.0, roi[1]) * h)
+    x1 = max(x0 + 1, int(min(1.0, roi[0] + roi[2]) * w))
+    y1 = max(y0 + 1, int(min(1.0, roi[1] + roi[3]) * h))
+    crop = frame[y0:y1, x0:x1]
+
+    tw, th = size
+    ys = np.linspace(0, crop.shape[0] - 1, th * 4).astype(np.intp)
+    xs = np.linspace(0, crop.shape[1] - 1, tw * 4).astype(np.intp)
+    small = crop[np.ix_(ys, xs)].astype(np.float32)
+    if small.ndim == 3:
+        # BGR -> яркость (веса BT.601).
+        small = small @ np.asarray([0.114, 0.587, 0.299], dtype=np.float32)
+    return small.reshape(th, 4, tw, 4).mean(axis=(1, 3))
+
+
+def changed_fraction(thumb: np.ndarray, reference: np.ndarray, pixel_threshold: float = 25.0) -> float:
+    """
+    Доля "изменившихся" пикселей относительно эталона.
+
+    Общий сдвиг яркости (облако, включили свет) вычитаем медианой разницы,
+    чтобы он не считался предметом на столе.
+    """
+    diff = thumb.astype(np.float32) - reference.astype(np.float32)
+    diff -= np.median(diff)
+    return float(np.mean(np.abs(diff) > pixel_threshold))
+
+
+class TableEmptyMonitor:
+    """
+    Следит за зоной стола и подтверждает TABLE_EMPTY после debounce.
+
+    Эталон пустого стола:
+    - задаётся явно (capture_reference) и сохраняется рядом с БД;
+    - медленно подстраивается под освещение, пока стол считается пустым.
+    """
+
+    def __init__(
+        self,
+        debounce_sec: float = 3.0,
+        max_changed_fraction: float = 0.02,
+        pixel_threshold: float = 25.0,
+        adapt_rate: float = 0.02,
+    ) -> None:
+        self.debounce_sec = debounce_sec
+        self.max_changed_fraction = max_changed_fraction
+        self.pixel_threshold = pixel_threshold
+        self.adapt_rate = adapt_rate
+        self._lock = threading.Lock()
+        self._reference: Optional[np.ndarray] = None
+        self._reference_loaded = False
+        self._clear_since: Optional[float] = None
+        self._last_fraction: Optional[float] = None
+        self._emitted_session_id: Optional[int] = None
+
+    def _reference_path(self) -> Path:
+        return Path(storage.DB).parent / "table_reference.npy"
+
+    def _ensure_reference_locked(self) -> None:
+        if self._reference_loaded:
+            return
+        self._reference_loaded = True
+        path = self._reference_path()
+        if path.exists():
+            self._reference = np.load(path).astype(np.float32)
+
+    def capture_reference(self, thumb: np.ndarray) -> None:
+        """Запоминает текущий снимок как эталон пустого стола."""
+        with self._lock:
+            self._reference = np.asarray(thumb, dtype=np.float32).copy()
+            self._reference_loaded = True
+            self._clear_since = None
+            path = self._reference_path()
+            path.parent.mkdir(exist_ok=True)
+            np.save(path, self._reference)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._reference = None
+            self._reference_loaded = False
+            self._clear_since = None
+            self._last_fraction = None
+            self._emitted_session_id = None
+
+    def status(self) -> dict:
+        with self._lock:
+            self._ensure_reference_locked()
+            return {
+                "has_reference": self._reference is not None,
+                "changed_fraction": self._last_fraction,
+                "clear_since": self._clear_since,
+            }
+
+    def update(self, thumb: np.ndarray, now: float | None = None) -> dict:
+        """
+        Обрабатывает очередной снимок стола.
+
+        Возвращает {"clear", "changed_fraction", "emitted"}; emitted=True,
+        если именно этот вызов зафиксировал TABLE_EMPTY.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._ensure_reference_locked()
+            if self._reference is None or self._reference.shape != np.shape(thumb):
+                return {"clear": None, "changed_fraction": None, "emitted": False}
+
+            fraction = changed_fraction(thumb, self._reference, self.pixel_threshold)
+            self._last_fraction = fraction
+            clear = fraction <= self.max_changed_fraction
+            if not clear:
+                self._clear_since = None
+                return {"clear": False, "changed_fraction": fraction, "emitted": False}
+
+            # Пока стол пустой, подтягиваем эталон к текущему освещению.
+            self._reference += self.adapt_rate * (np.asarray(thumb, dtype=np.float32) - self._reference)
+            if self._clear_since is None:
+                self._clear_since = now
+            emitted = False
+            if now - self._clear_since >= self.debounce_sec:
+                emitted = self._emit_table_empty_locked()
+            return {"clear": True, "changed_fraction": fraction, "emitted": emitted}
+
+    def _emit_table_empty_locked(self) -> bool:
+        state = packaging.get_state()
+        if state["state"] not in _AUTO_EMPTY_STATES:
+            return False
+        if state["session_id"] == self._emitted_session_id:
+            return False
+        try:
+            packaging.apply_event(packaging.EVENT_TABLE_EMPTY)
+        except packaging.PackagingTransitionError:
+            # Оператор успел подтвердить вручную — это нормально.
+            return False
+        self._emitted_session_id = state["session_id"]
+        return True
+
+
+# Глобальный экземпляр для API
+table_empty_monitor = TableEmptyMonitor()
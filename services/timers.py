@@ -90,13 +90,17 @@ def record_timer_state(
     reason: str | None,
     ts: float,
     worker_id: str | None = None,
+    conn=None,
 ) -> bool:
     """
     Идемпотентная запись состояния таймера.
     - Если последнее событие уже такое же, не пишем дубликат.
     - Возвращаем True, если событие записано; False — если пропущено.
+    - conn — внешняя транзакция (пакет событий): читаем и пишем в ней.
     """
-    conn = get_conn()
+    own_conn = conn is None
+    if own_conn:
+        conn = get_conn()
     cur = conn.cursor()
     cur.execute(
         """SELECT type
@@ -107,7 +111,8 @@ def record_timer_state(
         [shift_id, WORK_STARTED, IDLE_STARTED],
     )
     row = cur.fetchone()
-    conn.close()
+    if own_conn:
+        conn.close()
 
     if row and _state_for_event_type(row["type"]) == state:
         return False
@@ -120,6 +125,7 @@ def record_timer_state(
         shift_id=shift_id,
         session_id=session_id,
         worker_id=worker_id,
+        conn=None if own_conn else conn,
     )
     return True
 
@@ -130,6 +136,7 @@ def record_heartbeat(
     ts: float,
     worker_id: str | None = None,
     source: str | None = None,
+    conn=None,
 ) -> int:
     """
     Запись heartbeat-события.
@@ -145,6 +152,7 @@ def record_heartbeat(
         shift_id=shift_id,
         session_id=session_id,
         worker_id=worker_id,
+        conn=conn,
     )
 
 
@@ -0,0 +1,42 @@
+from core import beds_catalog
+from core.beds_catalog import get_bed_info, load_bed_codes, parse_sku
+
+
+def test_factory_codes_keep_hand_written_descriptions():
+    # Раньше эти строки собирал _add() для каждого кода вручную.
+    info = beds_catalog.BEDS["MM.Кровать.003-14-VelutaLux.26"]
+    assert info.title == "Кровать VelutaLux 003-14"
+    assert info.details == "Модель 003-14 | Ширина 140 см | Цвет 26"
+    assert len(beds_catalog.BEDS) == 27
+
+
+def test_grammar_decodes_codes_outside_the_file():
+    parsed = parse_sku("MM.Кровать.005-18-Nova.11")
+    assert (parsed.model_code, parsed.width_cm, parsed.fabric, parsed.color_code) == ("005-18", 180, "Nova", "11")
+    assert parse_sku("MM.Кровать.007-160-Nova.02").width_cm == 160
+
+    info = get_bed_info("MM.Кровать.005-18-Nova.11")
+    assert info.title == "Кровать Nova 005-18"
+    assert info.details == "Модель 005-18 | Ширина 180 см | Цвет 11"
+
+    for code in ("SKU-1", "MM.Кровать.001-12-VelutaLux", "MM.Кровать.001-1-VelutaLux.07", ""):
+        assert get_bed_info(code) is None
+
+
+def test_parse_is_memoized():
+    parse_sku.cache_clear()
+    first = parse_sku("MM.Кровать.001-12-VelutaLux.07")
+    assert parse_sku("MM.Кровать.001-12-VelutaLux.07") is first
+    assert parse_sku.cache_info().hits == 1
+
+
+def test_loader_reads_factory_file(tmp_path):
+    path = tmp_path / "codes.txt"
+    path.write_text(
+        "# фабрика 2\nMM.Кровать.010-16-Ottava.01  # новинка\n\nMM.Матрас.200\n",
+        encoding="utf-8",
+    )
+    beds, unparsed = load_bed_codes(path)
+    assert list(beds) == ["MM.Кровать.010-16-Ottava.01"]
+    assert beds["MM.Кровать.010-16-Ottava.01"].details == "Модель 010-16 | Ширина 160 см | Цвет 01"
+    assert unparsed == ["MM.Матрас.200"]
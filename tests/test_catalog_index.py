@@ -0,0 +1,93 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from core import storage
+from core.catalog_index import catalog_index
+from core.kiosk_settings import kiosk_settings
+from service.kiosk_api import app
+
+
+def _setup_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_catalog_index.db"
+    monkeypatch.setattr(storage, "DB", db_path)
+    storage.DB.parent.mkdir(exist_ok=True)
+    storage.init_db()
+
+
+def _forbid_catalog_reads(monkeypatch):
+    def fail(*_args, **_kwargs):
+        raise AssertionError("каталог прочитан из БД")
+
+    for name in ("list_sku_catalog", "get_active_sku_codes"):
+        monkeypatch.setattr(storage, name, fail)
+
+
+def test_lookups_and_bed_info_fallback(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    storage.create_sku_catalog_item("MM.Кровать.005-16-Nova.01", "Кровать Nova 160", "005-16", 160, "NV", "01")
+    storage.create_sku_catalog_item("MM.Кровать.005-18-Nova.01", "Кровать Nova 180", "005-18", 180, "NV", "01")
+    storage.create_sku_catalog_item("MM.Кровать.005-16-Nova.02", "Архив", "005-16", 160, "NV", "02", is_active=0)
+
+    assert catalog_index.active_codes() == {"MM.Кровать.005-16-Nova.01", "MM.Кровать.005-18-Nova.01"}
+    _forbid_catalog_reads(monkeypatch)
+
+    assert [row["sku_code"] for row in catalog_index.by_model("005-16")] == ["MM.Кровать.005-16-Nova.01"]
+    assert len(catalog_index.by_model("005-16", include_inactive=True)) == 2
+    assert catalog_index.by_prefix("MM.Кровать.005-1") == [
+        "MM.Кровать.005-16-Nova.01",
+        "MM.Кровать.005-18-Nova.01",
+    ]
+    assert catalog_index.by_prefix("MM.Кровать.005", limit=1) == ["MM.Кровать.005-16-Nova.01"]
+
+    info = catalog_index.bed_info("MM.Кровать.005-16-Nova.01")
+    assert info.title == "Кровать Nova 160"
+    assert info.details == "Модель 005-16 | Ширина 160 см | Цвет 01"
+    # Нет в каталоге мастера — справочник BEDS.
+    assert catalog_index.bed_info("MM.Кровать.001-12-VelutaLux.07").title == "Кровать VelutaLux 001-12"
+    assert catalog_index.bed_info("UNKNOWN") is None
+
+
+def test_api_changes_refresh_index_without_reload(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    client = TestClient(app)
+    kiosk_settings.set_master("13540876", int(time.time()))
+    assert catalog_index.active_codes() == frozenset()
+
+    reloads = []
+    list_sku_catalog = storage.list_sku_catalog
+    monkeypatch.setattr(
+        storage, "list_sku_catalog", lambda *a, **kw: reloads.append(1) or list_sku_catalog(*a, **kw)
+    )
+
+    sku_id = client.post(
+        "/api/kiosk/sku",
+        json={
+            "sku_code": "A-1",
+            "name": "Кровать",
+            "model_code": "001-12",
+            "width_cm": 120,
+            "fabric_code": "VL",
+            "color_code": "07",
+        },
+    ).json()["id"]
+    assert catalog_index.active_codes() == {"A-1"}
+
+    client.put(f"/api/kiosk/sku/{sku_id}", json={"name": "Кровать новая", "is_active": False})
+    assert catalog_index.active_codes() == frozenset()
+    assert catalog_index.get("A-1")["name"] == "Кровать новая"
+    assert reloads == []
+
+    # Импорт плана проверяет SKU по индексу.
+    client.put(f"/api/kiosk/sku/{sku_id}", json={"is_active": True})
+    with storage.transaction() as conn:
+        conn.execute(
+            "INSERT INTO worker_shifts(worker_id, work_center, start_time) VALUES ('1', 'wc', ?)",
+            [time.time()],
+        )
+    _forbid_catalog_reads(monkeypatch)
+    resp = client.post(
+        "/api/kiosk/shift_plan/import",
+        files={"file": ("plan.csv", b"sku_code,qty\nA-1,2\nB-2,1\n")},
+    ).json()
+    assert [err["sku"] for err in resp["errors"]] == ["B-2"]
@@ -0,0 +1,46 @@
+from fastapi.testclient import TestClient
+
+from core import storage
+from core.logic import engine
+from service.kiosk_api import app
+
+
+def _setup_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_conditional_get.db"
+    monkeypatch.setattr(storage, "DB", db_path)
+    storage.DB.parent.mkdir(exist_ok=True)
+    storage.init_db()
+
+
+def test_state_etag_answers_304_without_recomputing(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    client = TestClient(app)
+
+    first = client.get("/api/kiosk/state")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert etag.startswith('"') and not etag.startswith('W/')
+
+    calls = []
+    original = engine.get_ui_state
+    monkeypatch.setattr(engine, "get_ui_state", lambda: calls.append(1) or original())
+    cached = client.get("/api/kiosk/state", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
+    # Совпавший ETag не пересчитывает состояние.
+    assert calls == []
+
+    # Мутирующий запрос поднимает версию — ETag меняется, отдаём 200.
+    assert client.post("/api/kiosk/pack/start", json={"sku": "SKU-1"}).status_code == 200
+    fresh = client.get("/api/kiosk/pack/ui-state", headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert fresh.headers["etag"] != etag
+
+
+def test_errors_are_not_tagged(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    client = TestClient(app)
+    # Без активной сессии /pack/steps/state отвечает 409 — такой ответ не кешируем.
+    resp = client.get("/api/kiosk/pack/steps/state")
+    assert resp.status_code == 409
+    assert "etag" not in resp.headers
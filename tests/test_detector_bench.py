@@ -0,0 +1,43 @@
+import numpy as np
+
+from bench.detector_bench import check_budget, run_batches, summarize
+
+
+class _FakeDetector:
+    # Вместо модели: считаем вызовы, чтобы проверить разбиение на пакеты.
+    def __init__(self):
+        self.batch_sizes = []
+
+    def detect_batch(self, frames):
+        self.batch_sizes.append(len(frames))
+        return [[] for _ in frames]
+
+
+def test_summarize_percentiles_and_fps():
+    summary = summarize([0.010] * 19 + [0.100], frames_done=40, wall_sec=2.0)
+    assert summary["p50_ms"] == 10.0
+    assert summary["p95_ms"] > 10.0
+    assert summary["fps"] == 20.0
+    assert summary["frames"] == 40
+
+
+def test_run_batches_skips_warmup_in_measurement():
+    detector = _FakeDetector()
+    frames = [np.zeros((4, 4, 3), dtype=np.uint8)] * 10
+    summary = run_batches(detector, frames, batch_size=4, warmup=1)
+    # 1 warmup-пакет + 3 измеряемых (4 + 4 + 2 кадра).
+    assert detector.batch_sizes == [4, 4, 4, 2]
+    assert summary["frames"] == 10
+
+
+def test_check_budget_limits_and_regression():
+    results = {"configs": {"torch/640/1": {"p95_ms": 120.0, "fps": 9.0, "peak_rss_mb": 900.0}}}
+    baseline = {"configs": {"torch/640/1": {"p95_ms": 100.0, "fps": 10.0}}}
+
+    assert check_budget(results, {"max_p95_ms": 150, "min_fps": 5}) == []
+    assert len(check_budget(results, {"max_p95_ms": 100})) == 1
+    assert len(check_budget(results, {"configs": {"torch/640/1": {"max_peak_rss_mb": 500}}})) == 1
+
+    # p95 +20 % и FPS -10 % при допуске 5 % — два нарушения.
+    assert len(check_budget(results, {"max_regression": 0.05}, baseline)) == 2
+    assert check_budget(results, {"max_regression": 0.25}, baseline) == []
@@ -0,0 +1,32 @@
+import sys
+
+from service.detector_worker import DetectorWorkerSupervisor
+
+
+def test_api_import_does_not_pull_torch():
+    # Инвариант: процесс API не импортирует torch/ultralytics — только воркер.
+    import service.kiosk_api  # noqa: F401
+
+    assert "torch" not in sys.modules
+    assert "ultralytics" not in sys.modules
+    assert "core.detector" not in sys.modules
+
+
+def test_supervisor_dispatch_isolates_failing_handler():
+    supervisor = DetectorWorkerSupervisor(config={})
+    received = []
+
+    def broken(_result):
+        raise RuntimeError("boom")
+
+    supervisor.add_handler(broken)
+    supervisor.add_handler(received.append)
+
+    result = {"ts": 1.0, "frame_id": 1, "frame_w": 640, "frame_h": 480, "detections": []}
+    supervisor._dispatch(result)
+
+    assert received == [result]
+    assert supervisor.latest() == result
+    status = supervisor.status()
+    assert status["running"] is False
+    assert status["last_result_ts"] == 1.0
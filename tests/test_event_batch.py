@@ -0,0 +1,134 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from core import storage
+from services import event_batch, packaging
+from services.state_version import state_version
+from service.kiosk_api import app
+
+
+def _setup_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_event_batch.db"
+    monkeypatch.setattr(storage, "DB", db_path)
+    storage.DB.parent.mkdir(exist_ok=True)
+    storage.init_db()
+
+
+def _pack_event_types():
+    conn = storage.get_conn()
+    rows = conn.execute("SELECT type, ts FROM pack_events ORDER BY id").fetchall()
+    conn.close()
+    return [(row["type"], row["ts"]) for row in rows]
+
+
+def test_batch_applies_events_in_order_with_per_event_results(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    client = TestClient(app)
+
+    events = [
+        {"type": "pack_start", "sku": "SKU-2", "idempotency_key": "k1", "ts": 1000.0},
+        {"type": "print_label", "idempotency_key": "k2", "ts": 1001.0},
+        {"type": "step_complete", "idempotency_key": "k3", "ts": 1002.0},
+        {"type": "close_box", "idempotency_key": "k4", "ts": 1003.0},
+        {"type": "heartbeat", "idempotency_key": "k5"},
+    ]
+    resp = client.post("/api/kiosk/events/batch", json={"events": events})
+    assert resp.status_code == 200
+    results = resp.json()["results"]
+    assert [r["status"] for r in results] == ["ok", "error", "ok", "ok", "error"]
+    # print-label до close-box — тот же 409, что и у одиночного запроса.
+    assert results[1]["code"] == 409
+    assert resp.json()["applied"] == 3
+
+    # Клиентское время сохраняется в событиях, неудачное событие не записано.
+    assert _pack_event_types() == [
+        ("START", 1000.0),
+        ("STEP_COMPLETED", 1002.0),
+        ("BOX_CLOSED", 1003.0),
+    ]
+    assert packaging.get_state()["state"] == packaging.STATE_BOX_CLOSED
+
+
+def test_batch_replay_is_idempotent(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    client = TestClient(app)
+    events = [
+        {"type": "pack_start", "sku": "SKU-1", "idempotency_key": "a"},
+        {"type": "step_complete", "idempotency_key": "b"},
+    ]
+    first = client.post("/api/kiosk/events/batch", json={"events": events}).json()
+    replay = client.post("/api/kiosk/events/batch", json={"events": events}).json()
+
+    assert [r["status"] for r in first["results"]] == ["ok", "ok"]
+    assert [r["status"] for r in replay["results"]] == ["duplicate", "duplicate"]
+    assert replay["results"][1]["result"] == first["results"][1]["result"]
+    assert [t for t, _ in _pack_event_types()] == ["START", "STEP_COMPLETED"]
+
+
+def test_idempotency_keys_are_scoped_per_station(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    monkeypatch.setenv("KZ_STATIONS", "T2,T3")
+    client = TestClient(app)
+    events = [{"type": "pack_start", "sku": "SKU-1", "idempotency_key": "1718000000-0001"}]
+
+    t2 = client.post("/api/kiosk/events/batch", json={"events": events}, headers={"X-Station-Id": "T2"}).json()
+    t3 = client.post("/api/kiosk/events/batch", json={"events": events}, headers={"X-Station-Id": "T3"}).json()
+
+    # Один и тот же ключ на разных станциях — разные события.
+    assert t2["results"][0]["status"] == "ok"
+    assert t3["results"][0]["status"] == "ok"
+    assert packaging.get_state("T3")["state"] == packaging.STATE_STARTED
+
+
+def test_old_receipts_table_is_migrated(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    conn = storage.get_conn()
+    conn.executescript(
+        """
+        DROP TABLE event_receipts;
+        CREATE TABLE event_receipts (
+            idempotency_key TEXT PRIMARY KEY,
+            station_id TEXT NOT NULL,
+            type TEXT NOT NULL,
+            result_json TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        INSERT INTO event_receipts VALUES ('k1', 'T2', 'heartbeat', '{}', 1.0);
+        """
+    )
+    conn.commit()
+    conn.close()
+
+    storage.init_db()
+    conn = storage.get_conn()
+    assert storage.get_event_receipts(conn, "T2", ["k1"]) == {"k1": {}}
+    assert storage.get_event_receipts(conn, "T3", ["k1"]) == {}
+    conn.close()
+
+
+def test_failed_batch_rolls_back_and_bumps_state_version(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    seen = []
+
+    def broken_step(**kwargs):
+        seen.append((state_version.current(), packaging.get_state()["state"]))
+        raise RuntimeError("сбой посреди пакета")
+
+    monkeypatch.setattr(packaging, "complete_current_step", broken_step)
+    events = [{"type": "pack_start", "sku": "SKU-1"}, {"type": "step_complete"}]
+    with pytest.raises(RuntimeError):
+        event_batch.apply_batch(events, lambda: (None, None))
+
+    # START был виден клиентам до отката — после отката версия снова меняется.
+    [(version_inside, state_inside)] = seen
+    assert state_inside == packaging.STATE_STARTED
+    assert state_version.current() > version_inside
+    assert packaging.get_state()["state"] is None
+    assert _pack_event_types() == []
+
+
+def test_batch_rejects_unknown_types(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    client = TestClient(app)
+    resp = client.post("/api/kiosk/events/batch", json={"events": [{"type": "explode"}]})
+    assert resp.status_code == 422
@@ -0,0 +1,64 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from core import storage
+from core.kiosk_settings import kiosk_settings
+from service.kiosk_api import app
+
+
+def _setup_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_kiosk_settings.db"
+    monkeypatch.setattr(storage, "DB", db_path)
+    storage.DB.parent.mkdir(exist_ok=True)
+    storage.init_db()
+
+
+def _forbid_settings_reads(monkeypatch):
+    def fail(*_args, **_kwargs):
+        raise AssertionError("настройки/мастер-сессия прочитаны из БД")
+
+    for name in ("get_master_session", "get_kiosk_setting", "get_kiosk_settings", "list_kiosk_settings"):
+        monkeypatch.setattr(storage, name, fail)
+
+
+def test_state_checks_master_session_in_memory(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    client = TestClient(app)
+    kiosk_settings.set_master("13540876", int(time.time()))
+    _forbid_settings_reads(monkeypatch)
+
+    state = client.get("/api/kiosk/state").json()
+    assert state["master_mode"] and state["master_id"] == "13540876"
+
+    # Бездействие дольше таймаута (15 мин) — выход определяется по памяти и пишется в БД.
+    kiosk_settings.touch_master(int(time.time()) - 16 * 60)
+    assert client.get("/api/kiosk/state").json()["master_mode"] is False
+    monkeypatch.undo()
+    assert storage.get_master_session()["enabled"] == 0
+
+
+def test_settings_saved_in_one_transaction(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    client = TestClient(app)
+    kiosk_settings.set_master("13540876", int(time.time()))
+    before = storage.get_kiosk_settings(["operator_can_reorder"])
+
+    bad = client.post(
+        "/api/kiosk/settings",
+        json={"operator_can_reorder": False, "master_session_timeout_min": 0},
+    )
+    assert bad.status_code == 400
+    # Невалидный таймаут — не сохраняется ничего, в том числе валидные ключи.
+    assert storage.get_kiosk_settings(["operator_can_reorder"]) == before
+
+    resp = client.post(
+        "/api/kiosk/settings",
+        json={"operator_can_reorder": False, "master_session_timeout_min": 30},
+    )
+    assert resp.status_code == 200
+    assert resp.json()["settings"]["master_session_timeout_min"] == 30
+    assert storage.get_kiosk_settings(["operator_can_reorder", "master_session_timeout_min"]) == {
+        "operator_can_reorder": 0,
+        "master_session_timeout_min": 30,
+    }
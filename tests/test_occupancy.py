@@ -0,0 +1,96 @@
+import numpy as np
+from fastapi.testclient import TestClient
+
+from core import storage
+from service.kiosk_api import app
+from services.occupancy import SlotOccupancyTracker, iou_matrix, occupancy_engine
+from services.packaging import _slot_rect
+
+
+def _setup_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_occupancy.db"
+    monkeypatch.setattr(storage, "DB", db_path)
+    storage.DB.parent.mkdir(exist_ok=True)
+    storage.init_db()
+    occupancy_engine.reset()
+
+
+def _detection(part_code: str, slot: str, frame_w: int = 1000, frame_h: int = 1000) -> dict:
+    # Бокс детали чуть меньше слота — как реальная деталь внутри подсветки.
+    x, y, w, h = _slot_rect(slot)
+    return {
+        "class_name": part_code,
+        "conf": 0.9,
+        "bbox": [
+            (x + 0.01) * frame_w,
+            (y + 0.01) * frame_h,
+            (x + w - 0.01) * frame_w,
+            (y + h - 0.01) * frame_h,
+        ],
+    }
+
+
+def test_iou_matrix_shapes_and_values():
+    a = np.array([[0, 0, 1, 1], [0, 0, 2, 2]], dtype=np.float32)
+    b = np.array([[0, 0, 1, 1], [5, 5, 6, 6], [0.5, 0, 1.5, 1]], dtype=np.float32)
+    iou = iou_matrix(a, b)
+    assert iou.shape == (2, 3)
+    assert iou[0, 0] == 1.0
+    assert iou[0, 1] == 0.0
+    assert abs(iou[0, 2] - 1 / 3) < 1e-6
+    assert abs(iou[1, 0] - 0.25) < 1e-6
+    assert iou_matrix(np.zeros((0, 4)), b).shape == (0, 3)
+
+
+def test_tracker_debounces_flicker():
+    tracker = SlotOccupancyTracker(occupy_after_sec=0.5, release_after_sec=0.5)
+    slots = [("A1", _slot_rect("A1"))]
+    det = [_detection("PART-1", "A1")]
+
+    tracker.observe(slots, det, 1000, 1000, now=0.0)
+    tracker.observe(slots, [], 1000, 1000, now=0.2)   # дребезг: пропал на кадр
+    tracker.observe(slots, det, 1000, 1000, now=0.3)
+    assert tracker.get("A1").occupied is not True
+
+    states = tracker.observe(slots, det, 1000, 1000, now=0.9)
+    assert states["A1"].occupied is True
+    assert states["A1"].part_code == "PART-1"
+
+
+def test_detections_complete_layout_and_packing_steps(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    client = TestClient(app)
+    assert client.post("/api/kiosk/pack/start", json={"sku": "SKU-2"}).status_code == 200
+
+    def send(detections, ts):
+        res = client.post(
+            "/api/kiosk/vision/detections",
+            json={"frame_w": 1000, "frame_h": 1000, "detections": detections, "ts": ts},
+        )
+        assert res.status_code == 200
+        return res.json()
+
+    # Чужая деталь в слоте не закрывает шаг.
+    send([_detection("PART-5", "A1")], 0.0)
+    assert send([_detection("PART-5", "A1")], 1.0)["completed"] is None
+
+    # LAYOUT: PART-4 -> A1, PART-5 -> A2.
+    layout = [_detection("PART-4", "A1")]
+    send(layout, 2.0)
+    assert send(layout, 3.0)["completed"]["step"]["step_id"] == "layout-0"
+    layout.append(_detection("PART-5", "A2"))
+    send(layout, 4.0)
+    assert send(layout, 5.0)["completed"]["step"]["step_id"] == "layout-1"
+
+    assert client.post("/api/kiosk/pack/phase/next").status_code == 200
+
+    # PACKING идёт в обратном порядке: сначала забираем деталь из A2.
+    send(layout, 6.0)
+    send(layout, 7.0)
+    remaining = [_detection("PART-4", "A1")]
+    send(remaining, 8.0)
+    assert send(remaining, 9.0)["completed"]["step"]["step_id"] == "packing-0"
+
+    state = client.get("/api/kiosk/pack/steps/state").json()
+    assert state["phase"] == "PACKING"
+    assert state["current_step"]["slot"] == "A1"
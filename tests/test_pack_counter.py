@@ -0,0 +1,63 @@
+import time
+
+from core import storage
+from core.logic import KioskEngine
+from core.pack_counter import DailyPackCounter, local_day_start, next_day_start, pack_counter
+from core.session import PackSession
+
+
+def _setup_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_pack_counter.db"
+    monkeypatch.setattr(storage, "DB", db_path)
+    storage.DB.parent.mkdir(exist_ok=True)
+    storage.init_db()
+
+
+def _save(worker_id: str, start_time: float) -> None:
+    # Тот же путь, что у движка киоска: завершение сессии пишет её и обновляет счётчик.
+    engine = KioskEngine(station_id="counter-test")
+    engine._session = PackSession(worker_id=worker_id, product_code="SKU-1", start_time=start_time)
+    engine.finish_session()
+
+
+def test_counter_tracks_finished_sessions_without_queries(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    now = time.time()
+    _save("W1", now - 10)
+    # Первое чтение загружает сутки из БД.
+    assert pack_counter.get() == 1
+
+    _save("W1", now)
+    _save("W2", now)
+    # Сессия, начатая вчера, в сегодняшний счётчик не попадает.
+    _save("W2", local_day_start(now) - 60)
+
+    def _no_sql(*_args, **_kwargs):
+        raise AssertionError("чтение счётчика не должно ходить в БД")
+
+    monkeypatch.setattr(storage, "count_sessions_by_worker", _no_sql)
+    assert pack_counter.get() == 3
+    assert pack_counter.get("W1") == 2
+    assert pack_counter.get("W2") == 1
+    assert pack_counter.get() == storage.count_sessions_since(local_day_start(now))
+
+
+def test_counter_rolls_over_at_midnight_and_repairs_drift(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    now = time.time()
+    counter = DailyPackCounter()
+    _save("W1", now)
+    assert counter.get(now=now) == 1
+
+    # Запись в обход движка (например, ручная правка БД) — сверка находит и чинит.
+    conn = storage.get_conn()
+    conn.execute("INSERT INTO sessions(worker_id, start_time) VALUES (?, ?)", ["W3", now])
+    conn.commit()
+    conn.close()
+    check = counter.check_consistency(now=now)
+    assert check["ok"] is False and check["memory"] == 1 and check["db"] == 2
+    assert counter.get("W3", now=now) == 1
+    assert counter.check_consistency(now=now)["ok"] is True
+
+    tomorrow = next_day_start(local_day_start(now)) + 1
+    assert counter.get(now=tomorrow) == 0
@@ -0,0 +1,105 @@
+import json
+
+from core import storage
+from services import pack_replay, packaging
+
+
+def _setup_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_pack_replay.db"
+    monkeypatch.setattr(storage, "DB", db_path)
+    storage.DB.parent.mkdir(exist_ok=True)
+    storage.init_db()
+
+
+def _pack_one(sku, finish=True):
+    packaging.start_session(sku)
+    for _ in packaging.get_plan(sku).layout:
+        packaging.complete_current_step()
+    packaging.advance_phase()
+    packaging.complete_current_step()
+    if finish:
+        packaging.apply_event(packaging.EVENT_CLOSE_BOX)
+        packaging.apply_event(packaging.EVENT_TABLE_EMPTY)
+
+
+def test_replay_matches_sessions_and_is_incremental(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    _pack_one("SKU-1")
+    _pack_one("SKU-2", finish=False)
+
+    report = pack_replay.rebuild(full=True)
+    assert report["mismatches"] == 0 and report["anomalies"] == 0
+    assert report["sessions_checked"] == 2
+    # Завершённая сессия в чекпоинт не попадает — только открытая.
+    checkpoint = storage.get_replay_checkpoint()
+    assert checkpoint["last_event_id"] == report["last_event_id"]
+    assert list(json.loads(checkpoint["open_sessions_json"])) == ["2"]
+
+    packaging.apply_event(packaging.EVENT_CLOSE_BOX)
+    incremental = pack_replay.rebuild()
+    assert incremental["from_event_id"] == report["last_event_id"]
+    assert incremental["events"] == 1
+    assert incremental["mismatches"] == 0
+
+
+def test_replay_detects_and_repairs_corruption(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    _pack_one("SKU-1")
+    conn = storage.get_conn()
+    conn.execute("UPDATE pack_sessions SET state='started', current_step_index=7")
+    conn.commit()
+    conn.close()
+
+    report = pack_replay.rebuild(full=True, repair=True)
+    assert report["mismatches"] == 1
+    assert report["details"][0]["state"] == ["started", packaging.STATE_TABLE_EMPTY]
+    assert report["repaired"] == 1
+    assert packaging.get_state()["state"] == packaging.STATE_TABLE_EMPTY
+    assert pack_replay.rebuild(full=True)["mismatches"] == 0
+
+
+def test_replay_skips_sessions_changed_during_scan(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    _pack_one("SKU-1", finish=False)
+    iter_events = storage.iter_pack_events
+
+    def iter_then_write(after_id=0):
+        yield from iter_events(after_id)
+        # Станция закрыла коробку, пока replay дочитывал журнал.
+        packaging.apply_event(packaging.EVENT_CLOSE_BOX)
+
+    monkeypatch.setattr(storage, "iter_pack_events", iter_then_write)
+    report = pack_replay.rebuild(full=True, repair=True)
+    assert report["mismatches"] == 0 and report["repaired"] == 0
+    assert report["sessions_skipped"] == 1
+    assert packaging.get_state()["state"] == packaging.STATE_BOX_CLOSED
+
+    # Следующий replay дочитывает событие и сверяет сессию.
+    monkeypatch.setattr(storage, "iter_pack_events", iter_events)
+    incremental = pack_replay.rebuild()
+    assert incremental["sessions_checked"] == 1 and incremental["mismatches"] == 0
+
+
+def test_repair_does_not_overwrite_newer_session(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    _pack_one("SKU-1", finish=False)
+    stale = pack_replay.rebuild(full=True)["last_event_id"]
+    row = dict(zip(storage.PACK_SESSION_REPLAY_COLUMNS, storage.load_pack_sessions_by_id([1], stale)[0][1]))
+    packaging.apply_event(packaging.EVENT_CLOSE_BOX)
+
+    assert storage.upsert_pack_sessions([row], stale) == 0
+    assert packaging.get_state()["state"] == packaging.STATE_BOX_CLOSED
+
+
+def test_fold_reports_forbidden_transitions(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    sessions, anomalies = {}, []
+    events = [
+        (1, 10.0, packaging.EVENT_START, 5, "SKU-1", "default"),
+        (2, 11.0, packaging.EVENT_PRINT_LABEL, 5, "SKU-1", "default"),
+        (3, 12.0, packaging.EVENT_CLOSE_BOX, 9, "SKU-1", "default"),
+    ]
+    assert pack_replay.fold_events(events, sessions, anomalies) == 3
+    assert sessions[5][pack_replay.STATE] == packaging.STATE_STARTED
+    assert [a[0] for a in anomalies] == [2, 3]
+
@@ -0,0 +1,48 @@
+import random
+import statistics
+
+from core import storage
+from core.pack_stats import P2Quantile, PackTimeStats
+
+
+def _setup_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_pack_stats.db"
+    monkeypatch.setattr(storage, "DB", db_path)
+    storage.DB.parent.mkdir(exist_ok=True)
+    storage.init_db()
+
+
+def test_p2_quantile_tracks_exact_quantiles():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(5.0, 0.3) for _ in range(5000)]
+    p50, p90 = P2Quantile(0.5), P2Quantile(0.9)
+    for value in values:
+        p50.add(value)
+        p90.add(value)
+    exact = statistics.quantiles(values, n=10)
+    assert abs(p50.value() - exact[4]) / exact[4] < 0.02
+    assert abs(p90.value() - exact[8]) / exact[8] < 0.03
+
+
+def test_stats_are_persisted_and_reloaded(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    stats = PackTimeStats()
+    times = [300, 240, 360, 280, 310, 500, 260]
+    for i, seconds in enumerate(times):
+        stats.record("SKU-1", "W1" if i % 2 == 0 else "W2", seconds, ts=1000.0 + i)
+
+    summary = stats.get("SKU-1")
+    assert summary["count"] == len(times)
+    assert summary["last"] == 260
+    assert summary["best"] == 240
+    assert abs(summary["avg"] - statistics.mean(times)) < 1e-9
+    assert abs(summary["std"] - statistics.stdev(times)) < 1e-9
+    assert stats.get("SKU-1", "W1")["count"] == 4
+    assert stats.get("SKU-2")["count"] == 0
+
+    # Новый экземпляр (рестарт API) читает то же состояние из БД.
+    reloaded = PackTimeStats()
+    assert reloaded.get("SKU-1") == summary
+    reloaded.record("SKU-1", "W1", 200, ts=2000.0)
+    assert reloaded.get("SKU-1")["best"] == 200
+    assert reloaded.get("SKU-1", "W1")["count"] == 5
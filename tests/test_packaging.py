@@ -1,7 +1,13 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
 import pytest
 from fastapi.testclient import TestClient
 
 from core import storage
+from services import packaging
+from services.timers import record_heartbeat
 from service.kiosk_api import app
 
 
@@ -155,3 +161,258 @@ def test_packaging_complete_step_without_session(tmp_path, monkeypatch):
 
     res_complete = client.post("/api/kiosk/pack/step/complete")
     assert res_complete.status_code == 409
+
+
+def test_packaging_is_scoped_per_station(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    monkeypatch.setenv("KZ_STATIONS", "T2")
+    client = TestClient(app)
+
+    assert client.post("/api/kiosk/pack/start", json={"sku": "SKU-A"}).status_code == 200
+    # Незавершённая упаковка на одной станции не блокирует старт на другой.
+    res_other = client.post(
+        "/api/kiosk/stations/T2/pack/start", json={"sku": "SKU-B"}
+    )
+    assert res_other.status_code == 200
+    assert client.post("/api/kiosk/pack/start", json={"sku": "SKU-C"}).status_code == 409
+
+    conn = storage.get_conn()
+    sessions = conn.execute("SELECT station_id, sku FROM pack_sessions ORDER BY id").fetchall()
+    events = conn.execute("SELECT DISTINCT station_id FROM pack_events ORDER BY station_id").fetchall()
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM pack_sessions WHERE station_id=? ORDER BY id DESC LIMIT 1",
+        ["T2"],
+    ).fetchall()
+    conn.close()
+    assert [tuple(row) for row in sessions] == [("default", "SKU-A"), ("T2", "SKU-B")]
+    assert [row[0] for row in events] == ["T2", "default"]
+    assert "idx_pack_sessions_station" in " ".join(str(row[-1]) for row in plan)
+
+
+def test_session_cache_serves_reads_and_sees_outside_writes(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    packaging.session_cache.load()
+    packaging.start_session("SKU-1")
+
+    calls = []
+    original = storage.get_latest_pack_session
+    monkeypatch.setattr(
+        storage, "get_latest_pack_session", lambda *a: calls.append(a) or original(*a)
+    )
+    packaging.apply_event(packaging.EVENT_CLOSE_BOX)
+    assert packaging.get_active_session()["state"] == packaging.STATE_BOX_CLOSED
+    # Свои записи обновляют кэш сразу — SQLite для чтения не нужен.
+    assert calls == []
+
+    # Посторонний писатель (другое соединение) — кэш замечает смену data_version.
+    conn = storage.get_conn()
+    conn.execute("UPDATE pack_sessions SET state='table_empty'")
+    conn.commit()
+    conn.close()
+    assert packaging.get_state()["state"] == packaging.STATE_TABLE_EMPTY
+    assert packaging.get_active_session() is None
+
+
+def test_session_cache_ignores_writes_to_other_tables(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    packaging.session_cache.load()
+    packaging.start_session("SKU-1")
+
+    def fail(*_args, **_kwargs):
+        raise AssertionError("кэш сессий перечитан из БД")
+
+    monkeypatch.setattr(storage, "get_latest_pack_session", fail)
+    monkeypatch.setattr(storage, "list_latest_pack_sessions", fail)
+    # Heartbeat пишет в events отдельным соединением и меняет data_version,
+    # но pack_sessions не трогает — кэш остаётся.
+    record_heartbeat(shift_id=1, session_id=None, ts=1.0, worker_id="W1")
+    assert packaging.get_state()["state"] == packaging.STATE_STARTED
+
+
+def test_outside_write_before_own_transition_is_not_lost(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    monkeypatch.setenv("KZ_STATIONS", "T2")
+    packaging.session_cache.load()
+    packaging.start_session("SKU-1")
+    assert packaging.get_state()["state"] == packaging.STATE_STARTED
+
+    # Посторонний писатель коммитит сессию default между проверкой кэша и нашим
+    # BEGIN IMMEDIATE (переход на T2) — его запись не выдаётся за нашу.
+    transaction = storage.transaction
+
+    @contextmanager
+    def racing_transaction():
+        conn = sqlite3.connect(storage.DB)
+        conn.execute("UPDATE pack_sessions SET state='table_empty' WHERE station_id='default'")
+        conn.commit()
+        conn.close()
+        with transaction() as conn:
+            yield conn
+
+    with monkeypatch.context() as patch:
+        patch.setattr(storage, "transaction", racing_transaction)
+        packaging.start_session("SKU-2", station_id="T2")
+    assert packaging.get_state()["state"] == packaging.STATE_TABLE_EMPTY
+
+
+def test_concurrent_transitions_apply_once(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    packaging.start_session("SKU-1")
+
+    barrier = threading.Barrier(4)
+    results = []
+
+    def close_box():
+        barrier.wait()
+        try:
+            packaging.apply_event(packaging.EVENT_CLOSE_BOX)
+            results.append("ok")
+        except packaging.PackagingTransitionError as exc:
+            results.append(type(exc).__name__)
+
+    threads = [threading.Thread(target=close_box) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count("ok") == 1
+    conn = storage.get_conn()
+    closed = conn.execute("SELECT COUNT(*) FROM pack_events WHERE type='BOX_CLOSED'").fetchone()[0]
+    conn.close()
+    assert closed == 1
+
+
+def test_stale_transition_is_a_conflict(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    packaging.start_session("SKU-1")
+    stale = packaging.session_cache.get("default")
+
+    packaging.apply_event(packaging.EVENT_CLOSE_BOX)
+    # Клиент со старым представлением сессии: CAS не проходит, событие не пишется.
+    with monkeypatch.context() as patch:
+        patch.setattr(packaging, "_latest_row", lambda station_id: dict(stale))
+        with pytest.raises(packaging.PackagingConflictError):
+            packaging.apply_event(packaging.EVENT_TABLE_EMPTY)
+
+    assert packaging.get_state()["state"] == packaging.STATE_BOX_CLOSED
+    conn = storage.get_conn()
+    types = [row[0] for row in conn.execute("SELECT type FROM pack_events ORDER BY id")]
+    conn.close()
+    assert types == ["START", "BOX_CLOSED"]
+
+
+def _assert_cache_matches_db(station_id="default"):
+    cached = packaging.session_cache.get(station_id)
+    assert cached == dict(storage.get_pack_session(cached["id"]))
+
+
+def test_interleaved_transitions_keep_cache_equal_to_db(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    step_verifier = packaging.step_verifier
+
+    # Коробку закрыли, пока шаг читал кадр: CAS шага сверяет только прогресс.
+    packaging.start_session("SKU-1")
+
+    def close_box_while_capturing(station_id):
+        monkeypatch.setattr(step_verifier, "capture_frame", lambda station_id: None)
+        packaging.apply_event(packaging.EVENT_CLOSE_BOX, station_id=station_id)
+        return None
+
+    monkeypatch.setattr(step_verifier, "capture_frame", close_box_while_capturing)
+    packaging.complete_current_step()
+    _assert_cache_matches_db()
+    assert packaging.get_state()["state"] == packaging.STATE_BOX_CLOSED
+    assert packaging.session_cache.get("default")["current_step_index"] == 1
+
+    # И наоборот: шаг завершили, пока закрывали коробку (CAS сверяет только состояние).
+    packaging.apply_event(packaging.EVENT_PRINT_LABEL)
+    packaging.apply_event(packaging.EVENT_TABLE_EMPTY)
+    packaging.start_session("SKU-1")
+    blocks_close_box = step_verifier.blocks_close_box
+
+    def complete_step_while_closing(session_id, conn=None):
+        monkeypatch.setattr(step_verifier, "blocks_close_box", blocks_close_box)
+        packaging.complete_current_step()
+        return False
+
+    monkeypatch.setattr(step_verifier, "blocks_close_box", complete_step_while_closing)
+    packaging.apply_event(packaging.EVENT_CLOSE_BOX)
+    _assert_cache_matches_db()
+    assert packaging.session_cache.get("default")["current_step_index"] == 1
+
+
+def test_plans_are_compiled_once_and_invalidated_on_change(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    calls = []
+    original = storage.load_layout_plans
+    monkeypatch.setattr(
+        storage, "load_layout_plans", lambda skus=None: calls.append(skus) or original(skus)
+    )
+
+    stub = packaging.get_plan("SKU-1")
+    assert stub.plan_version == packaging.STUB_PLAN_VERSION
+    assert packaging.get_plan("SKU-1") is stub
+    assert calls == [["SKU-1"]]
+
+    plan = packaging.save_layout_plan(
+        "SKU-1",
+        [
+            {"slot": "B2", "part_code": "P-9", "rect": [0.1, 0.2, 0.3, 0.4]},
+            {"slot": "A1", "part_code": "P-8"},
+        ],
+    )
+    assert plan.plan_version == 1
+    assert [step["part_code"] for step in plan.all] == ["P-9", "P-8", "P-8", "P-9"]
+    assert plan.layout[0]["rect"] == (0.1, 0.2, 0.3, 0.4)
+    assert plan.layout[1]["rect"] == tuple(packaging._slot_rect("A1"))
+
+    packaging.start_session("SKU-1")
+    steps = packaging.get_steps_state(packaging.get_active_session())
+    assert steps["total_steps"] == 2
+    assert steps["current_step"]["slot"] == "B2"
+
+    # Общий план не изменить: шаги только для чтения, наружу уходят копии.
+    with pytest.raises(TypeError):
+        plan.layout[0]["slot"] = "Z9"
+    steps["current_step"]["rect"][0] = 0.9
+    packaging.get_plan_for_session(packaging.get_active_session())[0]["slot"] = "Z9"
+    assert plan.layout[0]["slot"] == "B2" and plan.layout[0]["rect"][0] == 0.1
+
+
+def test_warm_plan_cache_loads_active_skus_in_one_query(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    for code in ("SKU-A", "SKU-B"):
+        storage.create_sku_catalog_item(code, code, "M", 160, "F", "C")
+    calls = []
+    original = storage.load_layout_plans
+    monkeypatch.setattr(
+        storage, "load_layout_plans", lambda skus=None: calls.append(skus) or original(skus)
+    )
+    assert packaging.warm_plan_cache() == 2
+    packaging.get_plan("SKU-A")
+    packaging.get_plan("SKU-B")
+    assert calls == [["SKU-A", "SKU-B"]]
+
+
+def test_pack_snapshot_combines_ui_state_steps_and_plan(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    client = TestClient(app)
+
+    empty = client.get("/api/kiosk/pack/snapshot").json()
+    assert empty["active_session"] is None
+    assert empty["can_start_sku"] is True
+    assert empty["steps"] is None and empty["plan"] is None
+
+    client.post("/api/kiosk/pack/start", json={"sku": "SKU-1"})
+    resp = client.get("/api/kiosk/pack/snapshot")
+    snapshot = resp.json()
+    assert snapshot["active_session"]["sku"] == "SKU-1"
+    assert snapshot["pack_state"] == packaging.STATE_STARTED
+    assert snapshot["steps"] == client.get("/api/kiosk/pack/steps/state").json()
+    assert snapshot["plan"] == client.get("/api/kiosk/pack/plan").json()["steps"]
+    ui_state = client.get("/api/kiosk/pack/ui-state").json()
+    assert {key: snapshot[key] for key in ui_state} == ui_state
+
+    cached = client.get("/api/kiosk/pack/snapshot", headers={"If-None-Match": resp.headers["etag"]})
+    assert cached.status_code == 304
@@ -0,0 +1,65 @@
+from core import storage
+from service import kiosk_api
+from services import packaging
+from services.qr_scanner import CameraCodeRouter, ScanThrottle, classify_code
+
+
+def _setup_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_qr_scanner.db"
+    monkeypatch.setattr(storage, "DB", db_path)
+    storage.DB.parent.mkdir(exist_ok=True)
+    storage.init_db()
+
+
+def test_classify_code_matches_scanner_formats():
+    assert classify_code("M13540876") == ("master", "13540876")
+    assert classify_code("w42") == ("worker", "W42")
+    # Голые цифры в кадре (номер заказа, штрихкод) — не вход сотрудника.
+    assert classify_code("123") is None
+    assert classify_code("4607001234567") is None
+    assert classify_code("MM.BED.Nova.White") == ("bed", "MM.Кровать.Nova.White")
+    assert classify_code("MM_BED_Nova_White") == ("bed", "MM.Кровать.Nova.White")
+    assert classify_code("MM_Nova_White") == ("bed", "MM.Кровать.Nova.White")
+    # Посторонние коды (упаковка, ссылки) игнорируем.
+    assert classify_code("https://example.com") is None
+    assert classify_code("") is None
+
+
+def test_throttle_limits_scan_rate():
+    throttle = ScanThrottle(interval_sec=0.5)
+    assert [throttle.ready(t) for t in (0.0, 0.2, 0.5, 0.6, 1.1)] == [True, False, True, False, True]
+
+
+def test_router_suppresses_repeated_reads():
+    seen = []
+    router = CameraCodeRouter(
+        on_master=lambda v: seen.append(("master", v)),
+        on_worker=lambda v: seen.append(("worker", v)),
+        on_bed=lambda v: seen.append(("bed", v)),
+        window_sec=5.0,
+    )
+    # Один и тот же код на каждом кадре, пока он в кадре, — одно действие.
+    for t in range(10):
+        router.handle(["W7", "junk"], now=float(t) * 0.5)
+    assert seen == [("worker", "W7")]
+
+    # Код убрали на время дольше окна и показали снова — срабатывает повторно.
+    router.handle(["W7"], now=20.0)
+    assert seen == [("worker", "W7"), ("worker", "W7")]
+
+
+def test_camera_bed_code_starts_pack_session(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    router = CameraCodeRouter(
+        on_master=lambda v: None,
+        on_worker=lambda v: None,
+        on_bed=kiosk_api._on_camera_bed,
+    )
+    router.handle(["MM_BED_Nova_White"], now=0.0)
+    state = packaging.get_state()
+    assert state["state"] == packaging.STATE_STARTED
+    assert state["sku"] == "MM.Кровать.Nova.White"
+
+    # Пока упаковка не завершена, новый код кровати сессию не перезапускает.
+    router.handle(["MM_BED_Other_Black"], now=1.0)
+    assert packaging.get_state()["sku"] == "MM.Кровать.Nova.White"
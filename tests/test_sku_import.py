@@ -0,0 +1,103 @@
+import io
+import time
+
+from fastapi.testclient import TestClient
+from openpyxl import Workbook
+
+from core import storage
+from core.kiosk_settings import kiosk_settings
+from service.kiosk_api import app
+
+HEADER = "sku_code;name;model_code;width_cm;fabric_code;color_code;is_active\n"
+
+
+def _setup_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_sku_import.db"
+    monkeypatch.setattr(storage, "DB", db_path)
+    storage.DB.parent.mkdir(exist_ok=True)
+    storage.init_db()
+
+
+def _upload(client, filename, content: bytes):
+    return client.post("/api/kiosk/sku/import", files={"file": (filename, content)})
+
+
+def _catalog():
+    return {item["sku_code"]: item for item in storage.list_sku_catalog(include_inactive=True)}
+
+
+def test_import_requires_master(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    client = TestClient(app)
+    resp = _upload(client, "catalog.csv", (HEADER + "A;Кровать;001-12;160;VL;04;1\n").encode())
+    assert resp.status_code == 403
+    assert _catalog() == {}
+
+
+def test_csv_import_upserts_and_reports_rejected_rows(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    client = TestClient(app)
+    kiosk_settings.set_master("13540876", int(time.time()))
+    storage.create_sku_catalog_item("A", "Старое", "001-12", 160, "VL", "04")
+    storage.create_sku_catalog_item("B", "Без изменений", "001-12", 140, "VL", "04")
+
+    content = (
+        HEADER
+        + "A;Кровать 160;001-12;160;VL;04;1\n"
+        + "B;Без изменений;001-12;140;VL;04;1\n"
+        + "C;Новая;003-16;180;VL;10;0\n"
+        + "\n"
+        + "D;Без ширины;003-16;;VL;10;1\n"
+        + "E;Широкая;003-16;5000;VL;10;1\n"
+        + ";Без кода;003-16;90;VL;10;1\n"
+        + "F;Первая;003-16;90;VL;10;1\n"
+        + "F;Последняя;003-16;90;VL;10;да\n"
+    ).encode("utf-8")
+    data = _upload(client, "export_1c.csv", content).json()
+
+    assert (data["total"], data["inserted"], data["updated"], data["unchanged"]) == (8, 2, 1, 1)
+    assert data["rejected"] == 4
+    assert {(err["row"], err["sku"]) for err in data["errors"]} == {(6, "D"), (7, "E"), (8, ""), (9, "F")}
+
+    catalog = _catalog()
+    assert catalog["A"]["name"] == "Кровать 160"
+    assert catalog["C"]["is_active"] == 0 and catalog["C"]["width_cm"] == 180
+    assert catalog["F"]["name"] == "Последняя"
+    assert "D" not in catalog and "E" not in catalog
+    # Индекс поиска видит импортированные строки.
+    assert [item["sku_code"] for item in storage.list_sku_catalog(search="последняя")] == ["F"]
+
+
+def test_xlsx_import_and_missing_columns(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    client = TestClient(app)
+    kiosk_settings.set_master("13540876", int(time.time()))
+
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["sku_code", "name", "model_code", "width_cm", "fabric_code", "color_code"])
+    sheet.append(["X-1", "Кровать", "001-12", 160.0, "VL", 4])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+
+    data = _upload(client, "catalog.xlsx", buffer.getvalue()).json()
+    assert (data["inserted"], data["rejected"]) == (1, 0)
+    assert _catalog()["X-1"]["color_code"] == "4" and _catalog()["X-1"]["is_active"] == 1
+
+    resp = _upload(client, "catalog.csv", b"sku_code,name\nA,B\n")
+    assert resp.status_code == 400
+    assert _upload(client, "catalog.txt", b"").status_code == 400
+
+
+def test_broken_files_and_non_ascii_widths_are_rejected(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    client = TestClient(app)
+    kiosk_settings.set_master("13540876", int(time.time()))
+
+    resp = _upload(client, "catalog.xlsx", b"not a zip")
+    assert resp.status_code == 400
+
+    content = (HEADER + "A;Кровать;001-12;²;VL;04;1\nB;Кровать;001-12;١٦٠;VL;04;1\nC;Кровать;001-12;160;VL;04;1\n")
+    data = _upload(client, "catalog.csv", content.encode("utf-8")).json()
+    assert (data["inserted"], data["rejected"]) == (1, 2)
+    assert [err["sku"] for err in data["errors"]] == ["A", "B"]
@@ -0,0 +1,73 @@
+from core import storage
+
+
+def _setup_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_sku_search.db"
+    monkeypatch.setattr(storage, "DB", db_path)
+    storage.DB.parent.mkdir(exist_ok=True)
+    storage.init_db()
+
+
+def _add(sku_code, name, model_code="001-12", is_active=1):
+    return storage.create_sku_catalog_item(
+        sku_code=sku_code,
+        name=name,
+        model_code=model_code,
+        width_cm=160,
+        fabric_code="VL",
+        color_code="04",
+        is_active=is_active,
+    )
+
+
+def _codes(items):
+    return [item["sku_code"] for item in items]
+
+
+def test_search_matches_word_prefixes(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    _add("MM.Кровать.001-12-160-VelutaLux.04", "Кровать VelutaLux 160 серая")
+    _add("MM.Кровать.003-16-140-VelutaLux.10", "Кровать VelutaLux 140 бежевая", model_code="003-16")
+    _add("MM.Матрас.200", "Матрас ортопедический")
+
+    assert _codes(storage.list_sku_catalog(search="кров 160")) == ["MM.Кровать.001-12-160-VelutaLux.04"]
+    assert len(storage.list_sku_catalog(search="VELUTA")) == 2
+    assert _codes(storage.list_sku_catalog(search="орто")) == ["MM.Матрас.200"]
+    # Поиск по префиксам слов, а не по подстроке.
+    assert storage.list_sku_catalog(search="педич") == []
+
+
+def test_code_match_ranks_above_name_match(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    _add("BED-1", "Основание для матраса sofa")
+    _add("SOFA-2", "Диван угловой")
+
+    assert _codes(storage.list_sku_catalog(search="sofa")) == ["SOFA-2", "BED-1"]
+
+
+def test_index_follows_updates(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    sku_id = _add("A-1", "Старое название")
+    storage.update_sku_catalog_item(sku_id, name="Новое название")
+
+    assert storage.list_sku_catalog(search="старое") == []
+    assert _codes(storage.list_sku_catalog(search="новое")) == ["A-1"]
+
+    storage.update_sku_catalog_item(sku_id, is_active=0)
+    assert storage.list_sku_catalog(search="новое") == []
+    assert _codes(storage.list_sku_catalog(search="новое", include_inactive=True)) == ["A-1"]
+
+
+def test_search_pages_and_like_fallback(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    for index in range(5):
+        _add(f"SKU-{index}", f"Кровать {index}")
+
+    first = storage.list_sku_catalog(search="кровать", limit=2)
+    rest = storage.list_sku_catalog(search="кровать", limit=10, offset=2)
+    assert len(first) == 2 and len(rest) == 3
+    assert not set(_codes(first)) & set(_codes(rest))
+
+    # Строка без слов — прежний поиск подстрокой.
+    _add("X-(1)", "Скобки")
+    assert _codes(storage.list_sku_catalog(search="-(")) == ["X-(1)"]
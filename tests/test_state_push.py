@@ -0,0 +1,61 @@
+import asyncio
+import copy
+import threading
+
+from fastapi.testclient import TestClient
+
+from core import storage
+from service.kiosk_api import app
+from services.json_patch import apply_patch, make_patch
+from services.state_version import StateVersion
+
+
+def _setup_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_state_push.db"
+    monkeypatch.setattr(storage, "DB", db_path)
+    storage.DB.parent.mkdir(exist_ok=True)
+    storage.init_db()
+
+
+def test_make_patch_roundtrip():
+    old = {"a": 1, "b": {"c": [1, 2], "d": "x"}, "gone": True, "flag": True}
+    new = {"a": 2, "b": {"c": [1, 3], "d": "x"}, "added": None, "flag": 1}
+    ops = make_patch(old, new)
+    assert {"op": "remove", "path": "/gone"} in ops
+    assert {"op": "replace", "path": "/b/c/1", "value": 3} in ops
+    # True и 1 в JSON различаются — это замена.
+    assert {"op": "replace", "path": "/flag", "value": 1} in ops
+    assert apply_patch(copy.deepcopy(old), ops) == new
+    assert make_patch(new, copy.deepcopy(new)) == []
+
+
+def test_wait_changed_is_woken_from_another_thread():
+    version = StateVersion()
+
+    async def scenario():
+        since = version.current()
+        threading.Timer(0.05, version.bump).start()
+        return await version.wait_changed(since, timeout=5.0)
+
+    assert asyncio.run(scenario()) == 1
+    # Без изменений ждём до таймаута и возвращаем ту же версию.
+    assert asyncio.run(version.wait_changed(1, timeout=0.05)) == 1
+
+
+def test_ws_sends_full_state_then_patches(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    client = TestClient(app)
+    with client.websocket_connect("/api/kiosk/ws") as ws:
+        full = ws.receive_json()
+        assert full["type"] == "full"
+        snapshot = full["data"]
+        assert snapshot["pack_steps"] is None
+        assert snapshot["pack_ui"]["can_start_sku"] is True
+
+        assert client.post("/api/kiosk/pack/start", json={"sku": "SKU-1"}).status_code == 200
+        patch = ws.receive_json()
+        assert patch["type"] == "patch"
+        assert patch["version"] > full["version"]
+        snapshot = apply_patch(snapshot, patch["ops"])
+        assert snapshot["pack_ui"]["active_session"]["sku"] == "SKU-1"
+        assert snapshot["pack_steps"]["phase"] == "LAYOUT"
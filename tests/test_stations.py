@@ -0,0 +1,65 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from core import storage
+from core.logic import engine, engines
+from core.stations import DEFAULT_STATION, InvalidStationError, UnknownStationError, resolve_station
+from service.kiosk_api import app
+
+
+def _setup_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_stations.db"
+    monkeypatch.setattr(storage, "DB", db_path)
+    storage.DB.parent.mkdir(exist_ok=True)
+    storage.init_db()
+
+
+def test_resolve_station_from_path_and_header(monkeypatch):
+    monkeypatch.setenv("KZ_STATIONS", "T2, T3")
+    assert resolve_station("/api/kiosk/stations/T2/state", []) == ("T2", "/api/kiosk/state")
+    assert resolve_station("/api/kiosk/state", [(b"X-Station-Id", b"T3")]) == ("T3", "/api/kiosk/state")
+    assert resolve_station("/api/kiosk/state", []) == (DEFAULT_STATION, "/api/kiosk/state")
+    with pytest.raises(InvalidStationError):
+        resolve_station("/api/kiosk/stations/../state", [])
+    with pytest.raises(UnknownStationError):
+        resolve_station("/api/kiosk/state", [(b"X-Station-Id", b"T4")])
+
+
+def test_stations_have_independent_engines(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    monkeypatch.setenv("KZ_STATIONS", "T2,T3")
+    client = TestClient(app)
+
+    resp = client.post("/api/kiosk/stations/T2/session/start", json={"sku": "MM.Кровать.T2.White"})
+    assert resp.status_code == 200
+    resp = client.post(
+        "/api/kiosk/session/start",
+        json={"sku": "MM.Кровать.T3.Black"},
+        headers={"X-Station-Id": "T3"},
+    )
+    assert resp.status_code == 200
+
+    assert engines.get("T2").get_ui_state().bed_sku == "MM.Кровать.T2.White"
+    t3_state = client.get("/api/kiosk/state", headers={"X-Station-Id": "T3"}).json()
+    assert t3_state["bed_sku"] == "MM.Кровать.T3.Black"
+    # Станция по умолчанию (старые клиенты) не затронута.
+    assert engine.get_ui_state().bed_sku not in ("MM.Кровать.T2.White", "MM.Кровать.T3.Black")
+
+    stations = client.get("/api/kiosk/stations", headers={"X-Station-Id": "T2"}).json()
+    assert stations["current"] == "T2"
+    assert stations["stations"] == sorted({"T2", "T3", DEFAULT_STATION})
+
+    assert client.get("/api/kiosk/state", headers={"X-Station-Id": "bad id!"}).status_code == 400
+
+
+def test_unknown_station_is_rejected_without_creating_engine(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    monkeypatch.setenv("KZ_STATIONS", "T2")
+    client = TestClient(app)
+
+    # Опечатка в заголовке или пути — 404, а не новый «фантомный» стол.
+    assert client.get("/api/kiosk/state", headers={"X-Station-Id": "T22"}).status_code == 404
+    assert client.post("/api/kiosk/stations/T9/session/start", json={"sku": "X"}).status_code == 404
+    with pytest.raises(UnknownStationError):
+        engines.get("T22")
+    assert "T22" not in engines._engines and "T9" not in engines._engines
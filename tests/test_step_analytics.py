@@ -0,0 +1,60 @@
+import numpy as np
+
+from core import storage
+from services import packaging, step_analytics
+
+
+def _setup_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_step_analytics.db"
+    monkeypatch.setattr(storage, "DB", db_path)
+    storage.DB.parent.mkdir(exist_ok=True)
+    storage.init_db()
+
+
+def _pack(sku, start_ts, step_sec, worker_id=None):
+    # Старт, шаги LAYOUT и один шаг PACKING; каждый шаг длится step_sec.
+    ts = start_ts
+    packaging.start_session(sku, ts=ts, worker_id=worker_id)
+    for _ in packaging.get_plan(sku).layout:
+        ts += step_sec
+        packaging.complete_current_step(ts=ts)
+    ts += 1.0
+    packaging.advance_phase(ts=ts)
+    ts += step_sec
+    packaging.complete_current_step(ts=ts)
+    packaging.apply_event(packaging.EVENT_CLOSE_BOX, ts=ts + 1)
+    packaging.apply_event(packaging.EVENT_TABLE_EMPTY, ts=ts + 2)
+    return ts + 2
+
+
+def test_step_durations_reset_on_session_boundary():
+    sessions = np.array([1, 1, 1, 2, 2])
+    ts = np.array([0.0, 4.0, 10.0, 100.0, 103.0])
+    durations = step_analytics.step_durations(sessions, ts)
+    assert np.isnan(durations[0]) and np.isnan(durations[3])
+    assert durations[[1, 2, 4]].tolist() == [4.0, 6.0, 3.0]
+
+
+def test_refresh_is_incremental_and_aggregates(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    layout_steps = len(packaging.get_plan("SKU-1").layout)
+    end = _pack("SKU-1", 1000.0, 5.0, worker_id="W1")
+
+    assert step_analytics.refresh() == layout_steps + 1
+    assert step_analytics.refresh() == 0
+
+    # Новая сессия в маленьких окнах: опорное событие берётся из прошлого окна.
+    _pack("SKU-1", end + 10, 15.0, worker_id="W2")
+    assert step_analytics.refresh(chunk_events=2) == layout_steps + 1
+
+    by_worker = step_analytics.aggregate(0, end + 10_000, group_by=("worker_id",))
+    assert [(r["worker_id"], r["mean_sec"]) for r in by_worker] == [("W2", 15.0), ("W1", 5.0)]
+
+    slowest = step_analytics.aggregate(
+        0, end + 10_000, group_by=("sku", "phase", "step_id"), limit=1
+    )
+    assert slowest[0]["count"] == 2
+    assert slowest[0]["max_sec"] == 15.0 and slowest[0]["p50_sec"] == 5.0
+
+    # Период фильтрует по времени завершения шага.
+    assert {r["worker_id"] for r in step_analytics.aggregate(0, end, group_by=("worker_id",))} == {"W1"}
@@ -0,0 +1,92 @@
+import json
+import threading
+
+import pytest
+
+from core import storage
+from services import packaging, step_verification
+from services.step_verification import step_verifier
+
+
+def _setup_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_step_verification.db"
+    monkeypatch.setattr(storage, "DB", db_path)
+    storage.DB.parent.mkdir(exist_ok=True)
+    storage.init_db()
+
+
+def _verified_events(session_id):
+    rows = storage.list_pack_events(session_id, limit=50)
+    return [
+        json.loads(row["payload_json"])
+        for row in rows
+        if row["type"] == packaging.EVENT_STEP_VERIFIED
+    ]
+
+
+def test_step_completes_before_verification_finishes(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    release = threading.Event()
+
+    def slow_verify(step, frame):
+        release.wait(5)
+        return "ok" if frame == "frame" else "fail"
+
+    monkeypatch.setattr(packaging, "verify_step", slow_verify)
+    session = packaging.start_session("SKU-1")
+    result = packaging.complete_current_step(frame="frame")
+    assert result["verify_result"] == step_verification.VERIFY_PENDING
+    assert _verified_events(session["session_id"]) == []
+
+    release.set()
+    assert step_verifier.wait_idle()
+    [verified] = _verified_events(session["session_id"])
+    assert verified["result"] == "ok" and not verified["failed"]
+    assert verified["step_id"] == result["step"]["step_id"]
+
+
+def test_timeout_is_failure_and_block_policy_stops_close_box(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    release = threading.Event()
+    monkeypatch.setattr(packaging, "verify_step", lambda step, frame: release.wait(5) and "ok")
+    monkeypatch.setattr(step_verifier, "timeout_sec", 0.05)
+    monkeypatch.setattr(step_verifier, "policy", step_verification.POLICY_BLOCK)
+
+    session = packaging.start_session("SKU-1")
+    packaging.complete_current_step(frame="frame")
+    assert step_verifier.wait_idle()
+    release.set()
+    [verified] = _verified_events(session["session_id"])
+    assert verified["result"] == step_verification.VERIFY_TIMEOUT and verified["failed"]
+
+    with pytest.raises(packaging.PackagingTransitionError):
+        packaging.apply_event(packaging.EVENT_CLOSE_BOX)
+    monkeypatch.setattr(step_verifier, "policy", step_verification.POLICY_WARN)
+    packaging.apply_event(packaging.EVENT_CLOSE_BOX)
+
+
+def test_block_policy_waits_for_pending_verification(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    release = threading.Event()
+    monkeypatch.setattr(packaging, "verify_step", lambda step, frame: release.wait(5) and "ok")
+    monkeypatch.setattr(step_verifier, "policy", step_verification.POLICY_BLOCK)
+
+    session = packaging.start_session("SKU-1")
+    packaging.complete_current_step(frame="frame")
+    assert step_verifier.pending_count(session["session_id"]) == 1
+    # Результата ещё нет — он может оказаться провалом.
+    with pytest.raises(packaging.PackagingTransitionError):
+        packaging.apply_event(packaging.EVENT_CLOSE_BOX)
+
+    release.set()
+    assert step_verifier.wait_idle()
+    assert step_verifier.pending_count(session["session_id"]) == 0
+    packaging.apply_event(packaging.EVENT_CLOSE_BOX)
+
+
+def test_without_frame_verification_stays_inline(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    session = packaging.start_session("SKU-1")
+    assert packaging.complete_current_step()["verify_result"] == "unknown"
+    assert step_verifier.pending_count() == 0
+    assert _verified_events(session["session_id"]) == []
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+import time
+
+import httpx
+from fastapi.testclient import TestClient
+
+from core import storage
+from core.storage_executor import storage_executor
+from service import kiosk_api
+
+
+def _setup_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_storage_executor.db"
+    monkeypatch.setattr(storage, "DB", db_path)
+    storage.DB.parent.mkdir(exist_ok=True)
+    storage.init_db()
+
+
+def test_slow_report_does_not_delay_state(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    storage.set_master_session(master_id="13540876", last_active_ts=int(time.time()))
+    report_started = threading.Event()
+    report_finished = []
+
+    def slow_report_rows(report_type, date_from, date_to):
+        report_started.set()
+        time.sleep(0.6)
+        report_finished.append(time.perf_counter())
+        return []
+
+    monkeypatch.setattr(kiosk_api, "get_report_rows", slow_report_rows)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=kiosk_api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://kiosk") as client:
+            report = asyncio.create_task(
+                client.get(
+                    "/api/kiosk/reports/preview",
+                    params={"type": "sku", "date_from": "2024-01-01", "date_to": "2024-01-02"},
+                )
+            )
+            while not report_started.is_set():
+                await asyncio.sleep(0.01)
+            state = await client.get("/api/kiosk/state")
+            state_done = time.perf_counter()
+            return state, state_done, await report
+
+    state, state_done, report = asyncio.run(scenario())
+    assert state.status_code == 200 and report.status_code == 200
+    # Отчёт ещё шёл (0,6 с), а /state уже ответил: цикл событий не стоял.
+    assert state_done < report_finished[0]
+
+
+def test_thread_connection_is_reused_and_released(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+
+    def open_and_leak():
+        conn = storage.get_conn()
+        conn.execute("INSERT INTO kiosk_settings(key, value) VALUES ('leaked', 1)")
+        # Соединение не закрыто, транзакция открыта — пул должен её откатить.
+        return id(conn)
+
+    async def scenario():
+        first = await storage_executor.run(open_and_leak)
+        await storage_executor.run(storage.set_kiosk_setting, "kept", 1)
+        return first, await storage_executor.run(storage.get_kiosk_settings, ["leaked", "kept"])
+
+    _, settings = asyncio.run(scenario())
+    assert settings == {"kept": 1}
+
+
+def test_lifespan_shuts_down_pool(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    with TestClient(kiosk_api.app) as client:
+        assert client.get("/api/kiosk/state").status_code == 200
+        pool_threads = [t for t in threading.enumerate() if t.name.startswith("storage")]
+        assert pool_threads
+    # Остановка API дождалась потоков пула.
+    assert not any(t.is_alive() for t in pool_threads)
+    # Следующий запуск приложения в том же процессе получает новый пул.
+    assert TestClient(kiosk_api.app).get("/api/kiosk/state").status_code == 200
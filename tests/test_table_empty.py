@@ -0,0 +1,59 @@
+import time
+
+import numpy as np
+
+from core import storage
+from services import packaging
+from services.table_empty import TableEmptyMonitor, changed_fraction, table_thumbnail
+
+
+def _setup_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_table_empty.db"
+    monkeypatch.setattr(storage, "DB", db_path)
+    storage.DB.parent.mkdir(exist_ok=True)
+    storage.init_db()
+
+
+def _table(with_box: bool = False, brightness: int = 120) -> np.ndarray:
+    frame = np.full((480, 640, 3), brightness, dtype=np.uint8)
+    if with_box:
+        frame[100:300, 200:450] = 30
+    return frame
+
+
+def test_thumbnail_is_small_gray_and_fast():
+    frame = np.random.default_rng(0).integers(0, 255, (1080, 1920, 3), dtype=np.uint8)
+    started = time.perf_counter()
+    thumb = table_thumbnail(frame, roi=(0.1, 0.1, 0.8, 0.8))
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    assert thumb.shape == (48, 64)
+    # Цель — единицы миллисекунд; с запасом на медленный CI.
+    assert elapsed_ms < 50
+
+
+def test_changed_fraction_ignores_global_brightness_shift():
+    empty = table_thumbnail(_table())
+    brighter = table_thumbnail(_table(brightness=160))
+    with_box = table_thumbnail(_table(with_box=True))
+    assert changed_fraction(brighter, empty) == 0.0
+    assert changed_fraction(with_box, empty) > 0.1
+
+
+def test_monitor_emits_table_empty_after_debounce(tmp_path, monkeypatch):
+    _setup_db(tmp_path, monkeypatch)
+    monitor = TableEmptyMonitor(debounce_sec=2.0)
+    monitor.capture_reference(table_thumbnail(_table()))
+
+    packaging.start_session("SKU-1")
+    # Пока коробка не закрыта, пустой стол не завершает упаковку.
+    assert monitor.update(table_thumbnail(_table()), now=0.0)["emitted"] is False
+    assert monitor.update(table_thumbnail(_table()), now=5.0)["emitted"] is False
+
+    packaging.apply_event(packaging.EVENT_CLOSE_BOX)
+    assert monitor.update(table_thumbnail(_table(with_box=True)), now=10.0)["clear"] is False
+    assert monitor.update(table_thumbnail(_table()), now=11.0)["emitted"] is False
+    assert monitor.update(table_thumbnail(_table()), now=13.5)["emitted"] is True
+    assert packaging.get_state()["state"] == packaging.STATE_TABLE_EMPTY
+
+    # Повторно то же событие не шлём.
+    assert monitor.update(table_thumbnail(_table()), now=20.0)["emitted"] is False
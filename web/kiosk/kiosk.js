@@ -8,6 +8,9 @@
   const API_REPORT_PREVIEW_URL = "/api/kiosk/reports/preview";
   const API_REPORT_EXPORT_URL = "/api/kiosk/reports/export";
   const API_REPORT_USB_URL = "/api/kiosk/reports/save_to_usb";
+  // Поиск SKU: пауза после ввода и размер страницы выдачи.
+  const SKU_SEARCH_DEBOUNCE_MS = 150;
+  const SKU_CATALOG_PAGE = 200;
 
   // UI-элементы мастера: кнопки, модалка, статус.
   const btnMasterLogin = document.getElementById("btnMasterLogin");
@@ -40,6 +43,8 @@
   const skuCatalogList = document.getElementById("skuCatalogList");
   const skuCatalogSearch = document.getElementById("skuCatalogSearch");
   const btnSkuAdd = document.getElementById("btnSkuAdd");
+  const btnSkuImport = document.getElementById("btnSkuImport");
+  const skuImportFile = document.getElementById("skuImportFile");
   const skuCatalogModalBackdrop = document.getElementById("skuCatalogModalBackdrop");
   const skuCatalogModalTitle = document.getElementById("skuCatalogModalTitle");
   const skuCatalogModalActions = document.getElementById("skuCatalogModalActions");
@@ -68,6 +73,9 @@
   let skuModalOpen = false;
   let skuModalMode = "create";
   let skuEditingId = null;
+  let skuCatalogSearchTimer = null;
+  let skuCatalogRequest = null;
+  let skuCatalogNextOffset = null;
 
   function setMasterUi(masterId) {
     /**
@@ -190,6 +198,7 @@
     if (skuCatalogList) {
       skuCatalogList.innerHTML = "";
     }
+    skuCatalogNextOffset = null;
   }
 
   function applySettingsToUi(settings) {
@@ -236,7 +245,7 @@
      * Важно: не кидаем исключения наружу, чтобы UI не ломался при сетевых сбоях.
      */
     try {
-      const resp = await fetch(API_SETTINGS_URL, { cache: "no-store" });
+      const resp = await fetch(API_SETTINGS_URL, { cache: "no-cache" });
       if (!resp.ok) {
         return;
       }
@@ -388,29 +397,81 @@
     return btn;
   }
 
-  async function fetchSkuCatalog() {
+  async function fetchSkuCatalog(append = false) {
     /**
      * Загружаем список SKU (для мастера).
      *
      * Мы включаем неактивные записи, чтобы можно было ими управлять.
+     * Список приходит страницами: append=true дописывает следующую
+     * страницу (next_offset из прошлого ответа) под уже показанными.
      */
     if (!currentMasterId) return;
+    if (append && skuCatalogNextOffset === null) return;
     const query = (skuCatalogSearch?.value || "").trim();
     const url = new URL(API_SKU_URL, window.location.origin);
     if (query) {
       url.searchParams.set("q", query);
     }
     url.searchParams.set("include_inactive", "true");
+    url.searchParams.set("limit", String(SKU_CATALOG_PAGE));
+    url.searchParams.set("offset", String(append ? skuCatalogNextOffset : 0));
+    // Ответ на устаревший запрос (пользователь уже напечатал дальше) не нужен.
+    if (skuCatalogRequest) {
+      skuCatalogRequest.abort();
+    }
+    const request = new AbortController();
+    skuCatalogRequest = request;
     try {
-      const resp = await fetch(url.toString(), { cache: "no-store" });
+      const resp = await fetch(url.toString(), { cache: "no-store", signal: request.signal });
       if (!resp.ok) return;
       const data = await resp.json();
-      renderSkuCatalog(data.items || []);
+      skuCatalogNextOffset = data.next_offset ?? null;
+      renderSkuCatalog(data.items || [], append);
     } catch (error) {
-      // Сетевые ошибки не блокируют UI, просто оставляем список как есть.
+      // Сетевые ошибки и отменённые запросы не блокируют UI, просто оставляем список как есть.
+    } finally {
+      if (skuCatalogRequest === request) {
+        skuCatalogRequest = null;
+      }
     }
   }
 
+  async function importSkuCatalogFile(file) {
+    /**
+     * Массовая загрузка каталога из выгрузки 1С.
+     *
+     * Backend пишет валидные строки и возвращает счётчики,
+     * здесь показываем итог и первые ошибки.
+     */
+    if (!file) return;
+    const formData = new FormData();
+    formData.append("file", file);
+    try {
+      const resp = await fetch("/api/kiosk/sku/import", { method: "POST", body: formData });
+      const data = await resp.json().catch(() => ({}));
+      if (!resp.ok) {
+        window.showPackToast?.(data.detail || "Каталог не импортирован.");
+        return;
+      }
+      const errors = (data.errors || []).slice(0, 3);
+      const errorText = errors.length
+        ? ` Ошибки: ${errors.map((e) => `стр. ${e.row} ${e.sku || "—"}: ${e.error}`).join("; ")}`
+        : "";
+      window.showPackToast?.(
+        `Каталог: добавлено ${data.inserted}, обновлено ${data.updated}, отклонено ${data.rejected}.${errorText}`
+      );
+      fetchSkuCatalog();
+    } catch (error) {
+      window.showPackToast?.("Ошибка сети: каталог не импортирован.");
+    }
+  }
+
+  function scheduleSkuCatalogSearch() {
+    // Поиск по мере ввода: запрос уходит после паузы, а не на каждую клавишу.
+    clearTimeout(skuCatalogSearchTimer);
+    skuCatalogSearchTimer = setTimeout(() => fetchSkuCatalog(), SKU_SEARCH_DEBOUNCE_MS);
+  }
+
   function getReportHeaders(type) {
     if (type === "employees") {
       return ["worker_id", "packed_count", "worktime_sec", "downtime_sec"];
@@ -557,10 +618,14 @@
     }
   }
 
-  function renderSkuCatalog(items) {
+  function renderSkuCatalog(items, append = false) {
     if (!skuCatalogList) return;
-    skuCatalogList.innerHTML = "";
-    if (!items.length) {
+    if (append) {
+      skuCatalogList.querySelector(".sku-catalog-more")?.remove();
+    } else {
+      skuCatalogList.innerHTML = "";
+    }
+    if (!items.length && !append) {
       const empty = document.createElement("div");
       empty.className = "settings-hint";
       empty.textContent = "Пока нет SKU. Добавьте первую запись.";
@@ -597,6 +662,14 @@
       row.appendChild(actions);
       skuCatalogList.appendChild(row);
     });
+    if (skuCatalogNextOffset !== null) {
+      // Каталог длиннее страницы: остальное — по кнопке, а не одним огромным ответом.
+      const moreBtn = document.createElement("div");
+      moreBtn.className = "pill-btn pill-btn--ghost pill-btn--mini sku-catalog-more";
+      moreBtn.innerHTML = "<span class=\"dot\"></span><span>Показать ещё</span>";
+      moreBtn.addEventListener("click", () => fetchSkuCatalog(true));
+      skuCatalogList.appendChild(moreBtn);
+    }
   }
 
   async function saveSkuModal() {
@@ -876,11 +949,19 @@
   }
 
   if (skuCatalogSearch) {
-    skuCatalogSearch.addEventListener("input", () => fetchSkuCatalog());
+    skuCatalogSearch.addEventListener("input", () => scheduleSkuCatalogSearch());
   }
   if (btnSkuAdd) {
     btnSkuAdd.addEventListener("click", () => openSkuModal("create"));
   }
+  if (btnSkuImport && skuImportFile) {
+    btnSkuImport.addEventListener("click", () => skuImportFile.click());
+    skuImportFile.addEventListener("change", () => {
+      const file = skuImportFile.files && skuImportFile.files[0];
+      importSkuCatalogFile(file);
+      skuImportFile.value = "";
+    });
+  }
   if (skuCatalogModalCancel) {
     skuCatalogModalCancel.addEventListener("click", () => closeSkuModal());
   }